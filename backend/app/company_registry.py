@@ -0,0 +1,283 @@
+"""
+Offline company registry index with INN validation
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+
+Index layout (directory):
+    records.jsonl   one JSON record per line
+    inn.u8          sorted INN keys (uint64)
+    inn_pos.u8      byte offsets of matching records
+    names.bin       sorted normalized name keys, "\\n"-separated
+    names_pos.u8    byte offsets of each key in names.bin
+    names_rec.u8    byte offsets of the record for each key
+
+Build with:
+    python -m app.company_registry build <dump.csv|dump.xml> <index_dir>
+"""
+import csv
+import json
+import logging
+import mmap
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_INN10_WEIGHTS = (2, 4, 10, 3, 5, 9, 4, 6, 8)
+_INN12_WEIGHTS_11 = (7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+_INN12_WEIGHTS_12 = (3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+
+FIELD_ALIASES = {
+    "inn": ("inn", "инн", "иннюл", "иннфл"),
+    "ogrn": ("ogrn", "огрн", "огрнип"),
+    "kpp": ("kpp", "кпп"),
+    "name": ("name", "short_name", "наименование", "наимсокр", "наиморг", "наимюлсокр", "название"),
+    "full_name": ("full_name", "полное_наименование", "наимполн", "наимюлполн"),
+    "address": ("address", "адрес", "адресюл"),
+    "okved": ("okved", "оквэд", "кодоквэд"),
+    "okved_name": ("okved_name", "наимоквэд"),
+    "status": ("status", "статус"),
+    "registration_date": ("registration_date", "датарег", "дата_регистрации", "датаогрн"),
+    "director": ("director", "руководитель"),
+    "tax_regime": ("tax_regime", "налоговый_режим"),
+}
+_ALIAS_LOOKUP = {alias: field for field, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+_LEGAL_FORMS_RE = re.compile(
+    r"\b(ооо|оао|зао|пао|ао|ип|нко|общество с ограниченной ответственностью|"
+    r"публичное акционерное общество|акционерное общество|индивидуальный предприниматель)\b",
+    re.IGNORECASE
+)
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_inn(value: str) -> str:
+    return re.sub(r"\D", "", value or "")
+
+
+def validate_inn(inn: str) -> bool:
+    """Check INN length and control digits (10 digits for organisations, 12 for individuals)"""
+    if not inn.isdigit():
+        return False
+    digits = [int(c) for c in inn]
+    if len(digits) == 10:
+        return sum(w * d for w, d in zip(_INN10_WEIGHTS, digits)) % 11 % 10 == digits[9]
+    if len(digits) == 12:
+        n11 = sum(w * d for w, d in zip(_INN12_WEIGHTS_11, digits)) % 11 % 10
+        n12 = sum(w * d for w, d in zip(_INN12_WEIGHTS_12, digits)) % 11 % 10
+        return n11 == digits[10] and n12 == digits[11]
+    return False
+
+
+def _inn_key(inn: str) -> int:
+    """Numeric key that keeps leading zeros and the INN length distinct"""
+    return int("1" + inn)
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip legal forms, quotes and punctuation"""
+    name = name.lower().replace("ё", "е")
+    name = _LEGAL_FORMS_RE.sub(" ", name)
+    name = _NON_WORD_RE.sub(" ", name)
+    return _SPACES_RE.sub(" ", name).strip()
+
+
+def _normalize_record(raw: Dict[str, str]) -> Optional[dict]:
+    record = {}
+    for key, value in raw.items():
+        field = _ALIAS_LOOKUP.get(key.strip().lower())
+        if field and value and field not in record:
+            record[field] = value.strip()
+    inn = normalize_inn(record.get("inn", ""))
+    if not validate_inn(inn):
+        return None
+    record["inn"] = inn
+    return record
+
+
+def _iter_csv(path: str) -> Iterator[Dict[str, str]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        yield from csv.DictReader(f, dialect=dialect)
+
+
+def _iter_xml(path: str, record_tag: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """Flatten attributes and leaf texts of each record element (e.g. FNS open data <Документ>)"""
+    tags = {record_tag} if record_tag else {"Документ", "record", "company", "СвЮЛ"}
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag not in tags:
+            continue
+        raw: Dict[str, str] = {}
+        for node in element.iter():
+            for key, value in node.attrib.items():
+                raw.setdefault(key, value)
+            if node is not element and node.text and node.text.strip() and not len(node):
+                raw.setdefault(node.tag, node.text)
+        yield raw
+        element.clear()
+
+
+def build_index(dump_path: str, index_dir: str, record_tag: Optional[str] = None) -> int:
+    """Import a CSV or XML registry dump into an on-disk index; returns record count"""
+    os.makedirs(index_dir, exist_ok=True)
+    rows = _iter_xml(dump_path, record_tag) if dump_path.lower().endswith(".xml") else _iter_csv(dump_path)
+
+    inn_keys: List[int] = []
+    inn_offsets: List[int] = []
+    name_entries: List[tuple] = []
+    offset = 0
+    with open(os.path.join(index_dir, "records.jsonl"), "wb") as out:
+        for raw in rows:
+            record = _normalize_record(raw)
+            if record is None:
+                continue
+            line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+            out.write(line)
+            inn_keys.append(_inn_key(record["inn"]))
+            inn_offsets.append(offset)
+            words = normalize_name(record.get("name") or record.get("full_name") or "").split()
+            for i in range(len(words)):
+                name_entries.append((" ".join(words[i:]), offset))
+            offset += len(line)
+
+    keys = np.array(inn_keys, dtype=np.uint64)
+    order = np.argsort(keys, kind="stable")
+    keys[order].tofile(os.path.join(index_dir, "inn.u8"))
+    np.array(inn_offsets, dtype=np.uint64)[order].tofile(os.path.join(index_dir, "inn_pos.u8"))
+
+    name_entries.sort()
+    positions = np.zeros(len(name_entries), dtype=np.uint64)
+    with open(os.path.join(index_dir, "names.bin"), "wb") as out:
+        position = 0
+        for i, (key, _) in enumerate(name_entries):
+            encoded = key.encode("utf-8") + b"\n"
+            positions[i] = position
+            out.write(encoded)
+            position += len(encoded)
+    positions.tofile(os.path.join(index_dir, "names_pos.u8"))
+    np.array([rec for _, rec in name_entries], dtype=np.uint64).tofile(
+        os.path.join(index_dir, "names_rec.u8")
+    )
+    logger.info(f"Company registry index built: {len(inn_keys)} records, {len(name_entries)} name keys")
+    return len(inn_keys)
+
+
+def _memmap(path: str) -> np.ndarray:
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    return np.memmap(path, dtype=np.uint64, mode="r")
+
+
+def _mmap_file(path: str) -> Optional[mmap.mmap]:
+    if os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class CompanyRegistry:
+    """Memory-mapped registry lookups by INN and by name prefix"""
+
+    def __init__(self, index_dir: Optional[str] = None):
+        self.index_dir = index_dir
+        self._loaded = False
+        self._available = False
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _load(self):
+        self._loaded = True
+        if not self.index_dir or not os.path.exists(self._path("inn.u8")):
+            logger.info("Company registry index not configured, registry lookups disabled")
+            return
+        self._records = _mmap_file(self._path("records.jsonl"))
+        self._inn = _memmap(self._path("inn.u8"))
+        self._inn_pos = _memmap(self._path("inn_pos.u8"))
+        self._names = _mmap_file(self._path("names.bin"))
+        self._names_pos = _memmap(self._path("names_pos.u8"))
+        self._names_rec = _memmap(self._path("names_rec.u8"))
+        self._available = True
+        logger.info(f"Company registry loaded: {len(self._inn)} records")
+
+    @property
+    def available(self) -> bool:
+        if not self._loaded:
+            self._load()
+        return self._available
+
+    def _record_at(self, offset: int) -> dict:
+        end = self._records.find(b"\n", offset)
+        return json.loads(self._records[offset:end])
+
+    def lookup_inn(self, inn: str) -> Optional[dict]:
+        """Binary search for an exact INN"""
+        if not self.available or not validate_inn(inn):
+            return None
+        key = np.uint64(_inn_key(inn))
+        i = int(np.searchsorted(self._inn, key))
+        if i < len(self._inn) and self._inn[i] == key:
+            return self._record_at(int(self._inn_pos[i]))
+        return None
+
+    def _name_key(self, i: int) -> bytes:
+        start = int(self._names_pos[i])
+        return self._names[start:self._names.find(b"\n", start)]
+
+    def search_name(self, query: str, limit: int = 5) -> List[dict]:
+        """Records whose name (or any word-suffix of it) starts with the query"""
+        prefix = normalize_name(query).encode("utf-8")
+        if not self.available or not prefix:
+            return []
+        lo, hi = 0, len(self._names_pos)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name_key(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        results: List[dict] = []
+        seen = set()
+        i = lo
+        while i < len(self._names_pos) and len(results) < limit and self._name_key(i).startswith(prefix):
+            offset = int(self._names_rec[i])
+            if offset not in seen:
+                seen.add(offset)
+                results.append(self._record_at(offset))
+            i += 1
+        return results
+
+    def find(self, inn: Optional[str] = None, name: Optional[str] = None) -> Optional[dict]:
+        """Exact INN match, or a name match that is unambiguous"""
+        if inn:
+            return self.lookup_inn(inn)
+        if name:
+            candidates = self.search_name(name, limit=5)
+            normalized = normalize_name(name)
+            exact = [c for c in candidates if normalize_name(c.get("name", "")) == normalized]
+            if len(exact) == 1:
+                return exact[0]
+            if len(candidates) == 1:
+                return candidates[0]
+        return None
+
+
+company_registry = CompanyRegistry(settings.COMPANY_REGISTRY_PATH)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 5) or sys.argv[1] != "build":
+        print("Usage: python -m app.company_registry build <dump.csv|dump.xml> <index_dir> [record_tag]")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    count = build_index(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) == 5 else None)
+    print(f"Indexed {count} records into {sys.argv[3]}")
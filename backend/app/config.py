@@ -5,7 +5,7 @@ VK: https://vk.com/iamartempn
 """
 from pydantic_settings import BaseSettings
 from pydantic import field_validator
-from typing import Union
+from typing import Optional, Union
 
 
 class Settings(BaseSettings):
@@ -15,10 +15,61 @@ class Settings(BaseSettings):
     LLM_MODEL: str = "llama3"
     LLM_BASE_URL: str = "http://llm:11434"
     LLM_TIMEOUT: int = 180
+    LLM_MAX_CONCURRENCY: int = 2
+    
+    # Per use case / mode model, e.g. {"summary": "llama3.2:3b", "legal-contract": "llama3.1:8b"}
+    MODEL_ROUTES: dict[str, str] = {}
+    LLM_LARGE_MODEL: Optional[str] = None
+    ROUTE_LONG_PROMPT_CHARS: int = 8000
+    LLM_CASCADE_MODES: list[str] = []
+    
+    # Per-mode overrides of num_predict / temperature / stop, e.g. {"legal": {"num_predict": 3000}}
+    GENERATION_PROFILES: dict[str, dict] = {}
+    PROFILE_DEGRADE_QUEUE_DEPTH: int = 4
+    # Context size shared by all modes: Ollama reloads the model whenever num_ctx changes
+    LLM_NUM_CTX: int = 8192
+    
+    REQUEST_DEADLINE_HEADER: str = "X-Request-Timeout"
+    REQUEST_DEADLINE_DEFAULT: float = 180
+    REQUEST_DEADLINE_MAX: float = 600
+    ROUTE_DEADLINES: dict[str, float] = {
+        "chat": 180,
+        "legal-contract": 300,
+        "marketing-post": 120,
+        "finance-report": 180,
+        "summary": 120,
+        "company-card": 120,
+        "tax-consultation": 180,
+    }
+
+    TAX_EXPLAIN_CALCULATIONS: bool = False
+    COMPANY_REGISTRY_PATH: Optional[str] = None
+    
+    TRACE_SAMPLE_RATE: float = 1.0
+    TRACE_EXPORT_PATH: Optional[str] = None
+    TRACE_BUFFER_SIZE: int = 200
+    
+    # Sampled, anonymized LLM traffic for `python -m app.replay`; off unless a path is set
+    CAPTURE_PATH: Optional[str] = None
+    CAPTURE_SAMPLE_RATE: float = 0.1
     
     DATABASE_URL: str = "sqlite:///./copilot.db"
     SAVE_HISTORY: bool = True
     
+    CHAT_CACHE_SIZE: int = 256
+    CHAT_CACHE_IDLE_SECONDS: float = 1800
+    CHAT_JOURNAL_PATH: Optional[str] = "./chat_journal.ndjson"
+    CHAT_WRITE_BEHIND_INTERVAL: float = 0.2
+    CHAT_WRITE_BEHIND_BATCH: int = 500
+    # Send only the new turn plus Ollama's context from the previous answer
+    CHAT_REUSE_CONTEXT: bool = False
+    
+    # /ws/chat: server ping interval (a silent client is dropped after two), per-connection send buffer
+    WS_HEARTBEAT_SECONDS: float = 20
+    WS_SEND_BUFFER: int = 256
+    WS_SEND_TIMEOUT: float = 10
+    WS_MAX_ACTIVE_TURNS: int = 4
+    
     APP_NAME: str = "AI Copilot for Small Business"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = False
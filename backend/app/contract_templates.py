@@ -0,0 +1,298 @@
+"""
+Contract skeletons rendered from templates; only variable clauses come from the LLM
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import asyncio
+import re
+from typing import Dict, List, NamedTuple, Optional, Pattern, Tuple
+from fastapi import HTTPException
+from app.deadline import Deadline
+from app.llm_client import LLMError, llm_client
+from app.schemas import LegalContractRequest
+
+# Clause answers are a handful of numbered points, far below the legal profile budget
+CLAUSE_NUM_PREDICT = 450
+
+DRAFT_WARNING = (
+    "⚠️ Настоящий документ является черновиком. Перед подписанием "
+    "обязательно обратитесь к квалифицированному юристу."
+)
+
+
+class ContractTemplate(NamedTuple):
+    """Fixed wording of one contract type; {first}/{second} are the party roles"""
+    title: str
+    roles: Tuple[str, str]
+    payment: str
+    term: str
+    hints: Dict[str, str]
+
+
+TEMPLATES: Dict[str, ContractTemplate] = {
+    "rental": ContractTemplate(
+        title="ДОГОВОР АРЕНДЫ",
+        roles=("Арендодатель", "Арендатор"),
+        payment=(
+            "{number}.1. Размер арендной платы составляет {amount}.\n"
+            "{number}.2. Арендная плата вносится {second} ежемесячно не позднее 10 (десятого) числа "
+            "текущего месяца путём перечисления на расчётный счёт {first_gen}.\n"
+            "{number}.3. Коммунальные и эксплуатационные платежи в арендную плату не входят, "
+            "если иное не согласовано Сторонами письменно."
+        ),
+        term=(
+            "{number}.1. Договор вступает в силу с момента подписания и действует до «___» ________ 20__ г.\n"
+            "{number}.2. Если ни одна из Сторон не заявит о его прекращении за 30 (тридцать) дней "
+            "до окончания срока, Договор считается продлённым на тот же срок на тех же условиях."
+        ),
+        hints={
+            "subject": "что передаётся во временное владение и пользование, назначение использования, состояние имущества",
+            "obligations": "передача и возврат имущества, содержание и текущий ремонт, доступ для осмотра, запрет субаренды без согласия",
+            "liability": "неустойка за просрочку арендной платы, возмещение ущерба имуществу, последствия нецелевого использования",
+        },
+    ),
+    "service": ContractTemplate(
+        title="ДОГОВОР ВОЗМЕЗДНОГО ОКАЗАНИЯ УСЛУГ",
+        roles=("Исполнитель", "Заказчик"),
+        payment=(
+            "{number}.1. Стоимость услуг составляет {amount}.\n"
+            "{number}.2. Оплата производится {second} в течение 5 (пяти) рабочих дней с даты "
+            "подписания Сторонами акта об оказании услуг.\n"
+            "{number}.3. Обязательство по оплате считается исполненным с момента зачисления "
+            "денежных средств на расчётный счёт {first_gen}."
+        ),
+        term=(
+            "{number}.1. Договор вступает в силу с момента подписания и действует до полного исполнения "
+            "Сторонами своих обязательств.\n"
+            "{number}.2. Услуги оказываются в срок до «___» ________ 20__ г."
+        ),
+        hints={
+            "subject": "перечень и объём услуг, место оказания, требования к результату",
+            "obligations": "сроки и качество оказания, предоставление информации и материалов заказчиком, приёмка по акту",
+            "liability": "неустойка за просрочку оказания услуг и оплаты, устранение недостатков, ограничение ответственности",
+        },
+    ),
+    "supply": ContractTemplate(
+        title="ДОГОВОР ПОСТАВКИ",
+        roles=("Поставщик", "Покупатель"),
+        payment=(
+            "{number}.1. Общая стоимость товара составляет {amount}.\n"
+            "{number}.2. Оплата производится {second} в течение 5 (пяти) банковских дней с даты "
+            "поставки на основании счёта и товарной накладной.\n"
+            "{number}.3. Цена товара включает стоимость упаковки, маркировки и доставки, если иное "
+            "не указано в спецификации."
+        ),
+        term=(
+            "{number}.1. Договор вступает в силу с момента подписания и действует до «___» ________ 20__ г., "
+            "а в части расчётов — до полного их завершения.\n"
+            "{number}.2. Сроки поставки отдельных партий согласуются в спецификациях."
+        ),
+        hints={
+            "subject": "наименование, количество и качество товара, спецификации, место и способ поставки",
+            "obligations": "поставка в срок и приёмка по количеству и качеству, переход права собственности и рисков, замена некачественного товара",
+            "liability": "неустойка за просрочку поставки и оплаты, недопоставка, ответственность за качество товара",
+        },
+    ),
+    "contracting": ContractTemplate(
+        title="ДОГОВОР ПОДРЯДА",
+        roles=("Подрядчик", "Заказчик"),
+        payment=(
+            "{number}.1. Цена работ составляет {amount}.\n"
+            "{number}.2. {second_cap} перечисляет аванс в размере 30% цены работ в течение 5 (пяти) "
+            "рабочих дней с даты подписания Договора, оставшуюся часть — в течение 5 (пяти) рабочих "
+            "дней с даты подписания акта сдачи-приёмки работ.\n"
+            "{number}.3. Цена работ может быть изменена только по письменному соглашению Сторон."
+        ),
+        term=(
+            "{number}.1. Работы выполняются в период с «___» ________ 20__ г. по «___» ________ 20__ г.\n"
+            "{number}.2. Договор вступает в силу с момента подписания и действует до полного исполнения "
+            "Сторонами своих обязательств."
+        ),
+        hints={
+            "subject": "вид и объём работ, место выполнения, техническое задание, результат работ",
+            "obligations": "выполнение работ своими силами и материалами, контроль заказчика, сдача-приёмка по акту, гарантийный срок",
+            "liability": "неустойка за нарушение сроков работ и оплаты, устранение недостатков, риск случайной гибели результата",
+        },
+    ),
+}
+
+CONTRACT_ALIASES = {
+    "rental": "rental", "rent": "rental", "lease": "rental", "аренда": "rental", "аренды": "rental",
+    "service": "service", "services": "service", "услуги": "service", "услуг": "service",
+    "supply": "supply", "поставка": "supply", "поставки": "supply",
+    "contracting": "contracting", "contract work": "contracting", "подряд": "contracting", "подряда": "contracting",
+}
+# Whole words (Russian stems) inside longer names such as "Договор аренды офиса"
+TEMPLATE_WORDS = tuple((re.compile(pattern, re.IGNORECASE), name) for pattern, name in (
+    (r"\bаренд\w*|\b(?:rent|rental|lease)\b", "rental"),
+    (r"\bуслуг\w*|\bservices?\b", "service"),
+    (r"\bпоставк\w*|\bsupply\b", "supply"),
+    (r"\bподряд\w*|\bcontracting\b|\bcontract work\b", "contracting"),
+))
+
+# (clause, section title, section number); the remaining sections are fixed text
+CLAUSES = (
+    ("subject", "ПРЕДМЕТ ДОГОВОРА", 1),
+    ("obligations", "ПРАВА И ОБЯЗАННОСТИ СТОРОН", 2),
+    ("liability", "ОТВЕТСТВЕННОСТЬ СТОРОН", 5),
+)
+
+GENITIVE = {
+    "Арендодатель": "Арендодателя", "Арендатор": "Арендатора",
+    "Исполнитель": "Исполнителя", "Заказчик": "Заказчика",
+    "Поставщик": "Поставщика", "Покупатель": "Покупателя",
+    "Подрядчик": "Подрядчика",
+}
+INSTRUMENTAL = {
+    "Арендодатель": "Арендодателем", "Арендатор": "Арендатором",
+    "Исполнитель": "Исполнителем", "Заказчик": "Заказчиком",
+    "Поставщик": "Поставщиком", "Покупатель": "Покупателем",
+    "Подрядчик": "Подрядчиком",
+}
+
+_PARTY_SEPARATORS = re.compile(r"\s+и\s+|;|\n")
+_COMMA = re.compile(",")
+_QUOTED = re.compile(r"«[^»]*»|\"[^\"]*\"|“[^”]*”")
+_LEADING_NUMBER = re.compile(r"^\s*(?:(?:\d+\.)+\d*|\d+\))\s*")
+
+
+def find_template(contract_type: str) -> Optional[str]:
+    """Template key for a contract type given in English or Russian, or None"""
+    key = contract_type.strip().lower()
+    if key in CONTRACT_ALIASES:
+        return CONTRACT_ALIASES[key]
+    for pattern, name in TEMPLATE_WORDS:
+        if pattern.search(key):
+            return name
+    return None
+
+
+def _split_outside_quotes(text: str, separator: Pattern) -> List[str]:
+    """Split on separator matches that are not inside «…» or "…" """
+    quoted = [match.span() for match in _QUOTED.finditer(text)]
+    parts, start = [], 0
+    for match in separator.finditer(text):
+        if any(begin <= match.start() < end for begin, end in quoted):
+            continue
+        parts.append(text[start:match.start()])
+        start = match.end()
+    parts.append(text[start:])
+    return [p.strip(" ,") for p in parts if p.strip(" ,")]
+
+
+def split_parties(parties: str) -> Tuple[str, str]:
+    """First and second party from free text like "ООО «Ромашка» и ИП Иванов И.И." """
+    names = _split_outside_quotes(parties, _PARTY_SEPARATORS)
+    if len(names) < 2:
+        # "ООО «Иван и партнеры», ИП Петров"; a comma is only a separator when nothing else is
+        names = _split_outside_quotes(parties, _COMMA)
+    if len(names) >= 2:
+        return names[0], names[1]
+    return (names[0] if names else "_______________"), "_______________"
+
+
+def clause_prompt(
+    request: LegalContractRequest,
+    template: ContractTemplate,
+    clause: str,
+    title: str,
+    number: int
+) -> str:
+    first, second = template.roles
+    return f"""Составь текст раздела «{number}. {title}» для документа «{template.title}».
+
+Стороны: {request.parties} («{first}» и «{second}»)
+Предмет договора: {request.subject}
+{f'Сумма/цена: {request.amount}' if request.amount else ''}
+{f'Дополнительная информация: {request.additional_info}' if request.additional_info else ''}
+
+Раздел должен охватывать: {template.hints[clause]}.
+
+Выведи только пункты раздела, по одному на строке, с нумерацией {number}.1, {number}.2 и т.д.
+Без заголовка раздела, вступления, пояснений и предупреждений. Стороны называй «{first}» и «{second}»."""
+
+
+def _clean_clause(text: str, number: int, title: str) -> str:
+    """Keep numbered points only, renumbered under the section number"""
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    points = []
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        body = _LEADING_NUMBER.sub("", line).lstrip("-•* ").strip()
+        if body.strip("*:. ").upper() == title:
+            continue  # echoed section title
+        if body:
+            points.append(body)
+    return "\n".join(f"{number}.{i}. {body}" for i, body in enumerate(points, 1))
+
+
+async def generate_clauses(
+    request: LegalContractRequest,
+    template: ContractTemplate,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, str]:
+    """Generate all variable clauses concurrently"""
+    async def one(clause: str, title: str, number: int) -> str:
+        try:
+            text = await llm_client.generate_response(
+                system_prompt=llm_client._get_system_prompt("legal"),
+                messages=[{"role": "user", "content": clause_prompt(request, template, clause, title, number)}],
+                mode="legal",
+                deadline=deadline,
+                options={"num_predict": CLAUSE_NUM_PREDICT},
+                raise_on_error=True
+            )
+        except LLMError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return _clean_clause(text, number, title)
+    
+    tasks = [asyncio.create_task(one(*spec)) for spec in CLAUSES]
+    try:
+        texts = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return {clause: text for (clause, _, _), text in zip(CLAUSES, texts)}
+
+
+def render_contract(request: LegalContractRequest, template: ContractTemplate, clauses: Dict[str, str]) -> str:
+    """Assemble the contract from fixed template text and generated clauses"""
+    first, second = template.roles
+    first_party, second_party = split_parties(request.parties)
+    roles = {
+        "first": first,
+        "second": INSTRUMENTAL.get(second, second),
+        "second_cap": second,
+        "first_gen": GENITIVE.get(first, first),
+        "amount": request.amount or "сумме, указанной в счёте или спецификации к Договору",
+    }
+    sections: List[str] = [
+        template.title + " № ____",
+        "г. ______________" + " " * 30 + "«___» ____________ 20__ г.",
+        f"{first_party}, именуемый(ая) в дальнейшем «{first}», с одной стороны, и {second_party}, "
+        f"именуемый(ая) в дальнейшем «{second}», с другой стороны, совместно именуемые «Стороны», "
+        "заключили настоящий Договор о нижеследующем:",
+        f"1. ПРЕДМЕТ ДОГОВОРА\n{clauses['subject']}",
+        f"2. ПРАВА И ОБЯЗАННОСТИ СТОРОН\n{clauses['obligations']}",
+        "3. ЦЕНА И ПОРЯДОК РАСЧЁТОВ\n" + template.payment.format(number=3, **roles),
+        "4. СРОК ДЕЙСТВИЯ ДОГОВОРА\n" + template.term.format(number=4, **roles),
+        f"5. ОТВЕТСТВЕННОСТЬ СТОРОН\n{clauses['liability']}",
+        "6. ПРОЧИЕ УСЛОВИЯ\n"
+        "6.1. Стороны освобождаются от ответственности за неисполнение обязательств, вызванное "
+        "обстоятельствами непреодолимой силы, при условии письменного уведомления другой Стороны "
+        "в течение 5 (пяти) рабочих дней с момента их наступления.\n"
+        "6.2. Споры разрешаются путём переговоров, а при недостижении согласия — в суде по месту "
+        "нахождения ответчика. Срок ответа на претензию — 10 (десять) рабочих дней.\n"
+        "6.3. Изменения и дополнения к Договору действительны, если они совершены в письменной форме "
+        "и подписаны обеими Сторонами.\n"
+        "6.4. Договор составлен в двух экземплярах, имеющих одинаковую юридическую силу, по одному "
+        "для каждой из Сторон.",
+        "7. РЕКВИЗИТЫ И ПОДПИСИ СТОРОН\n"
+        f"{first}: {first_party}\nИНН/ОГРН: ______________\nАдрес: ______________\n"
+        "Р/с: ______________\nПодпись: ____________ / ____________ /\n\n"
+        f"{second}: {second_party}\nИНН/ОГРН: ______________\nАдрес: ______________\n"
+        "Р/с: ______________\nПодпись: ____________ / ____________ /",
+        DRAFT_WARNING,
+    ]
+    return "\n\n".join(sections)
@@ -0,0 +1,360 @@
+"""
+In-memory cache of active conversations with write-behind persistence
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+
+New messages are appended to a journal file (fsync'd) before the request
+returns, then inserted into the database in batches by a background task.
+On startup any journal left by a crash is replayed. Message ids are
+allocated in-process, which assumes a single backend process (as do the
+LLM concurrency limits).
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.db import SessionLocal, engine
+from app.models import Conversation, Message
+from app.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+MESSAGE_COLUMNS = [column.name for column in Message.__table__.columns]
+
+
+class CachedConversation:
+    """Message list and token count of one conversation"""
+    __slots__ = ("id", "messages", "tokens", "last_access", "llm_state")
+
+    def __init__(self, conversation_id: int, messages: List[dict]):
+        self.id = conversation_id
+        self.messages: List[dict] = []
+        self.tokens = 0
+        self.last_access = time.monotonic()
+        # Model-side continuation state (CHAT_REUSE_CONTEXT); memory only, rebuilt after eviction
+        self.llm_state = None
+        for message in messages:
+            self.add(message)
+
+    def add(self, message: dict):
+        self.messages.append(message)
+        self.tokens += message.get("completion_tokens") or len(message["content"]) // CHARS_PER_TOKEN + 1
+
+    def llm_messages(self) -> List[Dict[str, str]]:
+        return [{"role": m["role"], "content": m["content"]} for m in self.messages]
+
+
+def _to_json(message: dict) -> str:
+    return json.dumps(
+        {k: v.isoformat() if isinstance(v, datetime) else v for k, v in message.items()},
+        ensure_ascii=False
+    )
+
+
+def _from_json(line: str) -> dict:
+    message = json.loads(line)
+    message["created_at"] = datetime.fromisoformat(message["created_at"])
+    return message
+
+
+def _worker_count() -> int:
+    """Workers requested with uvicorn --workers (spawned workers inherit argv) or WEB_CONCURRENCY"""
+    for i, arg in enumerate(sys.argv):
+        if arg == "--workers" and i + 1 < len(sys.argv):
+            return int(sys.argv[i + 1])
+        if arg.startswith("--workers="):
+            return int(arg.split("=", 1)[1])
+    return int(os.environ.get("WEB_CONCURRENCY") or 1)
+
+
+class ConversationCache:
+    """LRU of active conversations; reads fall back to the database on a miss"""
+
+    def __init__(self, max_size: int, idle_seconds: float, journal_path: Optional[str], interval: float):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.journal_path = journal_path
+        self.interval = interval
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, CachedConversation]" = OrderedDict()
+        self._pending: List[dict] = []
+        self._journal = None
+        self._next_id: Optional[int] = None
+        self._retired: List[str] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    # --- lifecycle -------------------------------------------------------
+
+    def start(self):
+        """Replay a leftover journal and start the background writer"""
+        workers = _worker_count()
+        if workers > 1:
+            raise RuntimeError(
+                f"{workers} workers configured: the conversation cache allocates message ids "
+                f"in-process and needs a single worker"
+            )
+        self._replay_journal()
+        self._resync_ids()
+        if self.journal_path:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer and persist everything still pending"""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            await self.flush()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, will retry: {e}")
+            self._evict_idle()
+
+    # --- reads -----------------------------------------------------------
+
+    def get(self, conversation_id: int, db: Session) -> Optional[CachedConversation]:
+        """Cached conversation, or load it from the database; None if it does not exist"""
+        entry = self._entries.get(conversation_id)
+        if entry is not None:
+            self.hits += 1
+            self._touch(entry)
+            return entry
+        self.misses += 1
+        with tracer.span("chat.history_load") as span:
+            if db.get(Conversation, conversation_id) is None:
+                return None
+            rows = db.execute(
+                select(Message.__table__)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.created_at, Message.id)
+            ).mappings().all()
+            messages = [dict(row) for row in rows]
+            # Messages not yet written behind are not in the database
+            messages += [m for m in self._pending if m["conversation_id"] == conversation_id]
+            span.set(messages=len(messages))
+        return self._put(CachedConversation(conversation_id, messages))
+
+    def create(self, conversation_id: int) -> CachedConversation:
+        """Register a conversation that was just created"""
+        return self._put(CachedConversation(conversation_id, []))
+
+    def _put(self, entry: CachedConversation) -> CachedConversation:
+        self._entries[entry.id] = entry
+        self._entries.move_to_end(entry.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def _touch(self, entry: CachedConversation):
+        entry.last_access = time.monotonic()
+        self._entries.move_to_end(entry.id)
+
+    def _attach(self, entry: CachedConversation, message: dict):
+        """Add a message to the entry, which may have been evicted or reloaded meanwhile"""
+        entry.add(message)
+        current = self._entries.get(entry.id)
+        if current is None:
+            current = self._put(entry)
+        elif current is not entry:
+            current.add(message)
+        self._touch(current)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if oldest.last_access >= cutoff:
+                break
+            self._entries.popitem(last=False)
+
+    # --- writes ----------------------------------------------------------
+
+    def append(self, entry: CachedConversation, **fields) -> dict:
+        """Add a message to the conversation; durable once this returns
+        
+        Without a running writer (cache not started) the message is written through.
+        """
+        if self._next_id is None:
+            self._resync_ids()
+        message = {column: None for column in MESSAGE_COLUMNS}
+        message.update(fields, id=self._next_id, conversation_id=entry.id)
+        message["created_at"] = message["created_at"] or datetime.utcnow()
+        self._next_id += 1
+        self._attach(entry, message)
+        if self._worker is None:
+            try:
+                self._insert([message])
+            except IntegrityError:
+                self._reassign_ids([message])
+                self._insert([message])
+            return message
+        if self._journal:
+            self._journal.write(_to_json(message) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self._pending.append(message)
+        if len(self._pending) >= settings.CHAT_WRITE_BEHIND_BATCH:
+            self._wakeup.set()
+        return message
+
+    def reserve_ids(self, count: int) -> int:
+        """Take `count` consecutive message ids for a bulk writer; returns the id before the first
+        
+        Allocation happens on the event loop like append(), so the range cannot
+        overlap ids handed out to chat turns.
+        """
+        self._resync_ids()
+        offset = self._next_id - 1
+        self._next_id += count
+        return offset
+
+    async def flush(self):
+        """Insert pending messages in one transaction and retire their journal"""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            await self._flush_pending()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        """Flush, then keep the write-behind writer off the database until the block exits"""
+        if self._flush_lock is None:
+            yield
+            return
+        async with self._flush_lock:
+            await self._flush_pending()
+            yield
+
+    async def _flush_pending(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._rotate_journal()
+        try:
+            try:
+                await run_in_threadpool(self._insert, batch)
+            except IntegrityError:
+                # Ids are reassigned here on the event loop, where append() allocates them
+                self._reassign_ids(batch)
+                await run_in_threadpool(self._insert, batch)
+        except Exception:
+            # Keep order: failed batch goes back in front of newer messages
+            self._pending = batch + self._pending
+            raise
+        for path in self._retired:
+            os.remove(path)
+        self._retired = []
+
+    def _rotate_journal(self):
+        """Move the current journal aside so new appends go to a fresh file"""
+        if not self._journal:
+            return
+        self._journal.close()
+        flushing = f"{self.journal_path}.{time.time_ns()}.flushing"
+        os.replace(self.journal_path, flushing)
+        self._retired.append(flushing)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _insert(self, batch: List[dict]):
+        """Runs in the threadpool; must not touch id allocation"""
+        with tracer.span("chat.write_behind", messages=len(batch)):
+            with engine.begin() as conn:
+                conn.execute(insert(Message.__table__), batch)
+
+    def _reassign_ids(self, batch: List[dict]):
+        """Ids taken by another writer (e.g. a bulk import): allocate fresh ones"""
+        logger.warning("Message id conflict during write-behind, reassigning ids")
+        self._resync_ids()
+        for message in batch:
+            message["id"] = self._next_id
+            self._next_id += 1
+
+    def _resync_ids(self):
+        with SessionLocal() as db:
+            db_max = db.execute(select(func.coalesce(func.max(Message.id), 0))).scalar()
+        pending_max = max((m["id"] for m in self._pending), default=0)
+        self._next_id = max(self._next_id or 0, db_max, pending_max) + 1
+
+    def _replay_journal(self):
+        """Write messages left in journals by an unclean shutdown"""
+        if not self.journal_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        base = os.path.basename(self.journal_path)
+        paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name == base or (name.startswith(base + ".") and name.endswith(".flushing"))
+        )
+        messages: Dict[int, dict] = {}
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            message = _from_json(line)
+                        except (ValueError, KeyError):
+                            logger.warning(f"Skipping torn journal line in {path}")
+                            continue
+                        messages[message["id"]] = message
+        if messages:
+            with engine.begin() as conn:
+                existing = set(conn.execute(
+                    select(Message.id).where(Message.id.in_(list(messages)))
+                ).scalars())
+                missing = [m for i, m in messages.items() if i not in existing]
+                if missing:
+                    conn.execute(insert(Message.__table__), missing)
+            logger.info(f"Replayed {len(missing)} messages from the chat journal")
+        for path in paths:
+            os.remove(path)
+
+    def snapshot(self) -> dict:
+        return {
+            "conversations": len(self._entries),
+            "pending_writes": len(self._pending),
+            "hits": self.hits,
+            "misses": self.misses,
+            "tokens": sum(entry.tokens for entry in self._entries.values()),
+            "with_llm_context": sum(entry.llm_state is not None for entry in self._entries.values()),
+        }
+
+
+conversation_cache = ConversationCache(
+    settings.CHAT_CACHE_SIZE,
+    settings.CHAT_CACHE_IDLE_SECONDS,
+    settings.CHAT_JOURNAL_PATH,
+    settings.CHAT_WRITE_BEHIND_INTERVAL
+)
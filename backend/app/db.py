@@ -3,16 +3,20 @@ Database connection and session management
 Author: Погосян Артем Артурович (Pogosian Artem)
 VK: https://vk.com/iamartempn
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.tracing import instrument_engine
+from app.search import init_search
 
 engine = create_engine(
     settings.DATABASE_URL,
     connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
 )
 
+instrument_engine(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -29,5 +33,20 @@ def get_db():
 
 def init_db():
     """Initialize database tables"""
+    from app import models  # noqa: F401  (registers tables on Base.metadata)
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    init_search(engine)
+
+
+def _add_missing_columns():
+    """Add nullable columns introduced after a table was created (no migrations tool)"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
 
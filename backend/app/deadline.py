@@ -0,0 +1,88 @@
+"""
+Per-request deadlines and generation time budgeting
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import time
+from typing import Dict, Mapping, Optional
+from fastapi import HTTPException
+from app.config import settings
+
+
+class DeadlineExceeded(HTTPException):
+    """Raised when a request can no longer finish within its deadline"""
+
+    def __init__(self, detail: str = "Request deadline exceeded"):
+        super().__init__(status_code=504, detail=detail)
+
+
+class Deadline:
+    """Absolute deadline carried through all phases of a request"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str], default: float) -> "Deadline":
+        """Build deadline from request header or fall back to route default"""
+        timeout = default
+        raw = headers.get(settings.REQUEST_DEADLINE_HEADER)
+        if raw:
+            try:
+                timeout = float(raw)
+            except ValueError:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid {settings.REQUEST_DEADLINE_HEADER} header: {raw}"
+                )
+            if timeout <= 0:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{settings.REQUEST_DEADLINE_HEADER} must be positive"
+                )
+        return cls(min(timeout, settings.REQUEST_DEADLINE_MAX))
+
+    def remaining(self) -> float:
+        """Seconds left until the deadline"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, phase: str):
+        """Raise DeadlineExceeded if the deadline has passed"""
+        if self.expired:
+            raise DeadlineExceeded(f"Request deadline exceeded during {phase}")
+
+
+class GenerationTimeEstimator:
+    """Exponentially weighted generation time per mode"""
+
+    def __init__(self, alpha: float = 0.2, min_samples: int = 3):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self._estimates: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+
+    def record(self, mode: str, seconds: float):
+        """Add an observed generation time for a mode"""
+        previous = self._estimates.get(mode)
+        if previous is None:
+            self._estimates[mode] = seconds
+        else:
+            self._estimates[mode] = previous + self.alpha * (seconds - previous)
+        self._samples[mode] = self._samples.get(mode, 0) + 1
+
+    def expected(self, mode: str) -> Optional[float]:
+        """Expected generation time, or None until enough samples are observed"""
+        if self._samples.get(mode, 0) < self.min_samples:
+            return None
+        return self._estimates[mode]
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            mode: {"expected_seconds": round(value, 3), "samples": self._samples[mode]}
+            for mode, value in self._estimates.items()
+        }
@@ -3,12 +3,38 @@ Dependencies for FastAPI routes
 Author: Погосян Артем Артурович (Pogosian Artem)
 VK: https://vk.com/iamartempn
 """
+from fastapi import Request
 from sqlalchemy.orm import Session
+from app.config import settings
 from app.db import get_db
+from app.deadline import Deadline
 from app.llm_client import llm_client
+from app.usage import usage_recorder
+from app.generation_profiles import start_report
 
 
 def get_llm_client():
     """Dependency for LLM client"""
     return llm_client
 
+
+def request_deadline(route: str):
+    """Dependency factory for per-request deadline with a per-route default"""
+    default = settings.ROUTE_DEADLINES.get(route, settings.REQUEST_DEADLINE_DEFAULT)
+
+    def get_deadline(request: Request) -> Deadline:
+        return Deadline.from_headers(request.headers, default)
+
+    return get_deadline
+
+
+def usage_source(source: str):
+    """Dependency factory that attributes the request's LLM calls to a use case
+    and starts collecting their generation reports"""
+
+    async def set_usage_source():
+        # async so the context variables are set in the request's own context
+        usage_recorder.set_source(source)
+        start_report()
+
+    return set_usage_source
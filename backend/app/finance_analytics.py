@@ -0,0 +1,348 @@
+"""
+Local numeric pre-aggregation for finance reports
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+TOP_CATEGORIES = 5
+RECENT_PERIODS = 6
+MAX_OUTLIERS = 5
+MAX_NOTES = 3
+MAX_NOTE_LENGTH = 300
+MOVING_AVERAGE_WINDOW = 3
+OUTLIER_THRESHOLD = 3.5
+
+_PERIOD_RE = re.compile(
+    r"^("
+    r"\d{4}([-./]\d{1,2}){0,2}"
+    r"|\d{1,2}[-./]\d{4}"
+    r"|\d{1,2}[-./]\d{1,2}[-./]\d{2,4}"
+    r"|(q|кв\.?)\s*[1-4]([-./\s]+\d{2,4})?"
+    r"|[1-4]\s*(q|кв\.?|квартал)(\s+\d{2,4})?"
+    r"|(январ|феврал|март|апрел|ма[йя]|июн|июл|август|сентябр|октябр|ноябр|декабр)[а-я]*(\s+\d{2,4})?"
+    r"|(jan(uary)?|feb(ruary)?|mar(ch)?|apr(il)?|may|june?|july?|aug(ust)?|sep(t(ember)?)?"
+    r"|oct(ober)?|nov(ember)?|dec(ember)?)\.?(\s+\d{2,4})?"
+    r"|(неделя|week)\s*\d+"
+    r")$",
+    re.IGNORECASE
+)
+_NUMBER_JUNK_RE = re.compile(r"[\s ₽$€]|руб\.?|rub", re.IGNORECASE)
+
+
+class FinanceTable:
+    """Numeric table with periods as rows and categories as columns"""
+
+    def __init__(self, rows: List[str], columns: List[str], values: np.ndarray, has_periods: bool):
+        self.rows = rows
+        self.columns = columns
+        self.values = values
+        self.has_periods = has_periods
+
+
+def _to_number(value: Any) -> Optional[float]:
+    """Parse int/float or a number written as text ("120 000 руб", "1,5")"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, str):
+        cleaned = _NUMBER_JUNK_RE.sub("", value).replace(",", ".")
+        try:
+            number = float(cleaned)
+        except ValueError:
+            return None
+        return number if np.isfinite(number) else None
+    return None
+
+
+def _looks_like_periods(labels: List[str]) -> bool:
+    """True if most labels are dates, months, quarters or weeks"""
+    if not labels:
+        return False
+    matches = sum(1 for label in labels if _PERIOD_RE.match(str(label).strip()))
+    return matches / len(labels) >= 0.8
+
+
+def parse_table(data: Optional[dict]) -> Tuple[Optional[FinanceTable], List[str]]:
+    """Parse a user-supplied dict into a numeric table and free-text notes"""
+    if not data:
+        return None, []
+
+    numeric: List[Tuple[str, float]] = []
+    nested: List[Tuple[str, dict]] = []
+    lists: List[Tuple[str, list]] = []
+    notes: List[str] = []
+
+    for key, value in data.items():
+        number = _to_number(value)
+        if number is not None:
+            numeric.append((str(key), number))
+        elif isinstance(value, dict):
+            nested.append((str(key), value))
+        elif isinstance(value, list):
+            lists.append((str(key), value))
+        elif value is not None:
+            notes.append(f"{key}: {value}")
+
+    if nested:
+        notes.extend(f"{label}: {value:g}" for label, value in numeric)
+        return _table_from_nested(nested), notes
+    if lists:
+        notes.extend(f"{label}: {value:g}" for label, value in numeric)
+        return _table_from_lists(lists), notes
+    if numeric:
+        labels = [label for label, _ in numeric]
+        values = np.fromiter((value for _, value in numeric), dtype=np.float64, count=len(numeric))
+        if _looks_like_periods(labels):
+            return FinanceTable(labels, ["сумма"], values.reshape(-1, 1), True), notes
+        return FinanceTable(["всего"], labels, values.reshape(1, -1), False), notes
+    return None, notes
+
+
+def _table_from_nested(nested: List[Tuple[str, dict]]) -> FinanceTable:
+    """{outer: {inner: value}} -> table, oriented so that periods are rows"""
+    outer = [label for label, _ in nested]
+    inner_index: Dict[str, int] = {}
+    for _, inner in nested:
+        for key in inner:
+            inner_index.setdefault(str(key), len(inner_index))
+    inner = list(inner_index)
+
+    values = np.zeros((len(outer), len(inner)), dtype=np.float64)
+    for row, (_, items) in enumerate(nested):
+        for key, value in items.items():
+            number = _to_number(value)
+            if number is not None:
+                values[row, inner_index[str(key)]] = number
+
+    if not _looks_like_periods(outer) and _looks_like_periods(inner):
+        return FinanceTable(inner, outer, values.T.copy(), True)
+    return FinanceTable(outer, inner, values, _looks_like_periods(outer))
+
+
+def _table_from_lists(lists: List[Tuple[str, list]]) -> FinanceTable:
+    """{period: [values]} sums each period, {category: [values]} is a positional series"""
+    labels = [label for label, _ in lists]
+    parsed = [
+        np.array([n for n in (_to_number(v) for v in items) if n is not None], dtype=np.float64)
+        for _, items in lists
+    ]
+    if _looks_like_periods(labels):
+        totals = np.array([series.sum() for series in parsed], dtype=np.float64)
+        return FinanceTable(labels, ["сумма"], totals.reshape(-1, 1), True)
+
+    length = max((len(series) for series in parsed), default=0)
+    values = np.zeros((length, len(labels)), dtype=np.float64)
+    for column, series in enumerate(parsed):
+        values[:len(series), column] = series
+    return FinanceTable([str(i + 1) for i in range(length)], labels, values, length > 1)
+
+
+def _round(value: float) -> float:
+    return round(float(value), 2)
+
+
+def _pct(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """Percent ratio with NaN where the denominator is zero"""
+    result = np.full(numerator.shape, np.nan, dtype=np.float64)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result * 100
+
+
+def _clean(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(v) else _round(v) for v in values]
+
+
+def _category_breakdown(table: FinanceTable) -> List[dict]:
+    """Top categories by total with the tail folded into "прочее\""""
+    totals = table.values.sum(axis=0)
+    grand_total = totals.sum()
+    order = np.argsort(-np.abs(totals), kind="stable")
+    shares = _pct(totals, np.full(totals.shape, grand_total))
+
+    breakdown = [
+        {"category": table.columns[i], "total": _round(totals[i]), "share_pct": _clean(shares[i:i + 1])[0]}
+        for i in order[:TOP_CATEGORIES]
+    ]
+    rest = order[TOP_CATEGORIES:]
+    if len(rest):
+        rest_total = totals[rest].sum()
+        breakdown.append({
+            "category": f"прочее ({len(rest)})",
+            "total": _round(rest_total),
+            "share_pct": _round(rest_total / grand_total * 100) if grand_total else None
+        })
+    return breakdown
+
+
+def _series_stats(labels: List[str], series: np.ndarray) -> dict:
+    """Deltas, moving average, trend and robust outliers of a per-period series"""
+    deltas = np.diff(series)
+    delta_pct = _pct(deltas, series[:-1])
+    recent = slice(-RECENT_PERIODS, None)
+
+    window = min(MOVING_AVERAGE_WINDOW, len(series))
+    moving_average = np.convolve(series, np.ones(window) / window, mode="valid")
+    slope = np.polyfit(np.arange(len(series), dtype=np.float64), series, 1)[0]
+
+    median = np.median(series)
+    mad = np.median(np.abs(series - median))
+    if mad > 0:
+        scores = 0.6745 * (series - median) / mad
+    else:
+        scores = np.zeros_like(series)
+    outlier_idx = np.flatnonzero(np.abs(scores) > OUTLIER_THRESHOLD)
+    outlier_idx = outlier_idx[np.argsort(-np.abs(scores[outlier_idx]))][:MAX_OUTLIERS]
+
+    return {
+        "periods": len(series),
+        "first": {"period": labels[0], "value": _round(series[0])},
+        "last": {"period": labels[-1], "value": _round(series[-1])},
+        "mean": _round(series.mean()),
+        "min": {"period": labels[int(series.argmin())], "value": _round(series.min())},
+        "max": {"period": labels[int(series.argmax())], "value": _round(series.max())},
+        "trend_per_period": _round(slope),
+        "recent_changes": [
+            {"period": label, "delta": _round(delta), "delta_pct": pct}
+            for label, delta, pct in zip(labels[1:][recent], deltas[recent], _clean(delta_pct[recent]))
+        ],
+        "moving_average_window": window,
+        "moving_average_recent": _clean(moving_average[recent]),
+        "outliers": [
+            {"period": labels[i], "value": _round(series[i]), "score": _round(scores[i])}
+            for i in outlier_idx
+        ],
+    }
+
+
+def _analyze_table(table: FinanceTable) -> dict:
+    per_period = table.values.sum(axis=1)
+    result = {
+        "total": _round(per_period.sum()),
+        "categories": _category_breakdown(table) if len(table.columns) > 1 else [],
+    }
+    if table.has_periods and len(table.rows) > 1:
+        result["series"] = _series_stats(table.rows, per_period)
+    return result
+
+
+def _profit_series(sales: FinanceTable, expenses: FinanceTable) -> Optional[dict]:
+    """Per-period profit and margin over the periods present in both tables"""
+    if not (sales.has_periods and expenses.has_periods):
+        return None
+    expense_index = {label: i for i, label in enumerate(expenses.rows)}
+    common = [(i, expense_index[label]) for i, label in enumerate(sales.rows) if label in expense_index]
+    if len(common) < 2:
+        return None
+
+    sales_idx = np.fromiter((i for i, _ in common), dtype=np.intp, count=len(common))
+    expense_idx = np.fromiter((j for _, j in common), dtype=np.intp, count=len(common))
+    revenue = sales.values.sum(axis=1)[sales_idx]
+    costs = expenses.values.sum(axis=1)[expense_idx]
+    profit = revenue - costs
+    margin = _pct(profit, revenue)
+    labels = [sales.rows[i] for i in sales_idx]
+
+    result = _series_stats(labels, profit)
+    result["recent_margin_pct"] = [
+        {"period": label, "margin_pct": value}
+        for label, value in zip(labels[-RECENT_PERIODS:], _clean(margin[-RECENT_PERIODS:]))
+    ]
+    return result
+
+
+def summarize_finance(sales_data: Optional[dict], expenses_data: Optional[dict]) -> dict:
+    """Compute a fixed-size summary of sales and expenses"""
+    sales, sales_notes = parse_table(sales_data)
+    expenses, expense_notes = parse_table(expenses_data)
+
+    metrics: Dict[str, Any] = {}
+    if sales is not None:
+        metrics["sales"] = _analyze_table(sales)
+    if expenses is not None:
+        metrics["expenses"] = _analyze_table(expenses)
+
+    if sales is not None and expenses is not None:
+        revenue = metrics["sales"]["total"]
+        profit = revenue - metrics["expenses"]["total"]
+        metrics["profit"] = {
+            "total": _round(profit),
+            "margin_pct": _round(profit / revenue * 100) if revenue else None,
+        }
+        profit_series = _profit_series(sales, expenses)
+        if profit_series:
+            metrics["profit"]["series"] = profit_series
+
+    notes = [note[:MAX_NOTE_LENGTH] for note in (sales_notes + expense_notes)[:MAX_NOTES]]
+    if notes:
+        metrics["notes"] = notes
+    return metrics
+
+
+def _money(value: Optional[float]) -> str:
+    if value is None:
+        return "н/д"
+    return f"{value:,.0f}".replace(",", " ") + " руб."
+
+
+def _percent(value: Optional[float]) -> str:
+    return "н/д" if value is None else f"{value:+.1f}%"
+
+
+def _format_section(title: str, data: dict) -> List[str]:
+    lines = [f"{title}: итого {_money(data['total'])}"]
+    if data.get("categories"):
+        lines.append("  Структура: " + "; ".join(
+            f"{c['category']} — {_money(c['total'])} ({c['share_pct']}%)" for c in data["categories"]
+        ))
+    series = data.get("series")
+    if series:
+        lines.append(
+            f"  Периодов: {series['periods']}, среднее {_money(series['mean'])}, "
+            f"мин {_money(series['min']['value'])} ({series['min']['period']}), "
+            f"макс {_money(series['max']['value'])} ({series['max']['period']}), "
+            f"тренд {_money(series['trend_per_period'])} за период"
+        )
+        if series["recent_changes"]:
+            lines.append("  Изменения к предыдущему периоду: " + "; ".join(
+                f"{c['period']}: {_money(c['delta'])} ({_percent(c['delta_pct'])})"
+                for c in series["recent_changes"]
+            ))
+        lines.append(
+            f"  Скользящее среднее ({series['moving_average_window']} п.): "
+            + ", ".join(_money(v) for v in series["moving_average_recent"])
+        )
+        if series["outliers"]:
+            lines.append("  Выбросы: " + "; ".join(
+                f"{o['period']} — {_money(o['value'])}" for o in series["outliers"]
+            ))
+    return lines
+
+
+def format_finance_summary(metrics: dict) -> str:
+    """Render the summary as compact text for the LLM prompt"""
+    lines: List[str] = []
+    if "sales" in metrics:
+        lines.extend(_format_section("Продажи", metrics["sales"]))
+    if "expenses" in metrics:
+        lines.extend(_format_section("Расходы", metrics["expenses"]))
+    if "profit" in metrics:
+        profit = metrics["profit"]
+        margin = "н/д" if profit["margin_pct"] is None else f"{profit['margin_pct']}%"
+        lines.append(f"Прибыль: {_money(profit['total'])}, маржа {margin}")
+        series = profit.get("series")
+        if series:
+            lines.append("  Маржа по периодам: " + "; ".join(
+                f"{m['period']}: {'н/д' if m['margin_pct'] is None else str(m['margin_pct']) + '%'}"
+                for m in series["recent_margin_pct"]
+            ))
+            if series["outliers"]:
+                lines.append("  Выбросы прибыли: " + "; ".join(
+                    f"{o['period']} — {_money(o['value'])}" for o in series["outliers"]
+                ))
+    for note in metrics.get("notes", []):
+        lines.append(f"Примечание: {note}")
+    return "\n".join(lines)
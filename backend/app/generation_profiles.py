@@ -0,0 +1,125 @@
+"""
+Per-mode generation budgets (Ollama options) with load-aware degradation
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import logging
+from contextvars import ContextVar
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# num_predict bounds the answer (and so the worst-case latency) per mode.
+# num_ctx is not part of a profile: it is LLM_NUM_CTX for every call, since
+# a different value makes Ollama reload the model.
+DEFAULT_PROFILES: Dict[str, dict] = {
+    "general": {"num_predict": 768, "temperature": 0.7},
+    "legal": {"num_predict": 2048, "temperature": 0.3},
+    "marketing": {"num_predict": 400, "temperature": 0.8},
+    "finance": {"num_predict": 1024, "temperature": 0.3},
+    "summary": {"num_predict": 512, "temperature": 0.3},
+    "company": {"num_predict": 768, "temperature": 0.4},
+    "taxes": {"num_predict": 1024, "temperature": 0.2},
+}
+
+# (level, minimum queue depth as a multiple of PROFILE_DEGRADE_QUEUE_DEPTH, num_predict factor)
+DEGRADATION_LEVELS = (
+    ("minimal", 2, 0.35),
+    ("reduced", 1, 0.6),
+)
+MIN_NUM_PREDICT = 128
+CHARS_PER_TOKEN = 3  # conservative for Cyrillic text
+
+
+class GenerationProfile(NamedTuple):
+    """Options sent to the model plus how they were chosen"""
+    name: str
+    level: str
+    options: dict
+    trimmed_chars: int = 0  # prompt characters dropped by fit_messages
+
+
+def _profile(mode: str) -> Tuple[str, dict]:
+    """Profile name and options; settings entries are merged over the defaults"""
+    name = mode if mode in DEFAULT_PROFILES or mode in settings.GENERATION_PROFILES else "general"
+    return name, {
+        **DEFAULT_PROFILES["general"],
+        **DEFAULT_PROFILES.get(name, {}),
+        **settings.GENERATION_PROFILES.get(name, {}),
+    }
+
+
+def resolve_profile(mode: str, queue_depth: int, overrides: Optional[dict] = None) -> GenerationProfile:
+    """Profile options for a call; caller overrides win except that they cannot raise num_predict or change num_ctx"""
+    name, options = _profile(mode)
+    level = "normal"
+    threshold = settings.PROFILE_DEGRADE_QUEUE_DEPTH
+    if threshold > 0:
+        for candidate, multiple, factor in DEGRADATION_LEVELS:
+            if queue_depth >= threshold * multiple:
+                level = candidate
+                options["num_predict"] = max(MIN_NUM_PREDICT, int(options["num_predict"] * factor))
+                break
+
+    num_predict = options["num_predict"]
+    for key, value in (overrides or {}).items():
+        options[key] = min(value, num_predict) if key == "num_predict" else value
+
+    options["num_ctx"] = settings.LLM_NUM_CTX
+    if not options.get("stop"):
+        options.pop("stop", None)
+    return GenerationProfile(name, level, options)
+
+
+def fit_messages(
+    system_prompt: str,
+    messages: List[Dict[str, str]],
+    profile: GenerationProfile
+) -> Tuple[List[Dict[str, str]], GenerationProfile]:
+    """Drop the oldest turns, then the end of the last message, until the prompt fits num_ctx
+    
+    Ollama would otherwise silently cut the start of the prompt, system prompt included.
+    The returned profile carries the number of dropped characters for the generation report.
+    """
+    budget = (profile.options["num_ctx"] - profile.options["num_predict"]) * CHARS_PER_TOKEN - len(system_prompt or "")
+    kept = list(messages)
+    while len(kept) > 1 and sum(len(m["content"]) for m in kept) > budget:
+        kept.pop(0)
+    if kept and len(kept[-1]["content"]) > budget:
+        kept[-1] = {**kept[-1], "content": kept[-1]["content"][:max(budget, 0)]}
+    trimmed = sum(len(m["content"]) for m in messages) - sum(len(m["content"]) for m in kept)
+    if trimmed:
+        logger.warning(f"Prompt for {profile.name} trimmed by {trimmed} chars to fit num_ctx {profile.options['num_ctx']}")
+        profile = profile._replace(trimmed_chars=trimmed)
+    return kept, profile
+
+
+_report: ContextVar[Optional[List[dict]]] = ContextVar("generation_report", default=None)
+
+
+def start_report():
+    """Begin collecting generation reports for the current request"""
+    _report.set([])
+
+
+def add_report(profile: GenerationProfile, model: str, result: dict):
+    """Record the profile used by a finished call, whether its input was trimmed and whether the answer hit num_predict"""
+    report = _report.get()
+    if report is None:
+        return
+    report.append({
+        "model": result.get("model") or model,
+        "profile": profile.name,
+        "level": profile.level,
+        "num_predict": profile.options.get("num_predict"),
+        "num_ctx": profile.options.get("num_ctx"),
+        "completion_tokens": result.get("eval_count"),
+        "truncated": result.get("done_reason") == "length",
+        "input_truncated": profile.trimmed_chars > 0,
+        "input_trimmed_chars": profile.trimmed_chars,
+    })
+
+
+def current_report() -> List[dict]:
+    return list(_report.get() or [])
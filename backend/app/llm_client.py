@@ -3,13 +3,62 @@ LLM client for interacting with Ollama or other LLM providers
 Author: Погосян Артем Артурович (Pogosian Artem)
 VK: https://vk.com/iamartempn
 """
+import asyncio
 import httpx
+import json
 import logging
-from typing import List, Dict, Optional
+import time
+from typing import AsyncIterator, List, Dict, NamedTuple, Optional, Pattern, Sequence, Tuple
 from app.config import settings
+from app.deadline import Deadline, DeadlineExceeded, GenerationTimeEstimator
+from app.tracing import tracer
+from app.usage import GenerationStats, current_source, usage_recorder
+from app.model_router import check_quality, model_router
+from app.generation_profiles import CHARS_PER_TOKEN, GenerationProfile, add_report, fit_messages, resolve_profile
+from app.traffic_capture import traffic_capture
 
 logger = logging.getLogger(__name__)
 
+ROLE_LABELS = {"user": "Пользователь", "assistant": "Ассистент"}
+
+
+class LLMError(Exception):
+    """The LLM call failed; raised instead of returning the error text when asked to"""
+
+
+class ContextState(NamedTuple):
+    """Ollama context (token ids) of a conversation after its last answered turn"""
+    model: str
+    mode: str
+    messages: int
+    tokens: List[int]
+
+
+def _prompt_chars(system_prompt: str, messages: List[Dict[str, str]]) -> int:
+    return len(system_prompt or "") + sum(len(m.get("content", "")) for m in messages)
+
+
+def _stale_reason(state: Optional[ContextState], model: str, mode: str, messages: int) -> Optional[str]:
+    """Why the stored context cannot continue the conversation, or None if it can"""
+    if state is None:
+        return "no context"
+    if state.model != model:
+        return f"context from {state.model}"
+    if state.mode != mode:
+        return f"context from mode {state.mode}"
+    # Covers every message but the new one; anything else means turns were added elsewhere
+    if state.messages != messages - 1:
+        return "stale context"
+    return None
+
+
+def _transcript(messages: List[Dict[str, str]]) -> str:
+    """Single prompt carrying earlier turns, for /api/generate which takes no message list"""
+    if len(messages) == 1:
+        return messages[0]["content"]
+    earlier = "\n\n".join(f"{ROLE_LABELS.get(m['role'], m['role'])}: {m['content']}" for m in messages[:-1])
+    return f"Предыдущая часть диалога:\n\n{earlier}\n\nНовое сообщение пользователя:\n{messages[-1]['content']}"
+
 
 class LLMClient:
     """Client for LLM interactions"""
@@ -19,6 +68,9 @@ class LLMClient:
         self.model = settings.LLM_MODEL
         self.timeout = settings.LLM_TIMEOUT
         self.client = httpx.AsyncClient(timeout=self.timeout)
+        self.generation_times = GenerationTimeEstimator()
+        self.queue_depth = 0
+        self._slots = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
     
     def _get_system_prompt(self, mode: str = "general") -> str:
         """Get system prompt based on mode"""
@@ -190,47 +242,311 @@ class LLMClient:
         self,
         system_prompt: str,
         messages: List[Dict[str, str]],
-        mode: Optional[str] = None
+        mode: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        options: Optional[Dict] = None,
+        sections: Sequence[Tuple[str, Pattern]] = (),
+        raise_on_error: bool = False
     ) -> str:
-        """Generate response from LLM"""
+        """Generate response from LLM
+        
+        The model is picked by the routing table; for cascaded modes an answer
+        failing the quality check (optionally requiring `sections`) is
+        regenerated by the large model if the deadline allows. Failures come
+        back as error text, or raise LLMError with `raise_on_error`.
+        """
+        mode_key = mode or "general"
+        route = model_router.route(mode_key, current_source(), _prompt_chars(system_prompt, messages))
+        text, result = await self._generate(system_prompt, messages, mode_key, route.model, deadline, options)
+        if result is None and raise_on_error:
+            raise LLMError(text)
+        if not route.escalate_to or result is None:
+            return text
+        
+        reason = check_quality(text, sections)
+        model_router.record(mode_key, reason)
+        if not reason:
+            return text
+        await usage_recorder.record_escalation(result.get("model") or route.model, mode_key)
+        if deadline:
+            try:
+                self._check_budget(mode_key, deadline, "escalation")
+            except DeadlineExceeded:
+                logger.warning(f"No budget left to escalate {mode_key}, keeping small model answer")
+                return text
+        escalated, escalated_result = await self._generate(
+            system_prompt, messages, mode_key, route.escalate_to, deadline, options
+        )
+        if escalated_result is None:
+            logger.warning(f"Escalation of {mode_key} failed, keeping small model answer: {escalated}")
+            return text
+        return escalated
+    
+    async def _generate(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        mode_key: str,
+        model: str,
+        deadline: Optional[Deadline],
+        options: Optional[Dict]
+    ) -> Tuple[str, Optional[Dict]]:
+        """Single non-streaming call; returns the text and the raw result (None on error)"""
+        arrived_at = time.time()
+        if deadline:
+            self._check_budget(mode_key, deadline, "admission")
+        profile = resolve_profile(mode_key, self.queue_depth, options)
+        messages, profile = fit_messages(system_prompt, messages, profile)
+        payload = self._build_payload(system_prompt, messages, profile.options, stream=False, model=model)
+        result, error = await self._post("/api/chat", payload, mode_key, model, profile, deadline)
+        if result is None:
+            return error, None
+        content = result.get("message", {}).get("content")
+        if content is None:
+            return "Ошибка получения ответа от LLM", None
+        if traffic_capture.sampled():
+            traffic_capture.record(
+                mode_key, model, system_prompt, messages, options, result, stream=False, started_at=arrived_at
+            )
+        return content, result
+    
+    async def continue_conversation(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        state: Optional[ContextState],
+        mode: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[str, Optional[ContextState]]:
+        """Answer the last message of a conversation, reusing Ollama's context from the previous turn
+        
+        Only the new message is sent when `state` matches the conversation;
+        otherwise the whole conversation is re-sent, which also yields a
+        fresh state for the next turn. Routed, never cascaded.
+        """
+        mode_key = mode or "general"
+        arrived_at = time.time()
+        model = model_router.route(mode_key, current_source(), _prompt_chars(system_prompt, messages)).model
+        if deadline:
+            self._check_budget(mode_key, deadline, "admission")
+        
+        new_message = messages[-1]["content"]
+        reason = _stale_reason(state, model, mode_key, len(messages))
+        if reason is None:
+            prompt_chars = len(new_message) + len(state.tokens) * CHARS_PER_TOKEN
+            profile = resolve_profile(mode_key, self.queue_depth)
+            if prompt_chars // CHARS_PER_TOKEN + profile.options["num_predict"] > profile.options["num_ctx"]:
+                reason = "context full"
+        if reason is None:
+            prompt, context = new_message, state.tokens
+        else:
+            if state is not None or len(messages) > 1:
+                logger.info(f"Re-sending conversation to {model}: {reason}")
+            profile = resolve_profile(mode_key, self.queue_depth)
+            fitted, profile = fit_messages(system_prompt, messages, profile)
+            prompt, context = _transcript(fitted), None
+        
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "options": profile.options,
+        }
+        # The system prompt is already in the context; Ollama would template it in again
+        if context:
+            payload["context"] = context
+        else:
+            payload["system"] = system_prompt
+        result, error = await self._post(
+            "/api/generate", payload, mode_key, model, profile, deadline, context_reuse=context is not None
+        )
+        if result is None:
+            return error, None
+        if traffic_capture.sampled():
+            # The whole conversation is captured; replays send it without the reused context
+            traffic_capture.record(
+                mode_key, model, system_prompt, messages, None, result,
+                stream=False, started_at=arrived_at, context_reuse=context is not None
+            )
+        text = result.get("response", "Ошибка получения ответа от LLM")
+        tokens = result.get("context")
+        return text, ContextState(model, mode_key, len(messages) + 1, tokens) if tokens else None
+    
+    async def _post(
+        self,
+        path: str,
+        payload: Dict,
+        mode_key: str,
+        model: str,
+        profile: GenerationProfile,
+        deadline: Optional[Deadline],
+        **span_attributes
+    ) -> Tuple[Optional[Dict], Optional[str]]:
+        """Send a non-streaming request and record its stats; returns the result or an error text"""
+        await self._acquire_slot(deadline)
         try:
-            ollama_messages = []
+            if deadline:
+                self._check_budget(mode_key, deadline, "queue wait")
             
-            if system_prompt:
-                ollama_messages.append({
-                    "role": "system",
-                    "content": system_prompt
-                })
+            url = f"{self.base_url}{path}"
+            timeout = min(self.timeout, deadline.remaining()) if deadline else self.timeout
             
-            for msg in messages:
-                ollama_messages.append({
-                    "role": msg.get("role", "user"),
-                    "content": msg.get("content", "")
-                })
+            logger.info(f"Calling LLM with model {model}, mode {mode_key}")
+            started = time.monotonic()
+            started_at = time.time()
+            with tracer.span(
+                "llm.request", model=model, mode=mode_key, profile_level=profile.level, **span_attributes
+            ):
+                response = await asyncio.wait_for(
+                    self.client.post(url, json=payload, timeout=timeout),
+                    timeout=timeout
+                )
+                response.raise_for_status()
+                
+                result = response.json()
+                tracer.record_llm_timings(result, started_at)
+            stats = GenerationStats.from_ollama(result, model, time.monotonic() - started)
+            self.generation_times.record(mode_key, stats.total_seconds)
+            await usage_recorder.record(stats, mode_key)
+            add_report(profile, model, result)
+            return result, None
             
-            url = f"{self.base_url}/api/chat"
-            payload = {
-                "model": self.model,
-                "messages": ollama_messages,
-                "stream": False
-            }
-            
-            logger.info(f"Calling LLM with model {self.model}, mode {mode}")
-            response = await self.client.post(url, json=payload)
-            response.raise_for_status()
-            
-            result = response.json()
-            return result.get("message", {}).get("content", "Ошибка получения ответа от LLM")
-            
-        except httpx.TimeoutException:
+        except DeadlineExceeded:
+            raise
+        except (httpx.TimeoutException, asyncio.TimeoutError):
             logger.error("LLM request timeout")
-            return "Превышено время ожидания ответа от LLM. Попробуйте позже."
+            raise DeadlineExceeded("LLM response timed out")
         except httpx.RequestError as e:
             logger.error(f"LLM request error: {e}")
-            return f"Ошибка подключения к LLM: {str(e)}. Убедитесь, что Ollama запущен."
+            return None, f"Ошибка подключения к LLM: {str(e)}. Убедитесь, что Ollama запущен."
         except Exception as e:
             logger.error(f"Unexpected error in LLM client: {e}")
-            return f"Неожиданная ошибка: {str(e)}"
+            return None, f"Неожиданная ошибка: {str(e)}"
+        finally:
+            self._slots.release()
+    
+    async def stream_response(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        mode: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        options: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """Stream response content chunks from LLM as they are generated (routed, never cascaded)"""
+        mode_key = mode or "general"
+        arrived_at = time.time()
+        model = model_router.route(mode_key, current_source(), _prompt_chars(system_prompt, messages)).model
+        if deadline:
+            self._check_budget(mode_key, deadline, "admission")
+        profile = resolve_profile(mode_key, self.queue_depth, options)
+        messages, profile = fit_messages(system_prompt, messages, profile)
+        
+        await self._acquire_slot(deadline)
+        try:
+            if deadline:
+                self._check_budget(mode_key, deadline, "queue wait")
+            
+            url = f"{self.base_url}/api/chat"
+            payload = self._build_payload(system_prompt, messages, profile.options, stream=True, model=model)
+            timeout = min(self.timeout, deadline.remaining()) if deadline else self.timeout
+            
+            logger.info(f"Streaming LLM with model {model}, mode {mode_key}")
+            started = time.monotonic()
+            started_at = time.time()
+            async with self.client.stream("POST", url, json=payload, timeout=timeout) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    content = chunk.get("message", {}).get("content")
+                    if content:
+                        yield content
+                    if chunk.get("done"):
+                        tracer.add_span(
+                            "llm.request", started_at, time.time() - started_at,
+                            model=model, mode=mode_key, stream=True, profile_level=profile.level
+                        )
+                        tracer.record_llm_timings(chunk, started_at)
+                        stats = GenerationStats.from_ollama(chunk, model, time.monotonic() - started)
+                        self.generation_times.record(mode_key, stats.total_seconds)
+                        await usage_recorder.record(stats, mode_key)
+                        add_report(profile, model, chunk)
+                        if traffic_capture.sampled():
+                            traffic_capture.record(
+                                mode_key, model, system_prompt, messages, options, chunk,
+                                stream=True, started_at=arrived_at
+                            )
+                    elif deadline:
+                        deadline.check("generation")
+        
+        except httpx.TimeoutException:
+            logger.error("LLM stream timeout")
+            raise DeadlineExceeded("LLM response timed out")
+        finally:
+            self._slots.release()
+    
+    def _build_payload(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        options: Optional[Dict],
+        stream: bool,
+        model: Optional[str] = None
+    ) -> Dict:
+        """Build Ollama /api/chat payload"""
+        ollama_messages = []
+        
+        if system_prompt:
+            ollama_messages.append({
+                "role": "system",
+                "content": system_prompt
+            })
+        
+        for msg in messages:
+            ollama_messages.append({
+                "role": msg.get("role", "user"),
+                "content": msg.get("content", "")
+            })
+        
+        payload = {
+            "model": model or self.model,
+            "messages": ollama_messages,
+            "stream": stream
+        }
+        if options:
+            payload["options"] = options
+        return payload
+    
+    def _check_budget(self, mode: str, deadline: Deadline, phase: str):
+        """Reject early if the remaining budget cannot cover the expected generation time"""
+        deadline.check(phase)
+        expected = self.generation_times.expected(mode)
+        remaining = deadline.remaining()
+        if expected is not None and remaining < expected:
+            logger.warning(
+                f"Rejecting {mode} request: {remaining:.1f}s left, ~{expected:.1f}s expected"
+            )
+            raise DeadlineExceeded(
+                f"Remaining budget {remaining:.1f}s is below expected generation time "
+                f"{expected:.1f}s for mode {mode}"
+            )
+    
+    async def _acquire_slot(self, deadline: Optional[Deadline]):
+        """Wait for a free generation slot within the deadline"""
+        self.queue_depth += 1
+        started_at = time.time()
+        try:
+            if deadline:
+                await asyncio.wait_for(self._slots.acquire(), timeout=deadline.remaining())
+            else:
+                await self._slots.acquire()
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Request deadline exceeded while waiting for LLM")
+        finally:
+            self.queue_depth -= 1
+            tracer.add_span("llm.queue_wait", started_at, time.time() - started_at)
     
     async def check_health(self) -> bool:
         """Check if LLM service is available"""
@@ -8,8 +8,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.config import settings
 from app.db import init_db
-from app.routers import chat, usecases, health
+from app.routers import chat, chat_ws, usecases, health, debug, stats, transfer
 from app.llm_client import llm_client
+from app.conversation_cache import conversation_cache
+from app.tracing import TraceMiddleware, TRACE_HEADER
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -22,9 +24,11 @@ async def lifespan(app: FastAPI):
     logger.info("Initializing database...")
     init_db()
     logger.info("Database initialized")
+    conversation_cache.start()
     logger.info(f"Application started: {settings.APP_NAME} v{settings.APP_VERSION}")
     yield
     logger.info("Shutting down application...")
+    await conversation_cache.stop()
     await llm_client.close()
 
 
@@ -41,11 +45,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TRACE_HEADER],
 )
+app.add_middleware(TraceMiddleware)
 
 app.include_router(health.router)
 app.include_router(chat.router)
+app.include_router(chat_ws.router)
 app.include_router(usecases.router)
+app.include_router(debug.router)
+app.include_router(stats.router)
+app.include_router(transfer.router)
 
 
 @app.get("/")
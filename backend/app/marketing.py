@@ -0,0 +1,103 @@
+"""
+Concurrent generation of marketing post variants
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+from app.deadline import Deadline
+from app.llm_client import llm_client
+from app.schemas import MarketingPostRequest
+
+logger = logging.getLogger(__name__)
+
+VARIANT_STYLES = [
+    {"angle": "выгода для клиента", "tone": None, "temperature": 0.7},
+    {"angle": "эмоции и история", "tone": "casual", "temperature": 0.9},
+    {"angle": "срочность и ограниченное предложение", "tone": "friendly", "temperature": 0.8},
+    {"angle": "социальное доказательство и отзывы", "tone": "professional", "temperature": 0.8},
+    {"angle": "вопрос к аудитории и вовлечение", "tone": "casual", "temperature": 1.0},
+]
+
+PLATFORM_HINTS = {
+    "instagram": "короткий текст, эмодзи, 5-10 хештегов в конце",
+    "vk": "развёрнутый структурированный пост",
+    "telegram": "информативный пост с примером или фактом",
+}
+
+
+def request_platforms(request: MarketingPostRequest) -> List[str]:
+    """Platforms from the list field or a comma-separated platform string"""
+    if request.platforms:
+        platforms = request.platforms
+    else:
+        platforms = request.platform.split(",")
+    return [p.strip().lower() for p in platforms if p.strip()] or ["general"]
+
+
+def variant_specs(request: MarketingPostRequest) -> List[Dict]:
+    """One spec per (platform, variant) pair"""
+    specs = []
+    for platform in request_platforms(request):
+        for index in range(request.variants):
+            style = VARIANT_STYLES[index % len(VARIANT_STYLES)]
+            specs.append({
+                "platform": platform,
+                "index": index,
+                "angle": style["angle"],
+                "tone": style["tone"] if index else request.tone,
+                "temperature": style["temperature"],
+            })
+    return specs
+
+
+def build_variant_prompt(request: MarketingPostRequest, spec: Dict) -> str:
+    hint = PLATFORM_HINTS.get(spec["platform"], "универсальный формат")
+    return f"""Создай ОДИН промо-пост для социальной сети.
+
+Описание бизнеса: {request.business_description}
+Цель промоакции: {request.promotion_goal}
+Платформа: {spec['platform']} ({hint})
+{f'Целевая аудитория: {request.target_audience}' if request.target_audience else ''}
+Тон: {spec['tone'] or 'friendly'}
+Акцент: {spec['angle']}
+
+Пост должен включать призыв к действию и быть готовым к публикации.
+Выведи только текст поста, без заголовков, нумерации и пояснений."""
+
+
+async def _generate_variant(request: MarketingPostRequest, spec: Dict, deadline: Optional[Deadline]) -> Dict:
+    try:
+        text = await llm_client.generate_response(
+            system_prompt=llm_client._get_system_prompt("marketing"),
+            messages=[{"role": "user", "content": build_variant_prompt(request, spec)}],
+            mode="marketing",
+            deadline=deadline,
+            options={"temperature": spec["temperature"]}
+        )
+        return {**spec, "text": text.strip()}
+    except Exception as e:
+        logger.warning(f"Marketing variant {spec['platform']}#{spec['index']} failed: {e}")
+        return {
+            **spec,
+            "error": getattr(e, "detail", None) or str(e),
+            "status_code": getattr(e, "status_code", 500)
+        }
+
+
+async def generate_variants(
+    request: MarketingPostRequest,
+    deadline: Optional[Deadline] = None
+) -> AsyncIterator[Dict]:
+    """Fan out all variants at once and yield each one as soon as it finishes"""
+    tasks = [
+        asyncio.create_task(_generate_variant(request, spec, deadline))
+        for spec in variant_specs(request)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
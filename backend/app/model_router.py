@@ -0,0 +1,86 @@
+"""
+Mode-aware model routing and small-to-large cascade
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+from app.config import settings
+from app.section_extractor import extract
+
+logger = logging.getLogger(__name__)
+
+MIN_ANSWER_LENGTH = 20
+_DANGLING_ENDINGS = (",", ":", ";", "—", "-", "(", "«")
+
+
+class Route(NamedTuple):
+    """Model to call first and, for cascaded modes, the model to escalate to"""
+    model: str
+    escalate_to: Optional[str] = None
+
+
+def check_quality(text: str, sections: Sequence[Tuple[str, Pattern]] = ()) -> Optional[str]:
+    """Cheap structural check of an answer; returns the failure reason or None
+
+    Hitting num_predict is not a reason to escalate: the large model runs
+    under the same generation profile.
+    """
+    stripped = text.strip()
+    if len(stripped) < MIN_ANSWER_LENGTH:
+        return "empty"
+    if stripped.count("```") % 2:
+        return "unclosed code block"
+    if stripped.endswith(_DANGLING_ENDINGS):
+        return "truncated"
+    if sections:
+        found = extract(stripped, sections).items
+        missing = [name for name, items in found.items() if not items]
+        if missing:
+            return f"missing sections: {', '.join(missing)}"
+    return None
+
+
+class ModelRouter:
+    """Picks a model per use case / mode and prompt size, tracks cascade escalations"""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.escalations: Dict[str, int] = defaultdict(int)
+        self.reasons: Dict[str, Counter] = defaultdict(Counter)
+
+    def route(self, mode: str, source: Optional[str], prompt_chars: int) -> Route:
+        """Routing order: use case entry, mode entry, default model; long prompts go large"""
+        routes = settings.MODEL_ROUTES
+        model = routes.get(source or "") or routes.get(mode) or settings.LLM_MODEL
+        large = settings.LLM_LARGE_MODEL
+        if large and model != large:
+            if prompt_chars > settings.ROUTE_LONG_PROMPT_CHARS:
+                return Route(large)
+            if mode in settings.LLM_CASCADE_MODES or (source or "") in settings.LLM_CASCADE_MODES:
+                return Route(model, escalate_to=large)
+        return Route(model)
+
+    def record(self, mode: str, reason: Optional[str]):
+        """Count a cascaded call and whether it had to escalate"""
+        self.calls[mode] += 1
+        if reason:
+            self.escalations[mode] += 1
+            self.reasons[mode][reason.split(":")[0]] += 1
+            logger.info(f"Escalating {mode} answer to {settings.LLM_LARGE_MODEL}: {reason}")
+
+    def snapshot(self) -> List[dict]:
+        return [
+            {
+                "mode": mode,
+                "cascaded_calls": calls,
+                "escalations": self.escalations[mode],
+                "escalation_rate_pct": round(self.escalations[mode] / calls * 100, 1),
+                "reasons": dict(self.reasons[mode]),
+            }
+            for mode, calls in sorted(self.calls.items())
+        ]
+
+
+model_router = ModelRouter()
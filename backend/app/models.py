@@ -3,7 +3,7 @@ Database models (ORM)
 Author: Погосян Артем Артурович (Pogosian Artem)
 VK: https://vk.com/iamartempn
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db import Base
@@ -31,5 +31,51 @@ class Message(Base):
     mode = Column(String, nullable=True)  # "general", "legal", "marketing", "finance", "summary"
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Generation statistics reported by the LLM (assistant messages only)
+    model = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    load_seconds = Column(Float, nullable=True)
+    prompt_eval_seconds = Column(Float, nullable=True)
+    eval_seconds = Column(Float, nullable=True)
+    total_seconds = Column(Float, nullable=True)
+    
     conversation = relationship("Conversation", back_populates="messages")
 
+
+class UseCaseCall(Base):
+    """Single LLM call made by a use case endpoint"""
+    __tablename__ = "usecase_calls"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False, index=True)  # "legal-contract", "finance-report", ...
+    mode = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    load_seconds = Column(Float, default=0.0)
+    prompt_eval_seconds = Column(Float, default=0.0)
+    eval_seconds = Column(Float, default=0.0)
+    total_seconds = Column(Float, default=0.0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class UsageHourly(Base):
+    """LLM usage rolled up per hour, source, mode and model"""
+    __tablename__ = "usage_hourly"
+    __table_args__ = (UniqueConstraint("hour", "source", "mode", "model", name="uq_usage_hourly_key"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    hour = Column(DateTime, nullable=False, index=True)
+    source = Column(String, nullable=False)
+    mode = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    calls = Column(Integer, nullable=False, default=0)
+    escalations = Column(Integer, nullable=True, default=0)  # cascade answers handed to the large model
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    load_seconds = Column(Float, nullable=False, default=0.0)
+    prompt_eval_seconds = Column(Float, nullable=False, default=0.0)
+    eval_seconds = Column(Float, nullable=False, default=0.0)
+    total_seconds = Column(Float, nullable=False, default=0.0)
+
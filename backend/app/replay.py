@@ -0,0 +1,219 @@
+"""
+Replay of captured LLM traffic with a comparison report per mode
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+
+CLI:
+    python -m app.replay capture.ndjson [--base-url URL] [--speed N] [--model NAME]
+                                        [--concurrency N] [--limit N] [--json report.json]
+
+Calls are re-issued as streaming Ollama /api/chat requests against --base-url
+(a real Ollama or any compatible stand-in). --speed 1 keeps the captured
+inter-arrival times, 4 replays four times faster, 0 sends everything as fast as
+--concurrency allows. System prompts, routing and generation profiles come
+from the current code and settings, so the report shows the effect of a prompt
+or model change against what was captured.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+from app.config import settings
+from app.generation_profiles import fit_messages, resolve_profile
+from app.llm_client import _prompt_chars, llm_client
+from app.model_router import model_router
+from app.traffic_capture import system_hash
+
+logger = logging.getLogger(__name__)
+
+
+def load_capture(path: str, limit: Optional[int] = None) -> List[dict]:
+    """Captured calls in arrival order; a torn last line of the append-only file is skipped"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning("Skipping unreadable capture line")
+    records.sort(key=lambda r: r["ts"])
+    return records[:limit] if limit else records
+
+
+def _ttft(final: dict) -> Optional[float]:
+    """Model load + prompt evaluation in seconds; None if the server does not report them"""
+    if final.get("prompt_eval_duration") is None:
+        return None
+    return ((final.get("load_duration") or 0) + final["prompt_eval_duration"]) / 1e9
+
+
+async def replay_call(client: httpx.AsyncClient, base_url: str, record: dict, model: Optional[str]) -> dict:
+    """Send one captured call with today's prompt, route and profile; measure TTFT and latency
+    
+    TTFT is model load + prompt evaluation from Ollama's final chunk, the same
+    definition the capture uses, so streaming and non-streaming records compare.
+    """
+    mode = record["mode"]
+    system_prompt = llm_client._get_system_prompt(mode)
+    messages = record["messages"]
+    prompt_chars = _prompt_chars(system_prompt, messages)
+    model = model or model_router.route(mode, record.get("source"), prompt_chars).model
+    profile = resolve_profile(mode, 0, record.get("overrides"))
+    messages, profile = fit_messages(system_prompt, messages, profile)
+    payload = llm_client._build_payload(system_prompt, messages, profile.options, stream=True, model=model)
+    
+    started = time.monotonic()
+    final = {}
+    try:
+        async with client.stream("POST", f"{base_url}/api/chat", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("done"):
+                    final = chunk
+    except (httpx.HTTPError, ValueError) as e:
+        return {"mode": mode, "error": str(e) or type(e).__name__}
+    return {
+        "mode": mode,
+        "model": final.get("model") or model,
+        "prompt_changed": system_hash(system_prompt) != record.get("system_hash"),
+        "completion_tokens": final.get("eval_count"),
+        "ttft": _ttft(final),
+        # Server-side duration like the capture; wall time only if the server does not report it
+        "total": (final.get("total_duration") or 0) / 1e9 or time.monotonic() - started,
+    }
+
+
+async def replay(
+    records: List[dict],
+    base_url: str,
+    speed: float = 1.0,
+    concurrency: int = 2,
+    model: Optional[str] = None
+) -> List[Tuple[dict, dict]]:
+    """Re-issue captured calls on their original schedule divided by `speed` (0: no waiting)"""
+    if not records:
+        return []
+    slots = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    first_ts = records[0]["ts"]
+    
+    async with httpx.AsyncClient(timeout=settings.LLM_TIMEOUT) as client:
+        async def one(record: dict) -> Tuple[dict, dict]:
+            if speed > 0:
+                due = started + (record["ts"] - first_ts) / speed
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+            async with slots:
+                return record, await replay_call(client, base_url, record, model)
+        
+        return await asyncio.gather(*(one(record) for record in records))
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    return round(float(np.mean(values)), 3) if values else None
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    return round(float(np.percentile(values, q)), 3) if values else None
+
+
+def _change_pct(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    if not before or after is None:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def compare(pairs: List[Tuple[dict, dict]]) -> List[dict]:
+    """Per-mode captured vs replayed tokens, TTFT and total latency"""
+    groups: Dict[str, Dict[str, list]] = defaultdict(lambda: defaultdict(list))
+    for record, result in pairs:
+        group = groups[record["mode"]]
+        group["calls"].append(1)
+        if "error" in result:
+            group["errors"].append(result["error"])
+            continue
+        group["models"].append(result["model"])
+        group["prompt_changed"].append(result["prompt_changed"])
+        # Replays re-send the whole conversation, so latency of a context-reuse turn is not comparable
+        keys = ("completion_tokens",) if record.get("context_reuse") else ("completion_tokens", "ttft", "total")
+        for key in keys:
+            if record.get(key) is not None:
+                group[f"captured_{key}"].append(record[key])
+            if result.get(key) is not None:
+                group[f"replayed_{key}"].append(result[key])
+    
+    rows = []
+    for mode, group in sorted(groups.items()):
+        row = {
+            "mode": mode,
+            "calls": len(group["calls"]),
+            "errors": len(group["errors"]),
+            "models": sorted(set(group["models"])),
+            "prompt_changed": any(group["prompt_changed"]),
+        }
+        for side in ("captured", "replayed"):
+            row[f"{side}_tokens"] = _mean(group[f"{side}_completion_tokens"])
+            row[f"{side}_ttft_p50"] = _percentile(group[f"{side}_ttft"], 50)
+            row[f"{side}_total_p50"] = _percentile(group[f"{side}_total"], 50)
+            row[f"{side}_total_p95"] = _percentile(group[f"{side}_total"], 95)
+        row["tokens_change_pct"] = _change_pct(row["captured_tokens"], row["replayed_tokens"])
+        row["ttft_change_pct"] = _change_pct(row["captured_ttft_p50"], row["replayed_ttft_p50"])
+        row["total_change_pct"] = _change_pct(row["captured_total_p50"], row["replayed_total_p50"])
+        rows.append(row)
+    return rows
+
+
+def format_report(rows: List[dict]) -> str:
+    def cell(before, after, change) -> str:
+        if before is None and after is None:
+            return "-"
+        text = f"{before if before is not None else '-'} -> {after if after is not None else '-'}"
+        return f"{text} ({change:+.1f}%)" if change is not None else text
+    
+    lines = [f"{'mode':<12}{'calls':>6}{'err':>5}  {'tokens':<26}{'ttft p50, s':<26}{'total p50, s':<26}prompt"]
+    for row in rows:
+        lines.append(
+            f"{row['mode']:<12}{row['calls']:>6}{row['errors']:>5}  "
+            f"{cell(row['captured_tokens'], row['replayed_tokens'], row['tokens_change_pct']):<26}"
+            f"{cell(row['captured_ttft_p50'], row['replayed_ttft_p50'], row['ttft_change_pct']):<26}"
+            f"{cell(row['captured_total_p50'], row['replayed_total_p50'], row['total_change_pct']):<26}"
+            f"{'changed' if row['prompt_changed'] else 'same'}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured LLM traffic and compare with the capture")
+    parser.add_argument("capture", help="file written with CAPTURE_PATH")
+    parser.add_argument("--base-url", default=settings.LLM_BASE_URL, help="Ollama-compatible server")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = original timing, N = N times faster, 0 = no waiting")
+    parser.add_argument("--concurrency", type=int, default=settings.LLM_MAX_CONCURRENCY)
+    parser.add_argument("--model", help="use this model for every call instead of the routing table")
+    parser.add_argument("--limit", type=int, help="replay only the first N calls")
+    parser.add_argument("--json", dest="json_path", help="also write the report as JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    records = load_capture(args.capture, args.limit)
+    if not records:
+        print(f"No captured calls in {args.capture}")
+        sys.exit(1)
+    span = (records[-1]["ts"] - records[0]["ts"]) / args.speed if args.speed > 0 else 0
+    print(f"Replaying {len(records)} calls against {args.base_url} (~{span:.0f}s of captured traffic)")
+    started = time.monotonic()
+    rows = compare(asyncio.run(replay(records, args.base_url, args.speed, args.concurrency, args.model)))
+    print(format_report(rows))
+    print(f"Done in {time.monotonic() - started:.1f}s")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
@@ -5,90 +5,92 @@ VK: https://vk.com/iamartempn
 """
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
-from app.db import get_db
-from app.models import Conversation, Message
-from app.schemas import ChatRequest, ChatResponse, MessageResponse
+from typing import List, Optional
+from app.db import engine, get_db
+from app.models import Conversation
+from app.schemas import ChatRequest, ChatResponse, MessageResponse, SearchHit, SearchResponse
 from app.llm_client import llm_client
 from app.config import settings
+from app.deadline import Deadline
+from app.deps import request_deadline, usage_source
+from app.tracing import tracer
+from app.usage import usage_recorder
+from app.generation_profiles import current_report
+from app.search import is_supported, search_messages
+from app.conversation_cache import CachedConversation, conversation_cache
 from datetime import datetime
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
 
-@router.post("", response_model=ChatResponse)
+def open_conversation(conversation_id: Optional[int], db: Session) -> CachedConversation:
+    """Cached history of an existing conversation, or a new empty conversation"""
+    if conversation_id:
+        history = conversation_cache.get(conversation_id, db)
+        if history is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return history
+    conversation = Conversation(user_id="default_user", created_at=datetime.utcnow())
+    db.add(conversation)
+    db.commit()
+    db.refresh(conversation)
+    return conversation_cache.create(conversation.id)
+
+
+@router.post("", response_model=ChatResponse, dependencies=[Depends(usage_source("chat"))])
 async def chat(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    deadline: Deadline = Depends(request_deadline("chat"))
 ):
     """Main chat endpoint"""
     try:
-        if request.conversation_id:
-            conversation = db.query(Conversation).filter(
-                Conversation.id == request.conversation_id
-            ).first()
-            if not conversation:
-                raise HTTPException(status_code=404, detail="Conversation not found")
-        else:
-            conversation = Conversation(user_id="default_user", created_at=datetime.utcnow())
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-        
-        if settings.SAVE_HISTORY:
-            user_message = Message(
-                conversation_id=conversation.id,
-                role="user",
-                content=request.message,
-                mode=request.mode,
-                created_at=datetime.utcnow()
-            )
-            db.add(user_message)
-            db.commit()
+        deadline.check("conversation lookup")
+        history = open_conversation(request.conversation_id, db)
         
+        deadline.check("history write")
         if settings.SAVE_HISTORY:
-            previous_messages = db.query(Message).filter(
-                Message.conversation_id == conversation.id
-            ).order_by(Message.created_at).all()
-            
-            messages_for_llm = [
-                {"role": msg.role, "content": msg.content}
-                for msg in previous_messages
-            ]
+            conversation_cache.append(history, role="user", content=request.message, mode=request.mode)
+            messages_for_llm = history.llm_messages()
         else:
             messages_for_llm = [{"role": "user", "content": request.message}]
         
         system_prompt = llm_client._get_system_prompt(request.mode)
         
-        answer = await llm_client.generate_response(
-            system_prompt=system_prompt,
-            messages=messages_for_llm,
-            mode=request.mode
-        )
+        with usage_recorder.collect() as calls:
+            if settings.CHAT_REUSE_CONTEXT and settings.SAVE_HISTORY:
+                answer, history.llm_state = await llm_client.continue_conversation(
+                    system_prompt=system_prompt,
+                    messages=messages_for_llm,
+                    state=history.llm_state,
+                    mode=request.mode,
+                    deadline=deadline
+                )
+            else:
+                answer = await llm_client.generate_response(
+                    system_prompt=system_prompt,
+                    messages=messages_for_llm,
+                    mode=request.mode,
+                    deadline=deadline
+                )
         
         if settings.SAVE_HISTORY:
-            assistant_message = Message(
-                conversation_id=conversation.id,
+            conversation_cache.append(
+                history,
                 role="assistant",
                 content=answer,
                 mode=request.mode,
-                created_at=datetime.utcnow()
+                **(calls[-1]._asdict() if calls else {})
             )
-            db.add(assistant_message)
-            db.commit()
-            
-            all_messages = db.query(Message).filter(
-                Message.conversation_id == conversation.id
-            ).order_by(Message.created_at).all()
-            
-            messages_response = [MessageResponse.model_validate(msg) for msg in all_messages]
+            messages_response = [MessageResponse.model_validate(msg) for msg in history.messages]
         else:
             messages_response = []
         
         return ChatResponse(
-            conversation_id=conversation.id,
+            conversation_id=history.id,
             answer=answer,
-            messages=messages_response
+            messages=messages_response,
+            generation=current_report()
         )
         
     except HTTPException:
@@ -96,3 +98,32 @@ async def chat(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+
+@router.get("/search", response_model=SearchResponse)
+async def search_history(
+    q: str,
+    mode: Optional[str] = None,
+    role: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    limit: int = 20,
+    offset: int = 0,
+    db: Session = Depends(get_db)
+):
+    """Full-text search over saved messages, best matches first"""
+    if not is_supported(engine):
+        raise HTTPException(status_code=501, detail="History search requires SQLite")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    
+    with tracer.span("search.fts"):
+        rows = search_messages(db, q, mode, role, date_from, date_to, limit, offset)
+    return SearchResponse(
+        query=q,
+        results=[SearchHit(**row) for row in rows[:limit]],
+        limit=limit,
+        offset=offset,
+        has_more=len(rows) > limit
+    )
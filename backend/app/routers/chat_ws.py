@@ -0,0 +1,284 @@
+"""
+WebSocket chat channel multiplexing many conversations over one connection
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+
+Frames are compact JSON objects sent as text frames (binary frames get an error frame). Client -> server:
+    {"type":"message","id":"r1","conversation_id":12,"mode":"legal","message":"..."}
+    {"type":"cancel","id":"r1"}
+    {"type":"ping"} / {"type":"pong"}
+Server -> client:
+    {"type":"started","id":"r1","conversation_id":12,"message_id":345}
+    {"type":"token","id":"r1","delta":"..."}
+    {"type":"done","id":"r1","conversation_id":12,"message":{...},"generation":[...]}
+    {"type":"error","id":"r1","status_code":404,"detail":"..."}
+    {"type":"ping"} / {"type":"pong"}
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Union
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from app.config import settings
+from app.conversation_cache import conversation_cache
+from app.db import SessionLocal
+from app.deadline import Deadline
+from app.generation_profiles import current_report, start_report
+from app.llm_client import llm_client
+from app.routers.chat import open_conversation
+from app.schemas import ChatRequest, MessageResponse
+from app.tracing import tracer
+from app.usage import usage_recorder
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["chat"])
+
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+
+
+class SlowConsumer(Exception):
+    """The client did not drain its send buffer within WS_SEND_TIMEOUT"""
+
+
+def _encode(frame: dict) -> str:
+    return json.dumps(frame, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class FrameSender:
+    """Bounded outgoing frame queue drained by a single writer task
+
+    Producers wait while the queue is full. Token frames of the same turn are
+    merged while they wait, so a slow client gets fewer, larger frames.
+    """
+
+    def __init__(self, websocket: WebSocket, limit: int, timeout: float):
+        self.websocket = websocket
+        self.limit = limit
+        self.timeout = timeout
+        self._frames: Deque[dict] = deque()
+        self._ready = asyncio.Event()
+        self._drained = asyncio.Event()
+
+    async def send(self, frame: dict):
+        if frame["type"] == "token" and self._frames:
+            last = self._frames[-1]
+            if last["type"] == "token" and last["id"] == frame["id"]:
+                last["delta"] += frame["delta"]
+                return
+        while len(self._frames) >= self.limit:
+            self._drained.clear()
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                raise SlowConsumer(f"{len(self._frames)} frames not sent in {self.timeout}s")
+        self._frames.append(frame)
+        self._ready.set()
+
+    async def run(self):
+        while True:
+            await self._ready.wait()
+            while self._frames:
+                frame = self._frames.popleft()
+                self._drained.set()
+                await self.websocket.send_text(_encode(frame))
+            self._ready.clear()
+
+
+class ChatConnection:
+    """One client connection: receiver, writer, heartbeat and a task per running turn"""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.sender = FrameSender(websocket, settings.WS_SEND_BUFFER, settings.WS_SEND_TIMEOUT)
+        self.turns: Dict[Union[str, int], asyncio.Task] = {}
+        self.busy: Set[int] = set()
+        self.last_seen = time.monotonic()
+        self.close_code: Optional[int] = None
+        self._closing = asyncio.Event()
+
+    async def serve(self):
+        tasks = [
+            asyncio.create_task(self.sender.run()),
+            asyncio.create_task(self._receive()),
+            asyncio.create_task(self._heartbeat()),
+            asyncio.create_task(self._closing.wait()),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = not task.cancelled() and task.exception()
+                if isinstance(error, SlowConsumer):
+                    self._close(CLOSE_POLICY_VIOLATION, str(error))
+                elif error and not isinstance(error, WebSocketDisconnect):
+                    logger.error(f"Chat socket failed: {error}")
+        finally:
+            pending = tasks + list(self.turns.values())
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self.close_code is not None:
+            try:
+                await self.websocket.close(code=self.close_code)
+            except RuntimeError:
+                pass  # already closed by the client
+
+    def _close(self, code: int, reason: str):
+        logger.info(f"Closing chat socket ({code}): {reason}")
+        self.close_code = code
+        self._closing.set()
+
+    async def _heartbeat(self):
+        interval = settings.WS_HEARTBEAT_SECONDS
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self.last_seen > 2 * interval:
+                self._close(CLOSE_GOING_AWAY, "heartbeat timeout")
+                return
+            await self.sender.send({"type": "ping"})
+
+    async def _receive(self):
+        while True:
+            try:
+                raw = await self.websocket.receive_text()
+            except KeyError:
+                raw = None  # binary frame: the message has "bytes" instead of "text"
+            self.last_seen = time.monotonic()
+            if raw is None:
+                await self._error(None, 400, "Binary frames are not supported, send JSON text")
+                continue
+            try:
+                frame = json.loads(raw)
+                kind = frame.get("type")
+            except (ValueError, AttributeError):
+                await self._error(None, 400, "Frame must be a JSON object")
+                continue
+            if kind == "message":
+                await self._start_turn(frame)
+            elif kind == "cancel":
+                turn_id = frame.get("id")
+                if not isinstance(turn_id, (str, int)):
+                    await self._error(None, 400, "Cancel frame needs an id")
+                    continue
+                task = self.turns.get(turn_id)
+                if task:
+                    task.cancel()
+                    await self._error(turn_id, 499, "Cancelled")
+            elif kind == "ping":
+                await self.sender.send({"type": "pong"})
+            elif kind != "pong":
+                await self._error(frame.get("id"), 400, f"Unknown frame type: {kind}")
+
+    async def _error(self, turn_id, status_code: int, detail: str):
+        await self.sender.send({"type": "error", "id": turn_id, "status_code": status_code, "detail": detail})
+
+    async def _start_turn(self, frame: dict):
+        turn_id = frame.get("id")
+        if not isinstance(turn_id, (str, int)):
+            await self._error(None, 400, "Message frame needs an id")
+            return
+        if turn_id in self.turns:
+            await self._error(turn_id, 409, "A turn with this id is already running")
+            return
+        if len(self.turns) >= settings.WS_MAX_ACTIVE_TURNS:
+            await self._error(turn_id, 429, "Too many turns running on this connection")
+            return
+        try:
+            request = ChatRequest(
+                message=frame.get("message"),
+                mode=frame.get("mode") or "general",
+                conversation_id=frame.get("conversation_id")
+            )
+        except ValidationError as e:
+            await self._error(turn_id, 422, str(e))
+            return
+        self.turns[turn_id] = asyncio.create_task(self._turn(turn_id, request))
+
+    async def _turn(self, turn_id: Union[str, int], request: ChatRequest):
+        """Run one chat turn in its own task (and so its own usage/trace context)"""
+        usage_recorder.set_source("chat")
+        start_report()
+        root = tracer.start_trace("WS /ws/chat")
+        deadline = Deadline(settings.ROUTE_DEADLINES.get("chat", settings.REQUEST_DEADLINE_DEFAULT))
+        try:
+            with SessionLocal() as db:
+                history = open_conversation(request.conversation_id, db)
+            if history.id in self.busy:
+                raise HTTPException(status_code=409, detail="Conversation already has a running turn")
+            self.busy.add(history.id)
+            try:
+                await self._generate(turn_id, request, history, deadline)
+            finally:
+                self.busy.discard(history.id)
+            root.set(status_code=200)
+        except SlowConsumer as e:
+            self._close(CLOSE_POLICY_VIOLATION, str(e))
+        except HTTPException as e:
+            root.set(status_code=e.status_code)
+            await self._error(turn_id, e.status_code, e.detail)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Chat socket turn failed: {e}")
+            root.set(status_code=500)
+            await self._error(turn_id, 500, f"Internal server error: {str(e)}")
+        finally:
+            self.turns.pop(turn_id, None)
+            tracer.finish_trace(root)
+
+    async def _generate(self, turn_id, request: ChatRequest, history, deadline: Deadline):
+        user_message = None
+        if settings.SAVE_HISTORY:
+            user_message = conversation_cache.append(history, role="user", content=request.message, mode=request.mode)
+            messages = history.llm_messages()
+        else:
+            messages = [{"role": "user", "content": request.message}]
+        await self.sender.send({
+            "type": "started",
+            "id": turn_id,
+            "conversation_id": history.id,
+            "message_id": user_message["id"] if user_message else None,
+        })
+        
+        parts = []
+        with usage_recorder.collect() as calls:
+            async for chunk in llm_client.stream_response(
+                system_prompt=llm_client._get_system_prompt(request.mode),
+                messages=messages,
+                mode=request.mode,
+                deadline=deadline
+            ):
+                parts.append(chunk)
+                await self.sender.send({"type": "token", "id": turn_id, "delta": chunk})
+        
+        done = {"type": "done", "id": turn_id, "conversation_id": history.id, "generation": current_report()}
+        if settings.SAVE_HISTORY:
+            message = conversation_cache.append(
+                history,
+                role="assistant",
+                content="".join(parts),
+                mode=request.mode,
+                **(calls[-1]._asdict() if calls else {})
+            )
+            done["message"] = MessageResponse.model_validate(message).model_dump(mode="json")
+        await self.sender.send(done)
+
+
+def _origin_allowed(websocket: WebSocket) -> bool:
+    """Browsers send Origin on WebSocket handshakes; CORS does not cover them"""
+    origin = websocket.headers.get("origin")
+    return not origin or "*" in settings.CORS_ORIGINS or origin in settings.CORS_ORIGINS
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """Long-lived chat channel; see the module docstring for the frame format"""
+    if not _origin_allowed(websocket):
+        await websocket.close(code=CLOSE_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    await ChatConnection(websocket).serve()
@@ -0,0 +1,33 @@
+"""
+Debug endpoints for request traces and model routing
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+from fastapi import APIRouter
+from app.tracing import tracer
+from app.model_router import model_router
+from app.config import settings
+
+router = APIRouter(prefix="/api/debug", tags=["debug"])
+
+
+@router.get("/traces")
+async def slowest_traces(limit: int = 10, spans: bool = True):
+    """Slowest recent sampled traces with per-phase breakdown"""
+    traces = tracer.slowest(min(limit, 100))
+    if not spans:
+        traces = [{k: v for k, v in t.items() if k != "spans"} for t in traces]
+    return {"traces": traces, "sample_rate": tracer.sample_rate}
+
+
+@router.get("/routing")
+async def routing_state():
+    """Routing table and cascade escalation counters since startup"""
+    return {
+        "default_model": settings.LLM_MODEL,
+        "large_model": settings.LLM_LARGE_MODEL,
+        "routes": settings.MODEL_ROUTES,
+        "cascade_modes": settings.LLM_CASCADE_MODES,
+        "long_prompt_chars": settings.ROUTE_LONG_PROMPT_CHARS,
+        "cascade": model_router.snapshot(),
+    }
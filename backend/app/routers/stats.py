@@ -0,0 +1,88 @@
+"""
+Usage statistics endpoint backed by hourly aggregates
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import extract, func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Optional
+from app.db import get_db
+from app.models import UsageHourly
+from app.schemas import UsageStatsResponse, UsageStatsRow
+from app.usage import STAT_FIELDS
+
+router = APIRouter(prefix="/api/stats", tags=["stats"])
+
+GROUP_COLUMNS = {
+    "source": UsageHourly.source,
+    "mode": UsageHourly.mode,
+    "model": UsageHourly.model,
+    "hour": UsageHourly.hour,
+    "hour_of_day": extract("hour", UsageHourly.hour),
+}
+
+
+def _row(values: dict, total_seconds: float) -> UsageStatsRow:
+    """Group values plus summed stats with derived rates"""
+    if values.get("hour_of_day") is not None:
+        values["hour_of_day"] = int(values["hour_of_day"])
+    row = UsageStatsRow(**{k: v if k in GROUP_COLUMNS else v or 0 for k, v in values.items()})
+    if row.eval_seconds:
+        row.tokens_per_second = round(row.completion_tokens / row.eval_seconds, 2)
+    if row.calls:
+        row.escalation_rate_pct = round(row.escalations / row.calls * 100, 2)
+        row.avg_seconds_per_call = round(row.total_seconds / row.calls, 3)
+    if total_seconds:
+        row.capacity_share_pct = round(row.total_seconds / total_seconds * 100, 2)
+    return row
+
+
+@router.get("", response_model=UsageStatsResponse)
+async def usage_stats(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    group_by: str = "source,mode,model",
+    db: Session = Depends(get_db)
+):
+    """LLM usage (calls, tokens, tokens/s, capacity share) from hourly aggregates"""
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(days=1)
+    groups = [g.strip() for g in group_by.split(",") if g.strip()]
+    unknown = [g for g in groups if g not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown group_by fields: {', '.join(unknown)}. Allowed: {', '.join(GROUP_COLUMNS)}"
+        )
+    
+    sums = [
+        func.sum(UsageHourly.calls).label("calls"),
+        func.sum(UsageHourly.escalations).label("escalations"),
+    ] + [
+        func.sum(getattr(UsageHourly, field)).label(field) for field in STAT_FIELDS
+    ]
+    # Buckets are hour-aligned, so include the bucket that contains `since`
+    window = (
+        UsageHourly.hour >= since.replace(minute=0, second=0, microsecond=0),
+        UsageHourly.hour < until
+    )
+    
+    totals = db.query(*sums).filter(*window).one()._asdict()
+    total_seconds = totals["total_seconds"] or 0
+    
+    rows = []
+    if groups:
+        columns = [GROUP_COLUMNS[g].label(g) for g in groups]
+        query = db.query(*columns, *sums).filter(*window).group_by(*columns)
+        for values in query.order_by(func.sum(UsageHourly.total_seconds).desc()):
+            rows.append(_row(values._asdict(), total_seconds))
+    
+    return UsageStatsResponse(
+        since=since,
+        until=until,
+        group_by=groups,
+        totals=_row(totals, total_seconds),
+        rows=rows
+    )
@@ -0,0 +1,52 @@
+"""
+Bulk export and import of conversation history
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+import tempfile
+from app.transfer import ImportFailed, import_chunks, iter_export, read_chunks, scan_ids
+from app.conversation_cache import conversation_cache
+
+router = APIRouter(prefix="/api/transfer", tags=["transfer"])
+
+
+@router.get("/export")
+async def export_history(gzip: bool = False):
+    """Stream all conversations and messages as NDJSON (optionally gzip-compressed)"""
+    await conversation_cache.flush()
+    filename = f"conversations-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        iter_export(compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/import")
+async def import_history(request: Request):
+    """Import an NDJSON (or gzip NDJSON) body produced by the export endpoint
+    
+    The body is spooled to a temporary file first, so the database is only
+    locked (and the search index paused) while rows are written, not for the
+    whole upload. The spooled file is validated before anything is written.
+    """
+    with tempfile.TemporaryFile() as spool:
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(spool.write, chunk)
+        try:
+            max_ids = await run_in_threadpool(scan_ids, read_chunks(spool))
+            async with conversation_cache.exclusive():
+                offsets = {"message": conversation_cache.reserve_ids(max_ids["message"])}
+                counts = await run_in_threadpool(import_chunks, read_chunks(spool), offsets)
+        except ImportFailed as e:
+            # Rows committed before the failure stay; report them so a retry can skip them
+            raise HTTPException(
+                status_code=400,
+                detail={"error": e.reason, "line": e.line, "committed": e.committed}
+            )
+    return {"imported": counts}
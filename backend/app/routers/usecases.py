@@ -3,24 +3,123 @@ Predefined use cases endpoints
 Author: Погосян Артем Артурович (Pogosian Artem)
 VK: https://vk.com/iamartempn
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Callable, List, Optional
+import json
+import re
 from app.schemas import (
     LegalContractRequest, LegalContractResponse,
-    MarketingPostRequest, MarketingPostResponse,
+    MarketingPostRequest, MarketingPostResponse, MarketingVariant,
     FinanceReportRequest, FinanceReportResponse,
     SummaryRequest, SummaryResponse,
     CompanyCardRequest, CompanyCardResponse,
     TaxConsultationRequest, TaxConsultationResponse
 )
 from app.llm_client import llm_client
+from app.deadline import Deadline
+from app.deps import request_deadline, usage_source
+from app.marketing import generate_variants
+from app.contract_templates import TEMPLATES, find_template, generate_clauses, render_contract
+from app.section_extractor import SectionExtractor, extract
+from app.finance_analytics import summarize_finance, format_finance_summary
+from app.tax_engine import (
+    calculate, select_regimes, extract_revenue, extract_expenses, extract_year,
+    has_rates, is_pure_calculation, format_calculations
+)
+from app.company_registry import company_registry, normalize_inn, validate_inn
+from app.config import settings
+from app.tracing import tracer
+from app.generation_profiles import current_report
 
 router = APIRouter(prefix="/api/usecases", tags=["usecases"])
 
-
-@router.post("/legal-contract", response_model=LegalContractResponse)
-async def legal_contract(request: LegalContractRequest):
-    """Generate legal contract draft"""
+FINANCE_SECTIONS = [
+    ("recommendations", re.compile(r"рекомендац|совет", re.IGNORECASE)),
+    ("warnings", re.compile(r"риск|предупрежден|важно", re.IGNORECASE)),
+]
+SUMMARY_SECTIONS = [
+    ("tasks", re.compile(r"задач|todo", re.IGNORECASE)),
+    ("next_steps", re.compile(r"шаг|действ|next", re.IGNORECASE)),
+]
+COMPANY_SECTIONS = [
+    ("recommendations", re.compile(r"рекомендац|совет", re.IGNORECASE)),
+]
+CONTRACT_WARNINGS = [
+    "Это черновик договора. Для финального использования обязательно обратитесь к квалифицированному юристу.",
+    "Договор не является юридической гарантией и требует профессиональной проверки."
+]
+
+
+def _ndjson(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+def _stream_sections(
+    prompt: str,
+    mode: str,
+    sections: list,
+    deadline: Deadline,
+    finalize: Callable[[str, SectionExtractor], BaseModel]
+) -> StreamingResponse:
+    """Stream LLM tokens plus section/item events, then the final structured result"""
+    async def events():
+        extractor = SectionExtractor(sections)
+        parts = []
+        try:
+            async for chunk in llm_client.stream_response(
+                system_prompt=llm_client._get_system_prompt(mode),
+                messages=[{"role": "user", "content": prompt}],
+                mode=mode,
+                deadline=deadline
+            ):
+                parts.append(chunk)
+                yield _ndjson({"type": "token", "text": chunk})
+                for event in extractor.feed(chunk):
+                    yield _ndjson({"type": event.kind, "section": event.section, "text": event.text})
+            for event in extractor.close():
+                yield _ndjson({"type": event.kind, "section": event.section, "text": event.text})
+            result = finalize("".join(parts), extractor)
+            yield _ndjson({"type": "done", "result": result.model_dump()})
+        except Exception as e:
+            yield _ndjson({
+                "type": "error",
+                "status_code": getattr(e, "status_code", 500),
+                "detail": getattr(e, "detail", None) or str(e)
+            })
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.post(
+    "/legal-contract",
+    response_model=LegalContractResponse,
+    dependencies=[Depends(usage_source("legal-contract"))]
+)
+async def legal_contract(
+    request: LegalContractRequest,
+    deadline: Deadline = Depends(request_deadline("legal-contract"))
+):
+    """Generate legal contract draft
+    
+    Known contract types are rendered from a template and only the subject,
+    obligations and liability clauses are generated (concurrently).
+    """
     try:
+        template_name = find_template(request.contract_type)
+        if template_name:
+            template = TEMPLATES[template_name]
+            clauses = await generate_clauses(request, template, deadline)
+            with tracer.span("contract.render", template=template_name):
+                contract_text = render_contract(request, template, clauses)
+            return LegalContractResponse(
+                contract_text=contract_text,
+                template=template_name,
+                warnings=CONTRACT_WARNINGS,
+                generation=current_report()
+            )
+        
         prompt = f"""Составь черновик договора типа "{request.contract_type}".
 
 Стороны: {request.parties}
@@ -46,24 +145,44 @@ async def legal_contract(request: LegalContractRequest):
         contract_text = await llm_client.generate_response(
             system_prompt=system_prompt,
             messages=messages,
-            mode="legal"
+            mode="legal",
+            deadline=deadline
         )
         
         return LegalContractResponse(
             contract_text=contract_text,
-            warnings=[
-                "Это черновик договора. Для финального использования обязательно обратитесь к квалифицированному юристу.",
-                "Договор не является юридической гарантией и требует профессиональной проверки."
-            ]
+            warnings=CONTRACT_WARNINGS,
+            generation=current_report()
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating contract: {str(e)}")
 
 
-@router.post("/marketing-post", response_model=MarketingPostResponse)
-async def marketing_post(request: MarketingPostRequest):
+@router.post(
+    "/marketing-post",
+    response_model=MarketingPostResponse,
+    dependencies=[Depends(usage_source("marketing-post"))]
+)
+async def marketing_post(
+    request: MarketingPostRequest,
+    deadline: Deadline = Depends(request_deadline("marketing-post"))
+):
     """Generate marketing post"""
     try:
+        if request.parallel or request.platforms:
+            results = [v async for v in generate_variants(request, deadline)]
+            results.sort(key=lambda v: (v["platform"], v["index"]))
+            posts = [v["text"] for v in results if v.get("text")]
+            if not posts:
+                raise HTTPException(status_code=results[0]["status_code"], detail=results[0]["error"])
+            return MarketingPostResponse(
+                posts=posts,
+                variants=[MarketingVariant(**v) for v in results],
+                generation=current_report()
+            )
+        
         prompt = f"""Создай несколько вариантов промо-поста для социальных сетей.
 
 Описание бизнеса: {request.business_description}
@@ -84,55 +203,79 @@ async def marketing_post(request: MarketingPostRequest):
         response_text = await llm_client.generate_response(
             system_prompt=system_prompt,
             messages=messages,
-            mode="marketing"
+            mode="marketing",
+            deadline=deadline
         )
         
-        posts = []
-        lines = response_text.split('\n')
-        current_post = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                if current_post:
-                    posts.append('\n'.join(current_post))
-                    current_post = []
-                continue
-            
-            if line.startswith(('1.', '2.', '3.', '4.', '5.', 'Вариант', '---', '===')):
-                if current_post:
-                    posts.append('\n'.join(current_post))
-                    current_post = []
-                if not line.startswith('---'):
-                    current_post.append(line)
-            else:
-                current_post.append(line)
-        
-        if current_post:
-            posts.append('\n'.join(current_post))
+        posts = extract(response_text, split_blocks=True).blocks
         
         if not posts:
             posts = [response_text]
         
-        return MarketingPostResponse(posts=posts[:5])
+        return MarketingPostResponse(posts=posts[:5], generation=current_report())
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating post: {str(e)}")
 
 
-@router.post("/finance-report", response_model=FinanceReportResponse)
-async def finance_report(request: FinanceReportRequest):
+@router.post(
+    "/marketing-post/stream",
+    dependencies=[Depends(usage_source("marketing-post"))]
+)
+async def marketing_post_stream(
+    request: MarketingPostRequest,
+    deadline: Deadline = Depends(request_deadline("marketing-post"))
+):
+    """Stream marketing post variants as NDJSON, one line per finished variant"""
+    async def events():
+        async for variant in generate_variants(request, deadline):
+            yield _ndjson({"type": "variant", **variant})
+        yield _ndjson({"type": "done"})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.post(
+    "/finance-report",
+    response_model=FinanceReportResponse,
+    dependencies=[Depends(usage_source("finance-report"))]
+)
+async def finance_report(
+    request: FinanceReportRequest,
+    deadline: Deadline = Depends(request_deadline("finance-report"))
+):
     """Generate finance report and analysis"""
     try:
-        data_desc = []
-        if request.sales_data:
-            data_desc.append(f"Данные по продажам: {request.sales_data}")
-        if request.expenses_data:
-            data_desc.append(f"Данные по расходам: {request.expenses_data}")
-        if request.period:
-            data_desc.append(f"Период: {request.period}")
+        with tracer.span("finance.aggregate"):
+            metrics = summarize_finance(request.sales_data, request.expenses_data)
+        
+        analysis_text = await llm_client.generate_response(
+            system_prompt=llm_client._get_system_prompt("finance"),
+            messages=[{"role": "user", "content": _finance_prompt(request, metrics)}],
+            mode="finance",
+            deadline=deadline,
+            sections=FINANCE_SECTIONS
+        )
         
-        prompt = f"""Проанализируй финансовые данные малого бизнеса и дай рекомендации.
+        return _finance_response(analysis_text, extract(analysis_text, FINANCE_SECTIONS), metrics)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating report: {str(e)}")
+
+
+def _finance_prompt(request: FinanceReportRequest, metrics: dict) -> str:
+    data_desc = []
+    if metrics:
+        data_desc.append("Показатели (уже рассчитаны, не пересчитывай их):")
+        data_desc.append(format_finance_summary(metrics))
+    if request.period:
+        data_desc.append(f"Период: {request.period}")
+    
+    return f"""Проанализируй финансовые данные малого бизнеса и дай рекомендации.
 
 {chr(10).join(data_desc) if data_desc else 'Данные не предоставлены, дай общие рекомендации по управлению финансами малого бизнеса.'}
 
@@ -144,59 +287,71 @@ async def finance_report(request: FinanceReportRequest):
 3. Укажи на возможные риски
 
 ВАЖНО: Всегда напоминай, что это общие рекомендации и для серьёзных финансовых решений нужно обратиться к финансовому консультанту."""
-        
-        messages = [{"role": "user", "content": prompt}]
-        system_prompt = llm_client._get_system_prompt("finance")
-        
-        analysis_text = await llm_client.generate_response(
-            system_prompt=system_prompt,
-            messages=messages,
-            mode="finance"
+
+
+def _finance_response(analysis_text: str, extractor: SectionExtractor, metrics: dict) -> FinanceReportResponse:
+    warnings = extractor.items["warnings"] or [
+        "Это общие рекомендации. Для серьёзных финансовых решений обратитесь к финансовому консультанту.",
+        "Анализ основан на предоставленных данных и может не учитывать все нюансы вашего бизнеса."
+    ]
+    return FinanceReportResponse(
+        analysis=analysis_text,
+        metrics=metrics or None,
+        recommendations=extractor.items["recommendations"][:10],
+        warnings=warnings,
+        generation=current_report()
+    )
+
+
+@router.post(
+    "/finance-report/stream",
+    dependencies=[Depends(usage_source("finance-report"))]
+)
+async def finance_report_stream(
+    request: FinanceReportRequest,
+    deadline: Deadline = Depends(request_deadline("finance-report"))
+):
+    """Stream finance report tokens and extracted sections as NDJSON"""
+    with tracer.span("finance.aggregate"):
+        metrics = summarize_finance(request.sales_data, request.expenses_data)
+    return _stream_sections(
+        _finance_prompt(request, metrics),
+        "finance",
+        FINANCE_SECTIONS,
+        deadline,
+        lambda text, extractor: _finance_response(text, extractor, metrics)
+    )
+
+
+@router.post(
+    "/summary",
+    response_model=SummaryResponse,
+    dependencies=[Depends(usage_source("summary"))]
+)
+async def summary(
+    request: SummaryRequest,
+    deadline: Deadline = Depends(request_deadline("summary"))
+):
+    """Summarize text and extract tasks"""
+    try:
+        summary_text = await llm_client.generate_response(
+            system_prompt=llm_client._get_system_prompt("summary"),
+            messages=[{"role": "user", "content": _summary_prompt(request)}],
+            mode="summary",
+            deadline=deadline,
+            sections=SUMMARY_SECTIONS
         )
         
-        recommendations = []
-        warnings = []
-        
-        lines = analysis_text.split('\n')
-        in_recommendations = False
-        in_warnings = False
-        
-        for line in lines:
-            line_lower = line.lower()
-            if 'рекомендац' in line_lower or 'совет' in line_lower:
-                in_recommendations = True
-                in_warnings = False
-            elif 'риск' in line_lower or 'предупрежден' in line_lower or 'важно' in line_lower:
-                in_warnings = True
-                in_recommendations = False
-            
-            if line.strip() and (line.strip().startswith('-') or line.strip().startswith('•') or line.strip()[0].isdigit()):
-                if in_recommendations:
-                    recommendations.append(line.strip().lstrip('- •0123456789. '))
-                elif in_warnings:
-                    warnings.append(line.strip().lstrip('- •0123456789. '))
-        
-        if not warnings:
-            warnings = [
-                "Это общие рекомендации. Для серьёзных финансовых решений обратитесь к финансовому консультанту.",
-                "Анализ основан на предоставленных данных и может не учитывать все нюансы вашего бизнеса."
-            ]
-        
-        return FinanceReportResponse(
-            analysis=analysis_text,
-            recommendations=recommendations[:10] if recommendations else [],
-            warnings=warnings
-        )
+        return _summary_response(summary_text, extract(summary_text, SUMMARY_SECTIONS))
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating report: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
 
 
-@router.post("/summary", response_model=SummaryResponse)
-async def summary(request: SummaryRequest):
-    """Summarize text and extract tasks"""
-    try:
-        prompt = f"""Резюмируй следующий текст и выдели ключевые моменты:
+def _summary_prompt(request: SummaryRequest) -> str:
+    return f"""Резюмируй следующий текст и выдели ключевые моменты:
 
 {request.text}
 
@@ -208,53 +363,53 @@ async def summary(request: SummaryRequest):
 3. Следующие шаги (если применимо)
 
 Будь конкретным и структурированным."""
-        
-        messages = [{"role": "user", "content": prompt}]
-        system_prompt = llm_client._get_system_prompt("summary")
-        
-        summary_text = await llm_client.generate_response(
-            system_prompt=system_prompt,
-            messages=messages,
-            mode="summary"
-        )
-        
-        tasks = []
-        next_steps = []
-        
-        lines = summary_text.split('\n')
-        in_tasks = False
-        in_steps = False
-        
-        for line in lines:
-            line_lower = line.lower()
-            if 'задач' in line_lower or 'todo' in line_lower:
-                in_tasks = True
-                in_steps = False
-            elif 'шаг' in line_lower or 'действ' in line_lower or 'next' in line_lower:
-                in_steps = True
-                in_tasks = False
-            
-            if line.strip() and (line.strip().startswith('-') or line.strip().startswith('•') or line.strip()[0].isdigit()):
-                clean_line = line.strip().lstrip('- •0123456789. ')
-                if in_tasks and clean_line:
-                    tasks.append(clean_line)
-                elif in_steps and clean_line:
-                    next_steps.append(clean_line)
-        
-        return SummaryResponse(
-            summary=summary_text,
-            tasks=tasks[:20] if tasks else [],
-            next_steps=next_steps[:20] if next_steps else []
-        )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
 
 
-@router.post("/company-card", response_model=CompanyCardResponse)
-async def company_card(request: CompanyCardRequest):
+def _summary_response(summary_text: str, extractor: SectionExtractor) -> SummaryResponse:
+    return SummaryResponse(
+        summary=summary_text,
+        tasks=extractor.items["tasks"][:20],
+        next_steps=extractor.items["next_steps"][:20],
+        generation=current_report()
+    )
+
+
+@router.post(
+    "/summary/stream",
+    dependencies=[Depends(usage_source("summary"))]
+)
+async def summary_stream(
+    request: SummaryRequest,
+    deadline: Deadline = Depends(request_deadline("summary"))
+):
+    """Stream summary tokens and extracted tasks/next steps as NDJSON"""
+    return _stream_sections(_summary_prompt(request), "summary", SUMMARY_SECTIONS, deadline, _summary_response)
+
+
+@router.post(
+    "/company-card",
+    response_model=CompanyCardResponse,
+    dependencies=[Depends(usage_source("company-card"))]
+)
+async def company_card(
+    request: CompanyCardRequest,
+    deadline: Deadline = Depends(request_deadline("company-card"))
+):
     """Generate company card based on provided information"""
     try:
+        inn = normalize_inn(request.inn) if request.inn else None
+        if request.inn and not validate_inn(inn):
+            raise HTTPException(
+                status_code=422,
+                detail=f"Некорректный ИНН: {request.inn}. ИНН должен содержать 10 или 12 цифр с верной контрольной суммой."
+            )
+        
+        with tracer.span("registry.lookup") as span:
+            record = company_registry.find(inn=inn, name=request.company_name)
+            span.set(found=record is not None)
+        if record:
+            return await _registry_company_card(request, record, deadline)
+        
         info_parts = []
         if request.inn:
             info_parts.append(f"ИНН: {request.inn}")
@@ -285,69 +440,138 @@ async def company_card(request: CompanyCardRequest):
         card_text = await llm_client.generate_response(
             system_prompt=system_prompt,
             messages=messages,
-            mode="company"
+            mode="company",
+            deadline=deadline,
+            sections=COMPANY_SECTIONS
         )
         
-        recommendations = []
-        lines = card_text.split('\n')
-        in_recommendations = False
-        
-        for line in lines:
-            line_lower = line.lower()
-            if 'рекомендац' in line_lower or 'совет' in line_lower:
-                in_recommendations = True
-            elif line.strip() and in_recommendations:
-                if line.strip().startswith(('-', '•', '*')) or line.strip()[0].isdigit():
-                    recommendations.append(line.strip().lstrip('- •*0123456789. '))
-        
         return CompanyCardResponse(
             card_text=card_text,
-            recommendations=recommendations[:10] if recommendations else []
+            structured_data={"inn": inn, "found_in_registry": False} if inn else None,
+            recommendations=_extract_company_recommendations(card_text),
+            generation=current_report()
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating company card: {str(e)}")
 
 
-@router.post("/tax-consultation", response_model=TaxConsultationResponse)
-async def tax_consultation(request: TaxConsultationRequest):
+def _extract_company_recommendations(card_text: str) -> List[str]:
+    """Pull list items from the recommendations section"""
+    return extract(card_text, COMPANY_SECTIONS).items["recommendations"][:10]
+
+
+REGISTRY_CARD_FIELDS = [
+    ("name", "Название"),
+    ("full_name", "Полное наименование"),
+    ("inn", "ИНН"),
+    ("kpp", "КПП"),
+    ("ogrn", "ОГРН"),
+    ("registration_date", "Дата регистрации"),
+    ("status", "Статус"),
+    ("director", "Руководитель"),
+    ("okved", "ОКВЭД"),
+    ("okved_name", "Вид деятельности"),
+    ("tax_regime", "Налоговый режим"),
+    ("address", "Адрес"),
+]
+
+
+async def _registry_company_card(
+    request: CompanyCardRequest,
+    record: dict,
+    deadline: Deadline
+) -> CompanyCardResponse:
+    """Card with registry facts pre-filled; the LLM writes only the recommendations"""
+    facts = [f"{label}: {record[field]}" for field, label in REGISTRY_CARD_FIELDS if record.get(field)]
+    card_facts = "\n".join(facts)
+    
+    prompt = f"""Данные о компании из реестра (достоверны, не изменяй и не дополняй их):
+
+{card_facts}
+{f'Дополнительно от пользователя: {request.additional_info}' if request.additional_info else ''}
+
+Напиши только раздел "Рекомендации по работе с компанией" (5-7 пунктов списком) и, если применимо, "Потенциальные риски". Не повторяй данные карточки и не придумывай сведения, которых нет выше."""
+    
+    recommendations_text = await llm_client.generate_response(
+        system_prompt=llm_client._get_system_prompt("company"),
+        messages=[{"role": "user", "content": prompt}],
+        mode="company",
+        deadline=deadline,
+        sections=COMPANY_SECTIONS
+    )
+    
+    card_text = f"Основная информация (по данным реестра):\n{card_facts}\n\n{recommendations_text}"
+    return CompanyCardResponse(
+        card_text=card_text,
+        structured_data={**record, "found_in_registry": True},
+        recommendations=_extract_company_recommendations(recommendations_text),
+        generation=current_report()
+    )
+
+
+@router.get("/company-search")
+async def company_search(q: str, limit: int = 10):
+    """Search the offline company registry by name prefix"""
+    inn = normalize_inn(q)
+    if inn and validate_inn(inn):
+        record = company_registry.lookup_inn(inn)
+        return {"results": [record] if record else []}
+    return {"results": company_registry.search_name(q, limit=min(limit, 50))}
+
+
+@router.post(
+    "/tax-consultation",
+    response_model=TaxConsultationResponse,
+    dependencies=[Depends(usage_source("tax-consultation"))]
+)
+async def tax_consultation(
+    request: TaxConsultationRequest,
+    deadline: Deadline = Depends(request_deadline("tax-consultation"))
+):
     """Provide tax consultation"""
     try:
-        context_parts = []
-        if request.business_type:
-            context_parts.append(f"Тип бизнеса: {request.business_type}")
-        if request.tax_regime:
-            context_parts.append(f"Налоговый режим: {request.tax_regime}")
-        if request.revenue:
-            context_parts.append(f"Выручка: {request.revenue} руб.")
-        if request.additional_context:
-            context_parts.append(f"Контекст: {request.additional_context}")
-        
-        prompt = f"""Ответь на вопрос о налогах для малого бизнеса в России.
-
-Вопрос: {request.question}
-
-{chr(10).join(context_parts) if context_parts else ''}
-
-Дай подробный, структурированный ответ:
-1. Прямой ответ на вопрос
-2. Объяснение (если нужно)
-3. Примеры расчётов (если применимо)
-4. Практические рекомендации
-5. Важные предупреждения
-
-ВАЖНО: Всегда напоминай, что для точных расчётов нужно обратиться к бухгалтеру или налоговому консультанту."""
-        
-        messages = [{"role": "user", "content": prompt}]
-        system_prompt = llm_client._get_system_prompt("taxes")
-        
-        answer_text = await llm_client.generate_response(
-            system_prompt=system_prompt,
-            messages=messages,
-            mode="taxes"
-        )
+        revenue = request.revenue or extract_revenue(request.question)
+        expenses = request.expenses if request.expenses is not None else extract_expenses(request.question)
+        question_year = extract_year(request.question)
+        year = request.year or question_year
+        # A question about another year than the requested one, or a year without rates, goes to the LLM
+        rates_apply = has_rates(year) and (question_year is None or question_year == year)
         
         calculations = None
+        if (revenue or request.revenue_scenarios) and rates_apply:
+            with tracer.span("tax.calculate"):
+                calculations = calculate(
+                    request.revenue_scenarios or [revenue],
+                    expenses,
+                    regimes=select_regimes(request.question, request.tax_regime),
+                    business_type=request.business_type,
+                    has_employees=request.has_employees,
+                    patent_potential_income=request.patent_potential_income,
+                    year=year
+                )
+        
+        has_results = calculations and calculations["scenarios"][0]["regimes"]
+        if has_results and is_pure_calculation(request.question):
+            answer_text = format_calculations(calculations)
+            if settings.TAX_EXPLAIN_CALCULATIONS:
+                prompt = f"""Вопрос: {request.question}
+
+{answer_text}
+
+Кратко (3-5 предложений) поясни эти расчёты. Не пересчитывай и не меняй числа."""
+                explanation = await llm_client.generate_response(
+                    system_prompt=llm_client._get_system_prompt("taxes"),
+                    messages=[{"role": "user", "content": prompt}],
+                    mode="taxes",
+                    deadline=deadline
+                )
+                answer_text = f"{answer_text}\n\n{explanation}"
+        else:
+            answer_text = await _tax_answer(request, calculations, deadline)
+        
         warnings = [
             "⚠️ Это общая информация. Для точных расчётов обратитесь к бухгалтеру или налоговому консультанту.",
             "Налоговое законодательство может изменяться. Проверяйте актуальность информации."
@@ -356,9 +580,57 @@ async def tax_consultation(request: TaxConsultationRequest):
         return TaxConsultationResponse(
             answer=answer_text,
             calculations=calculations,
-            warnings=warnings
+            warnings=warnings,
+            generation=current_report()
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error providing tax consultation: {str(e)}")
 
+
+async def _tax_answer(
+    request: TaxConsultationRequest,
+    calculations: Optional[dict],
+    deadline: Deadline
+) -> str:
+    """Full LLM answer for tax questions that need more than arithmetic"""
+    context_parts = []
+    if request.business_type:
+        context_parts.append(f"Тип бизнеса: {request.business_type}")
+    if request.tax_regime:
+        context_parts.append(f"Налоговый режим: {request.tax_regime}")
+    if request.revenue:
+        context_parts.append(f"Выручка: {request.revenue} руб.")
+    if request.additional_context:
+        context_parts.append(f"Контекст: {request.additional_context}")
+    if calculations:
+        context_parts.append(
+            "Точные расчёты (используй эти числа, не пересчитывай):\n" + format_calculations(calculations)
+        )
+    
+    prompt = f"""Ответь на вопрос о налогах для малого бизнеса в России.
+
+Вопрос: {request.question}
+
+{chr(10).join(context_parts) if context_parts else ''}
+
+Дай подробный, структурированный ответ:
+1. Прямой ответ на вопрос
+2. Объяснение (если нужно)
+3. Примеры расчётов (если применимо)
+4. Практические рекомендации
+5. Важные предупреждения
+
+ВАЖНО: Всегда напоминай, что для точных расчётов нужно обратиться к бухгалтеру или налоговому консультанту."""
+    
+    messages = [{"role": "user", "content": prompt}]
+    system_prompt = llm_client._get_system_prompt("taxes")
+    
+    return await llm_client.generate_response(
+        system_prompt=system_prompt,
+        messages=messages,
+        mode="taxes",
+        deadline=deadline
+    )
@@ -8,6 +8,24 @@ from typing import Optional, List
 from datetime import datetime
 
 
+class GenerationInfo(BaseModel):
+    """Generation profile used by one LLM call"""
+    model: str
+    profile: str
+    level: str = Field(..., description="normal, reduced or minimal (degraded under load)")
+    num_predict: Optional[int] = None
+    num_ctx: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    truncated: bool = Field(False, description="Answer stopped at the num_predict limit")
+    input_truncated: bool = Field(False, description="Prompt was trimmed to fit num_ctx")
+    input_trimmed_chars: int = Field(0, description="Prompt characters dropped to fit num_ctx")
+
+
+class GeneratedResponse(BaseModel):
+    """Base for responses produced by the LLM"""
+    generation: List[GenerationInfo] = []
+
+
 class MessageBase(BaseModel):
     """Base message schema"""
     role: str
@@ -37,7 +55,7 @@ class ChatRequest(BaseModel):
     conversation_id: Optional[int] = Field(None, description="Existing conversation ID")
 
 
-class ChatResponse(BaseModel):
+class ChatResponse(GeneratedResponse):
     """Response schema for chat endpoint"""
     conversation_id: int
     answer: str
@@ -53,9 +71,10 @@ class LegalContractRequest(BaseModel):
     additional_info: Optional[str] = Field(None, description="Additional information")
 
 
-class LegalContractResponse(BaseModel):
+class LegalContractResponse(GeneratedResponse):
     """Response schema for legal contract usecase"""
     contract_text: str
+    template: Optional[str] = None
     warnings: List[str] = []
 
 
@@ -66,11 +85,26 @@ class MarketingPostRequest(BaseModel):
     platform: str = Field(default="general", description="Platform: instagram, vk, telegram, general")
     target_audience: Optional[str] = Field(None, description="Target audience")
     tone: Optional[str] = Field("friendly", description="Tone: friendly, professional, casual")
+    platforms: Optional[List[str]] = Field(None, description="Several platforms handled in one request")
+    parallel: bool = Field(False, description="Generate each variant as a separate concurrent request")
+    variants: int = Field(3, ge=1, le=5, description="Variants per platform in parallel mode")
 
 
-class MarketingPostResponse(BaseModel):
+class MarketingVariant(BaseModel):
+    """Single marketing post variant"""
+    platform: str
+    index: int
+    angle: str
+    tone: Optional[str] = None
+    temperature: float
+    text: Optional[str] = None
+    error: Optional[str] = None
+
+
+class MarketingPostResponse(GeneratedResponse):
     """Response schema for marketing post usecase"""
     posts: List[str] = []
+    variants: List[MarketingVariant] = []
 
 
 class FinanceReportRequest(BaseModel):
@@ -81,9 +115,10 @@ class FinanceReportRequest(BaseModel):
     questions: Optional[str] = Field(None, description="Specific questions about finances")
 
 
-class FinanceReportResponse(BaseModel):
+class FinanceReportResponse(GeneratedResponse):
     """Response schema for finance report usecase"""
     analysis: str
+    metrics: Optional[dict] = None
     recommendations: List[str] = []
     warnings: List[str] = []
 
@@ -94,7 +129,7 @@ class SummaryRequest(BaseModel):
     summary_type: Optional[str] = Field("general", description="Type: general, tasks, next_steps")
 
 
-class SummaryResponse(BaseModel):
+class SummaryResponse(GeneratedResponse):
     """Response schema for summary usecase"""
     summary: str
     tasks: List[str] = []
@@ -109,7 +144,7 @@ class CompanyCardRequest(BaseModel):
     additional_info: Optional[str] = Field(None, description="Дополнительная информация")
 
 
-class CompanyCardResponse(BaseModel):
+class CompanyCardResponse(GeneratedResponse):
     """Response schema for company card usecase"""
     card_text: str
     structured_data: Optional[dict] = None
@@ -122,10 +157,15 @@ class TaxConsultationRequest(BaseModel):
     business_type: Optional[str] = Field(None, description="Тип бизнеса: ИП, ООО")
     tax_regime: Optional[str] = Field(None, description="Налоговый режим: УСН, ОСН, ПСН, ЕНВД")
     revenue: Optional[float] = Field(None, description="Выручка (для расчётов)")
+    expenses: Optional[float] = Field(None, description="Расходы (для УСН 15% и ОСН)")
+    has_employees: bool = Field(False, description="Есть ли наёмные работники")
+    patent_potential_income: Optional[float] = Field(None, description="Потенциально возможный доход для ПСН")
+    revenue_scenarios: Optional[List[float]] = Field(None, description="Варианты выручки для сравнения режимов")
+    year: Optional[int] = Field(None, description="Год ставок для расчёта")
     additional_context: Optional[str] = Field(None, description="Дополнительный контекст")
 
 
-class TaxConsultationResponse(BaseModel):
+class TaxConsultationResponse(GeneratedResponse):
     """Response schema for tax consultation usecase"""
     answer: str
     calculations: Optional[dict] = None
@@ -137,3 +177,53 @@ class HealthResponse(BaseModel):
     status: str
     llm_status: Optional[str] = None
 
+
+
+class UsageStatsRow(BaseModel):
+    """LLM usage for one group of the stats report"""
+    source: Optional[str] = None
+    mode: Optional[str] = None
+    model: Optional[str] = None
+    hour: Optional[datetime] = None
+    hour_of_day: Optional[int] = None
+    calls: int
+    escalations: int = 0
+    prompt_tokens: int
+    completion_tokens: int
+    load_seconds: float
+    prompt_eval_seconds: float
+    eval_seconds: float
+    total_seconds: float
+    tokens_per_second: Optional[float] = None
+    avg_seconds_per_call: Optional[float] = None
+    escalation_rate_pct: Optional[float] = None
+    capacity_share_pct: Optional[float] = None
+
+
+class UsageStatsResponse(BaseModel):
+    """Aggregated LLM usage report"""
+    since: datetime
+    until: datetime
+    group_by: List[str]
+    totals: UsageStatsRow
+    rows: List[UsageStatsRow] = []
+
+
+class SearchHit(BaseModel):
+    """Message matching a history search"""
+    message_id: int
+    conversation_id: int
+    role: str
+    mode: Optional[str] = None
+    created_at: datetime
+    snippet: str
+    rank: float
+
+
+class SearchResponse(BaseModel):
+    """Page of history search results"""
+    query: str
+    results: List[SearchHit] = []
+    limit: int
+    offset: int
+    has_more: bool = False
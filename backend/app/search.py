@@ -0,0 +1,163 @@
+"""
+Full-text search over conversation history (SQLite FTS5)
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import logging
+import re
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "messages_fts"
+SNIPPET_TOKENS = 16
+
+# Indexed text: "ё" folded to "е" (unicode61 only strips Latin diacritics)
+_INDEXED = "replace(replace({0}.content, 'ё', 'е'), 'Ё', 'Е')"
+
+_CREATE_TABLE = f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    content,
+    content='messages',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)"""
+
+_TRIGGERS = {
+    "messages_fts_ai": f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, {_INDEXED.format('new')});
+    END""",
+    "messages_fts_ad": f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, {_INDEXED.format('old')});
+    END""",
+    "messages_fts_au": f"""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, {_INDEXED.format('old')});
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, {_INDEXED.format('new')});
+    END""",
+}
+
+# Inflectional endings, longest first; stripped from query words which are then prefix-matched
+_RU_ENDINGS = sorted("""
+    ами ями ого его ому ему ыми ими ией ием иях иям ая яя ое ее ые ие ый ий ой ей ую юю ом ем
+    ам ям ах ях ов ев ию ья ье ьи ью ы и а я о е у ю ь
+""".split(), key=len, reverse=True)
+_MIN_STEM = 3
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PHRASE_RE = re.compile(r'"([^"]+)"')
+
+
+def is_supported(engine: Engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+def init_search(engine: Engine):
+    """Create the FTS index and sync triggers; index messages the index has not seen yet"""
+    if not is_supported(engine):
+        logger.info("Full-text search requires SQLite, search disabled")
+        return
+    with engine.begin() as conn:
+        conn.execute(text(_CREATE_TABLE))
+        # Catches up on the first run and after an interrupted bulk import
+        indexed = resume_index(conn, _last_indexed_id(conn))
+        if indexed:
+            logger.info(f"Full-text index: {indexed} messages indexed")
+
+
+def _last_indexed_id(conn: Connection) -> int:
+    # The docsize shadow table lists indexed rowids; the FTS table itself reads the content table
+    return conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {FTS_TABLE}_docsize")).scalar()
+
+
+def pause_index(conn: Connection):
+    """Drop sync triggers before a bulk insert into messages"""
+    for name in _TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+
+def resume_index(conn: Connection, after_id: int) -> int:
+    """Restore sync triggers and index messages with id > after_id in one statement"""
+    for statement in _TRIGGERS.values():
+        conn.execute(text(statement))
+    return conn.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE}(rowid, content) "
+            f"SELECT id, {_INDEXED.format('messages')} FROM messages WHERE id > :after_id"
+        ),
+        {"after_id": after_id}
+    ).rowcount
+
+
+def _normalize(word: str) -> str:
+    return word.lower().replace("ё", "е")
+
+
+def stem(word: str) -> str:
+    """Strip a Russian inflectional ending, keeping at least _MIN_STEM letters"""
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn user input into an FTS5 MATCH expression
+
+    Quoted text is matched as an exact phrase; other words are stemmed and
+    prefix-matched, so "договоры аренды" also finds "договор аренды".
+    """
+    terms: List[str] = []
+    for phrase in _PHRASE_RE.findall(query):
+        words = [_normalize(w) for w in _WORD_RE.findall(phrase)]
+        if words:
+            terms.append('"' + " ".join(words) + '"')
+    for word in _WORD_RE.findall(_PHRASE_RE.sub(" ", query)):
+        terms.append(f'"{stem(_normalize(word))}"*')
+    return " ".join(terms) or None
+
+
+def search_messages(
+    db: Session,
+    query: str,
+    mode: Optional[str] = None,
+    role: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    limit: int = 20,
+    offset: int = 0
+) -> List[dict]:
+    """Ranked matches with highlighted snippets; fetches one extra row to detect more pages"""
+    match = build_match_query(query)
+    if not match:
+        return []
+    filters = []
+    params = {"match": match, "limit": limit + 1, "offset": offset}
+    if mode:
+        filters.append("m.mode = :mode")
+        params["mode"] = mode
+    if role:
+        filters.append("m.role = :role")
+        params["role"] = role
+    if date_from:
+        filters.append("m.created_at >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        filters.append("m.created_at < :date_to")
+        params["date_to"] = date_to
+
+    sql = f"""
+        SELECT m.id AS message_id, m.conversation_id, m.role, m.mode, m.created_at,
+               snippet({FTS_TABLE}, 0, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet,
+               bm25({FTS_TABLE}) AS rank
+        FROM {FTS_TABLE}
+        JOIN messages m ON m.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH :match {''.join(' AND ' + f for f in filters)}
+        ORDER BY rank
+        LIMIT :limit OFFSET :offset
+    """
+    statement = text(sql).bindparams(
+        *[bindparam(name, type_=DateTime) for name in ("date_from", "date_to") if name in params]
+    ).columns(created_at=DateTime)
+    return [dict(row._mapping) for row in db.execute(statement, params)]
@@ -0,0 +1,189 @@
+"""
+Incremental extraction of sections and list items from LLM output
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+_ITEM_RE = re.compile(r"^(?:[-•*–]|\d{1,2}[.)])\s+(?P<body>.+)$")
+_BOLD_RE = re.compile(r"^\*\*(?P<text>.+?)\*\*:?$")
+_EMPHASIS_RE = re.compile(r"\*\*|__")
+_SENTENCE_PUNCT_RE = re.compile(r"[.,;!?]")
+_BLOCK_MARKER_RE = re.compile(
+    r"^(?:#{1,6}\s*)?(?:\*\*)?(?:\d+[.)]\s*)?(?:вариант|пост)\b",
+    re.IGNORECASE
+)
+_NUMBERED_RE = re.compile(r"^(?:\*\*)?\d+[.)]\s")
+_SEPARATOR_RE = re.compile(r"^(?:-{3,}|={3,}|\*{3,})$")
+_NUMBER_PREFIX_RE = re.compile(r"^\d{1,2}[.)]\s*")
+_LINE_NUMBER_RE = re.compile(r"^#*\s*(?:\*\*)?(?P<number>\d{1,2})[.)]\s")
+
+MAX_HEADING_LENGTH = 80
+MAX_KEYWORD_HEADING_LENGTH = 50
+
+
+class SectionEvent(NamedTuple):
+    """Structured event emitted while text is streamed in"""
+    kind: str  # "section", "item" or "block"
+    section: Optional[str]
+    text: str
+
+
+class SectionExtractor:
+    """Single-pass extractor fed with arbitrary text chunks
+
+    Sections are (name, compiled pattern) pairs; a heading that matches a
+    pattern opens that section, any other heading closes the current one.
+    List items inside an open section are collected. A numbered line
+    ("2. Рекомендации") is a heading when it names another section or
+    follows the numbered heading of the current one. With split_blocks the
+    text is also cut into blocks on variant markers ("Вариант 2", "---")
+    or, until the first marker is seen, on blank lines.
+    """
+
+    def __init__(
+        self,
+        sections: Sequence[Tuple[str, Pattern]] = (),
+        split_blocks: bool = False
+    ):
+        self.sections = sections
+        self.split_blocks = split_blocks
+        self.current: Optional[str] = None
+        self.items: Dict[str, List[str]] = {name: [] for name, _ in sections}
+        self._heading_number: Optional[int] = None
+        self.blocks: List[str] = []
+        self._pending: List[str] = []
+        self._block: List[str] = []
+        self._markers_seen = False
+        self._intro: Optional[str] = None
+        self._after_blank = True
+
+    def feed(self, chunk: str) -> List[SectionEvent]:
+        """Consume a chunk and return events for every line it completed"""
+        if "\n" not in chunk:
+            self._pending.append(chunk)
+            return []
+        head, *middle, tail = chunk.split("\n")
+        self._pending.append(head)
+        lines = ["".join(self._pending), *middle]
+        self._pending = [tail] if tail else []
+
+        events: List[SectionEvent] = []
+        for line in lines:
+            self._process_line(line, events)
+        return events
+
+    def close(self) -> List[SectionEvent]:
+        """Flush the trailing partial line and the last block"""
+        events: List[SectionEvent] = []
+        if self._pending:
+            self._process_line("".join(self._pending), events)
+            self._pending = []
+        self._end_block(events)
+        if self._intro:
+            self._emit_block(self._intro, events)
+            self._intro = None
+        return events
+
+    def _section_for(self, text: str) -> Optional[str]:
+        for name, pattern in self.sections:
+            if pattern.search(text):
+                return name
+        return None
+
+    def _process_line(self, raw: str, events: List[SectionEvent]):
+        line = raw.strip()
+        if self.split_blocks:
+            self._process_block_line(line, events)
+        if not line or not self.sections:
+            return
+
+        item = _ITEM_RE.match(line)
+        text = item.group("body").strip() if item else line
+        bold = _BOLD_RE.match(text)
+        if bold:
+            text = bold.group("text")
+        text = _NUMBER_PREFIX_RE.sub("", text.lstrip("#").strip())
+        numbered = _LINE_NUMBER_RE.match(line)
+        number = int(numbered.group("number")) if numbered else None
+
+        if self._is_heading(line, text, bool(item), bool(bold), number):
+            self._heading_number = number
+            section = self._section_for(text)
+            if section != self.current:
+                self.current = section
+                if section:
+                    events.append(SectionEvent("section", section, text.rstrip(":")))
+            return
+
+        if item and self.current:
+            cleaned = _EMPHASIS_RE.sub("", text).strip()
+            if cleaned:
+                if number is not None:
+                    self._heading_number = None  # numbered items: later numbers are not sibling headings
+                self.items[self.current].append(cleaned)
+                events.append(SectionEvent("item", self.current, cleaned))
+
+    def _is_heading(self, line: str, text: str, is_item: bool, is_bold: bool, number: Optional[int]) -> bool:
+        if line.startswith("#") or is_bold:
+            return True
+        if text.endswith(":") and len(text) <= MAX_HEADING_LENGTH:
+            return True
+        if number is not None and len(text) <= MAX_HEADING_LENGTH and not _SENTENCE_PUNCT_RE.search(text):
+            # "3. Риски" after "2. Рекомендации"; a numbered point naming the current section stays an item
+            if self._heading_number is not None and number == self._heading_number + 1:
+                return True
+            section = self._section_for(text)
+            return section is not None and section != self.current
+        if is_item:
+            # A bullet mentioning a keyword ("- Пересмотреть рекомендации") is content
+            return False
+        if len(text) > MAX_KEYWORD_HEADING_LENGTH or _SENTENCE_PUNCT_RE.search(text):
+            return False
+        return self._section_for(text) is not None
+
+    def _process_block_line(self, line: str, events: List[SectionEvent]):
+        if not line:
+            if not self._markers_seen:
+                self._end_block(events)
+            self._after_blank = True
+            return
+        if _SEPARATOR_RE.match(line):
+            self._end_block(events)
+            self._markers_seen = True
+            self._intro = None
+            self._after_blank = True
+            return
+        if _BLOCK_MARKER_RE.match(line) or (self._after_blank and _NUMBERED_RE.match(line)):
+            self._end_block(events)
+            self._markers_seen = True
+            self._intro = None
+        self._block.append(line)
+        self._after_blank = False
+
+    def _end_block(self, events: List[SectionEvent]):
+        if not self._block:
+            return
+        block = "\n".join(self._block)
+        self._block = []
+        if not self._markers_seen and len(block) <= MAX_HEADING_LENGTH and block.endswith(":"):
+            # "Вот несколько вариантов:" is an intro, not a post, once variant markers follow
+            self._intro = block
+            return
+        if self._intro and not self._markers_seen:
+            self._emit_block(self._intro, events)
+            self._intro = None
+        self._emit_block(block, events)
+
+    def _emit_block(self, block: str, events: List[SectionEvent]):
+        self.blocks.append(block)
+        events.append(SectionEvent("block", None, block))
+
+
+def extract(text: str, sections: Sequence[Tuple[str, Pattern]] = (), split_blocks: bool = False) -> SectionExtractor:
+    """Run the extractor over a complete text"""
+    extractor = SectionExtractor(sections, split_blocks=split_blocks)
+    extractor.feed(text)
+    extractor.close()
+    return extractor
@@ -0,0 +1,387 @@
+"""
+Deterministic tax calculations for small business regimes
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import re
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Rate tables by year. To support a new year add an entry; lookups fall back
+# to the latest year not after the requested one.
+RATE_TABLES: Dict[int, dict] = {
+    2024: {
+        "ip_fixed_contributions": 49_500,
+        "ip_extra_rate": 0.01,
+        "ip_extra_threshold": 300_000,
+        "ip_extra_cap": 277_571,
+        "usn_income_rate": 0.06,
+        "usn_profit_rate": 0.15,
+        "usn_min_tax_rate": 0.01,
+        "usn_increased_threshold": 199_350_000,
+        "usn_increased_income_rate": 0.08,
+        "usn_increased_profit_rate": 0.20,
+        "usn_limit": 265_800_000,
+        "usn_vat_threshold": None,
+        "psn_rate": 0.06,
+        "psn_limit": 60_000_000,
+        "ndfl_brackets": [(5_000_000, 0.13), (None, 0.15)],
+        "ndfl_professional_deduction": 0.20,
+    },
+    2025: {
+        "ip_fixed_contributions": 53_658,
+        "ip_extra_rate": 0.01,
+        "ip_extra_threshold": 300_000,
+        "ip_extra_cap": 300_888,
+        "usn_income_rate": 0.06,
+        "usn_profit_rate": 0.15,
+        "usn_min_tax_rate": 0.01,
+        "usn_increased_threshold": None,
+        "usn_increased_income_rate": None,
+        "usn_increased_profit_rate": None,
+        "usn_limit": 450_000_000,
+        "usn_vat_threshold": 60_000_000,
+        "psn_rate": 0.06,
+        "psn_limit": 60_000_000,
+        "ndfl_brackets": [
+            (2_400_000, 0.13), (5_000_000, 0.15), (20_000_000, 0.18), (50_000_000, 0.20), (None, 0.22)
+        ],
+        "ndfl_professional_deduction": 0.20,
+    },
+    2026: {
+        "ip_fixed_contributions": 57_390,
+        "ip_extra_rate": 0.01,
+        "ip_extra_threshold": 300_000,
+        "ip_extra_cap": 321_818,
+        "usn_income_rate": 0.06,
+        "usn_profit_rate": 0.15,
+        "usn_min_tax_rate": 0.01,
+        "usn_increased_threshold": None,
+        "usn_increased_income_rate": None,
+        "usn_increased_profit_rate": None,
+        "usn_limit": 490_500_000,
+        "usn_vat_threshold": 20_000_000,
+        "psn_rate": 0.06,
+        "psn_limit": 60_000_000,
+        "ndfl_brackets": [
+            (2_400_000, 0.13), (5_000_000, 0.15), (20_000_000, 0.18), (50_000_000, 0.20), (None, 0.22)
+        ],
+        "ndfl_professional_deduction": 0.20,
+    },
+}
+
+REGIME_LABELS = {
+    "usn_6": "УСН 6% (доходы)",
+    "usn_15": "УСН 15% (доходы минус расходы)",
+    "psn": "ПСН (патент)",
+    "ndfl": "ОСН (НДФЛ ИП)",
+}
+
+_REGIME_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ("usn_15", re.compile(r"15\s*%|доходы\s*минус\s*расходы|д-р", re.IGNORECASE)),
+    ("usn_6", re.compile(r"\b6\s*%|усн\s*[«\"]?доходы(?!\s*минус)", re.IGNORECASE)),
+    ("psn", re.compile(r"псн|патент", re.IGNORECASE)),
+    ("ndfl", re.compile(r"\bосн\b|ндфл|общ\w*\s+систем", re.IGNORECASE)),
+]
+_USN_RE = re.compile(r"усн|упрощ", re.IGNORECASE)
+_CALC_RE = re.compile(
+    r"рассчита|посчита|расч[её]т|сколько|какой\s+налог|какую\s+сумму|сравни|выгодн", re.IGNORECASE
+)
+_EXPLAIN_RE = re.compile(
+    r"почему|объясни|как\s+(перейти|оформить|подать|сдать|получить|открыть)|срок|отч[её]тн|"
+    r"декларац|можно\s+ли|штраф|льгот|вычет",
+    re.IGNORECASE
+)
+_AMOUNT_RE = re.compile(
+    r"(?P<number>\d{1,3}(?:[  ]\d{3})+(?:[.,]\d+)?|\d+(?:[.,]\d+)?)\s*"
+    r"(?P<unit>млрд|млн|миллион\w*|мил\b|тыс\w*|[mм]\b|[kк]\b)?\.?"
+    r"(?!\s*%)",
+    re.IGNORECASE
+)
+_COMPARE_RE = re.compile(r"сравн|выгодн|оптимальн|какой\s+режим", re.IGNORECASE)
+_REVENUE_KEYWORDS = re.compile(r"выручк|доход|оборот|revenue", re.IGNORECASE)
+_EXPENSE_KEYWORDS = re.compile(r"расход|затрат", re.IGNORECASE)
+_YEAR_RE = re.compile(
+    r"(?<![\d.,])(?P<year>20\d{2})(?=\s*(?:г\.|г\b|год))|"
+    r"\b(?:за|в|на)\s+(?P<bare>20\d{2})(?![\d.,])(?!\s*(?:руб|₽|тыс|млн|р\b))",
+    re.IGNORECASE
+)
+_UNIT_MULTIPLIERS = {"млрд": 1e9, "млн": 1e6, "миллион": 1e6, "мил": 1e6, "m": 1e6, "м": 1e6,
+                     "тыс": 1e3, "k": 1e3, "к": 1e3}
+
+
+def get_rate_table(year: Optional[int] = None) -> Tuple[int, dict]:
+    """Rate table for a year, falling back to the latest earlier version"""
+    year = year or date.today().year
+    versions = sorted(RATE_TABLES)
+    eligible = [v for v in versions if v <= year] or versions[:1]
+    version = eligible[-1]
+    return version, RATE_TABLES[version]
+
+
+def _progressive(base: np.ndarray, brackets: Sequence[Tuple[Optional[float], float]]) -> np.ndarray:
+    """Progressive tax over brackets of (upper bound, rate)"""
+    tax = np.zeros_like(base)
+    lower = 0.0
+    for upper, rate in brackets:
+        top = np.inf if upper is None else upper
+        tax += rate * np.clip(base - lower, 0, top - lower)
+        lower = top
+    return tax
+
+
+def _ip_contributions(income_base: np.ndarray, rates: dict) -> np.ndarray:
+    """Fixed contributions plus 1% over the threshold, capped"""
+    extra = np.minimum(
+        rates["ip_extra_rate"] * np.maximum(income_base - rates["ip_extra_threshold"], 0),
+        rates["ip_extra_cap"]
+    )
+    return rates["ip_fixed_contributions"] + extra
+
+
+def _usn_income(revenue, rates, is_ip, has_employees):
+    contributions = _ip_contributions(revenue, rates) if is_ip else np.zeros_like(revenue)
+    threshold = rates["usn_increased_threshold"]
+    tax = rates["usn_income_rate"] * revenue
+    if threshold:
+        excess = np.maximum(revenue - threshold, 0)
+        tax += (rates["usn_increased_income_rate"] - rates["usn_income_rate"]) * excess
+    reduction = contributions if (is_ip and not has_employees) else np.minimum(contributions, tax * 0.5)
+    tax = np.maximum(tax - reduction, 0)
+    return tax, contributions, revenue <= rates["usn_limit"]
+
+
+def _usn_profit(revenue, expenses, rates, is_ip, has_employees):
+    profit = np.maximum(revenue - expenses, 0)
+    contributions = _ip_contributions(profit, rates) if is_ip else np.zeros_like(revenue)
+    base = np.maximum(profit - contributions, 0)
+    tax = rates["usn_profit_rate"] * base
+    threshold = rates["usn_increased_threshold"]
+    if threshold:
+        share_over = np.divide(
+            np.maximum(revenue - threshold, 0), revenue,
+            out=np.zeros_like(revenue), where=revenue > 0
+        )
+        tax += (rates["usn_increased_profit_rate"] - rates["usn_profit_rate"]) * base * share_over
+    tax = np.maximum(tax, rates["usn_min_tax_rate"] * revenue)
+    return tax, contributions, revenue <= rates["usn_limit"]
+
+
+def _psn(revenue, potential_income, rates, has_employees):
+    contributions = _ip_contributions(potential_income, rates)
+    tax = rates["psn_rate"] * potential_income
+    reduction = contributions if not has_employees else np.minimum(contributions, tax * 0.5)
+    tax = np.maximum(tax - reduction, 0)
+    return tax, contributions, revenue <= rates["psn_limit"]
+
+
+def _ndfl(revenue, expenses, rates):
+    deductions = np.where(
+        np.isnan(expenses), revenue * rates["ndfl_professional_deduction"], expenses
+    )
+    profit = np.maximum(revenue - deductions, 0)
+    contributions = _ip_contributions(profit, rates)
+    tax = _progressive(np.maximum(profit - contributions, 0), rates["ndfl_brackets"])
+    return tax, contributions, np.ones_like(revenue, dtype=bool)
+
+
+def calculate(
+    revenue,
+    expenses=None,
+    regimes: Optional[Sequence[str]] = None,
+    business_type: Optional[str] = None,
+    has_employees: bool = False,
+    patent_potential_income: Optional[float] = None,
+    year: Optional[int] = None
+) -> dict:
+    """Compute tax and contributions for every regime and revenue scenario in one pass"""
+    version, rates = get_rate_table(year)
+    revenue = np.atleast_1d(np.asarray(revenue, dtype=np.float64))
+    if expenses is None:
+        expenses = np.full_like(revenue, np.nan)
+    else:
+        expenses = np.broadcast_to(np.asarray(expenses, dtype=np.float64), revenue.shape).copy()
+    is_ip = not (business_type and re.search(r"ооо|llc|организац", business_type, re.IGNORECASE))
+
+    requested = list(regimes) if regimes else list(REGIME_LABELS)
+    notes: List[str] = []
+    results: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    for regime in requested:
+        if regime == "usn_6":
+            results[regime] = _usn_income(revenue, rates, is_ip, has_employees)
+        elif regime == "usn_15":
+            if np.isnan(expenses).all():
+                notes.append("Для УСН 15% нужны расходы: укажите их, чтобы получить расчёт.")
+                continue
+            results[regime] = _usn_profit(revenue, np.nan_to_num(expenses), rates, is_ip, has_employees)
+        elif regime == "psn":
+            if not is_ip:
+                notes.append("ПСН доступна только для ИП.")
+                continue
+            if not patent_potential_income:
+                notes.append(
+                    "Стоимость патента зависит от региона и вида деятельности: "
+                    "укажите потенциально возможный доход, чтобы рассчитать ПСН."
+                )
+                continue
+            potential = np.full_like(revenue, float(patent_potential_income))
+            results[regime] = _psn(revenue, potential, rates, has_employees)
+        elif regime == "ndfl":
+            if not is_ip:
+                notes.append("Для ООО на ОСН уплачивается налог на прибыль, а не НДФЛ.")
+                continue
+            results[regime] = _ndfl(revenue, expenses, rates)
+
+    if not is_ip:
+        notes.append("Страховые взносы за работников ООО в расчёт не включены.")
+    if np.isnan(expenses).all() and "ndfl" in results:
+        notes.append("Для ОСН применён профессиональный вычет 20% (расходы не указаны).")
+    if rates["usn_vat_threshold"] and (revenue > rates["usn_vat_threshold"]).any():
+        notes.append(
+            f"При доходе свыше {_money(rates['usn_vat_threshold'])} на УСН возникает обязанность "
+            f"по НДС (5%, 7% или 20%); НДС в расчёт не включён."
+        )
+    if "ndfl" in results:
+        notes.append("На ОСН дополнительно уплачивается НДС 20%; в расчёт не включён.")
+
+    names = list(results)
+    if names:
+        totals = np.stack([results[n][0] + results[n][1] for n in names])
+        available = np.stack([results[n][2] for n in names])
+        masked = np.where(available, totals, np.inf)
+        best = masked.argmin(axis=0)
+    scenarios = []
+    for i in range(revenue.size):
+        regimes_out = {}
+        for j, name in enumerate(names):
+            tax, contributions, ok = results[name]
+            total = tax[i] + contributions[i]
+            regimes_out[name] = {
+                "label": REGIME_LABELS[name],
+                "available": bool(ok[i]),
+                "tax": round(float(tax[i]), 2),
+                "contributions": round(float(contributions[i]), 2),
+                "total": round(float(total), 2),
+                "effective_rate_pct": round(float(total / revenue[i] * 100), 2) if revenue[i] else None,
+            }
+        best_name = names[best[i]] if names and np.isfinite(masked[best[i], i]) else None
+        scenarios.append({
+            "revenue": round(float(revenue[i]), 2),
+            "expenses": None if np.isnan(expenses[i]) else round(float(expenses[i]), 2),
+            "regimes": regimes_out,
+            "best_regime": best_name,
+        })
+
+    return {
+        "rates_version": version,
+        "business_type": "ИП" if is_ip else "ООО",
+        "scenarios": scenarios,
+        "notes": notes,
+    }
+
+
+def detect_regimes(*texts: Optional[str]) -> Optional[List[str]]:
+    """Regimes mentioned in the request, or None to compare all of them"""
+    text = " ".join(t for t in texts if t)
+    found = [name for name, pattern in _REGIME_PATTERNS if pattern.search(text)]
+    if _USN_RE.search(text) and not {"usn_6", "usn_15"} & set(found):
+        found.extend(["usn_6", "usn_15"])
+    return found or None
+
+
+def select_regimes(question: str, tax_regime: Optional[str] = None) -> Optional[List[str]]:
+    """Regimes from the question first, then from the declared regime unless a comparison is asked"""
+    regimes = detect_regimes(question)
+    if regimes or _COMPARE_RE.search(question):
+        return regimes
+    return detect_regimes(tax_regime)
+
+
+def _parse_amount(match: re.Match) -> float:
+    number = float(re.sub(r"[  ]", "", match.group("number")).replace(",", "."))
+    unit = (match.group("unit") or "").lower()
+    for prefix, multiplier in _UNIT_MULTIPLIERS.items():
+        if unit.startswith(prefix):
+            return number * multiplier
+    return number
+
+
+def extract_amount(text: str, keywords: re.Pattern) -> Optional[float]:
+    """First money amount that follows one of the keywords"""
+    for keyword in keywords.finditer(text):
+        tail = text[keyword.end():keyword.end() + 40]
+        for match in _AMOUNT_RE.finditer(tail):
+            amount = _parse_amount(match)
+            if amount >= 1000:
+                return amount
+    return None
+
+
+def extract_revenue(text: str) -> Optional[float]:
+    """Revenue mentioned in free text ("3,2 млн", "выручка 3 200 000 руб.")"""
+    amount = extract_amount(text, _REVENUE_KEYWORDS)
+    if amount is not None:
+        return amount
+    for match in _AMOUNT_RE.finditer(text):
+        start = match.start()
+        if _EXPENSE_KEYWORDS.search(text[max(0, start - 25):start]):
+            continue
+        amount = _parse_amount(match)
+        if amount >= 10_000 and not (match.group("unit") is None and 1990 <= amount <= 2100):
+            return amount
+    return None
+
+
+def extract_expenses(text: str) -> Optional[float]:
+    return extract_amount(text, _EXPENSE_KEYWORDS)
+
+
+def extract_year(text: str) -> Optional[int]:
+    """Tax year named in free text ("за 2024 год", "в 2025 г.")"""
+    match = _YEAR_RE.search(text)
+    return int(match.group("year") or match.group("bare")) if match else None
+
+
+def has_rates(year: Optional[int]) -> bool:
+    """False for years before the earliest rate table (get_rate_table would use later rates)"""
+    return year is None or year >= min(RATE_TABLES)
+
+
+def is_pure_calculation(question: str) -> bool:
+    """True for questions that only ask to compute amounts"""
+    return bool(_CALC_RE.search(question)) and not _EXPLAIN_RE.search(question)
+
+
+def _money(value: float) -> str:
+    return f"{value:,.0f}".replace(",", " ") + " руб."
+
+
+def format_calculations(calculations: dict) -> str:
+    """Human-readable answer built from calculation results"""
+    lines = [
+        f"Расчёт налоговой нагрузки для {calculations['business_type']} "
+        f"(ставки {calculations['rates_version']} г.):"
+    ]
+    for scenario in calculations["scenarios"]:
+        header = f"\nВыручка: {_money(scenario['revenue'])}"
+        if scenario["expenses"] is not None:
+            header += f", расходы: {_money(scenario['expenses'])}"
+        lines.append(header)
+        for name, regime in scenario["regimes"].items():
+            if not regime["available"]:
+                lines.append(f"• {regime['label']}: недоступен при такой выручке")
+                continue
+            lines.append(
+                f"• {regime['label']}: налог {_money(regime['tax'])}, "
+                f"взносы {_money(regime['contributions'])}, итого {_money(regime['total'])}"
+                + (f" ({regime['effective_rate_pct']}% от выручки)"
+                   if regime["effective_rate_pct"] is not None else "")
+            )
+        if scenario["best_regime"] and len(scenario["regimes"]) > 1:
+            lines.append(f"Наименьшая нагрузка: {scenario['regimes'][scenario['best_regime']]['label']}")
+    if calculations["notes"]:
+        lines.append("\nПримечания:")
+        lines.extend(f"- {note}" for note in calculations["notes"])
+    return "\n".join(lines)
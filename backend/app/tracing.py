@@ -0,0 +1,222 @@
+"""
+Lightweight per-request tracing with a local JSONL exporter
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "X-Trace-Id"
+
+
+class Span:
+    """Timed operation inside a trace"""
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], start: Optional[float] = None, **attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = start if start is not None else time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        trace.spans.append(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, end: Optional[float] = None):
+        self.end = end if end is not None else time.time()
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end is None else round((self.end - self.start) * 1000, 3)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stand-in for spans of unsampled traces"""
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """All spans of one request"""
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[Span] = []
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def to_dict(self) -> dict:
+        breakdown: Dict[str, float] = {}
+        for span in self.spans[1:]:
+            if span.duration_ms is not None:
+                breakdown[span.name] = round(breakdown.get(span.name, 0) + span.duration_ms, 3)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": self.root.start,
+            "duration_ms": self.root.duration_ms,
+            "attributes": self.root.attributes,
+            "breakdown_ms": breakdown,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Creates spans, samples traces and exports finished ones"""
+
+    def __init__(self, sample_rate: float, export_path: Optional[str], buffer_size: int):
+        self.sample_rate = sample_rate
+        self.export_path = export_path
+        self.recent: deque = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    def start_trace(self, name: str, **attributes) -> Span:
+        """Open the root span of a new trace and make it current"""
+        trace = Trace(uuid.uuid4().hex, random.random() < self.sample_rate)
+        root = Span(trace, name, None, **attributes)
+        _current_span.set(root)
+        return root
+
+    def finish_trace(self, root: Span):
+        root.finish()
+        _current_span.set(None)
+        if not root.trace.sampled:
+            return
+        data = root.trace.to_dict()
+        self.recent.append(data)
+        if self.export_path:
+            try:
+                with self._lock, open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.error(f"Trace export failed: {e}")
+
+    def current_trace_id(self) -> Optional[str]:
+        span = _current_span.get()
+        return span.trace.trace_id if span else None
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator:
+        """Child span of the current span; no-op outside a sampled trace"""
+        parent = _current_span.get()
+        if parent is None or not parent.trace.sampled:
+            yield NOOP_SPAN
+            return
+        span = Span(parent.trace, name, parent.span_id, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(token)
+
+    def add_span(self, name: str, start: float, duration: float, **attributes):
+        """Record an already finished child span (e.g. timings reported by Ollama)"""
+        parent = _current_span.get()
+        if parent is None or not parent.trace.sampled:
+            return
+        span = Span(parent.trace, name, parent.span_id, start=start, **attributes)
+        span.finish(start + duration)
+
+    def record_llm_timings(self, result: dict, started: float):
+        """Split an Ollama response into load / prompt eval / generation spans"""
+        cursor = started
+        for name, duration_key, count_key in (
+            ("llm.load", "load_duration", None),
+            ("llm.prompt_eval", "prompt_eval_duration", "prompt_eval_count"),
+            ("llm.eval", "eval_duration", "eval_count"),
+        ):
+            duration = result.get(duration_key)
+            if not duration:
+                continue
+            attributes = {"tokens": result.get(count_key)} if count_key else {}
+            self.add_span(name, cursor, duration / 1e9, **attributes)
+            cursor += duration / 1e9
+
+    def slowest(self, limit: int = 10) -> List[dict]:
+        traces = sorted(self.recent, key=lambda t: t["duration_ms"] or 0, reverse=True)
+        return traces[:limit]
+
+
+tracer = Tracer(settings.TRACE_SAMPLE_RATE, settings.TRACE_EXPORT_PATH, settings.TRACE_BUFFER_SIZE)
+
+
+class TraceMiddleware:
+    """Root span per HTTP request, finished after the last body chunk is sent
+
+    A plain ASGI middleware: the wrapped app returns only once a streaming
+    body has been fully sent, so spans of streamed LLM calls land in the trace.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        root = tracer.start_trace(f"{scope['method']} {scope['path']}")
+
+        async def send_with_trace_id(message: Message):
+            if message["type"] == "http.response.start":
+                root.set(status_code=message["status"])
+                MutableHeaders(scope=message).append(TRACE_HEADER, root.trace.trace_id)
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            tracer.finish_trace(root)
+
+
+def instrument_engine(engine):
+    """Trace every SQL statement executed through the engine"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._trace_start = time.time()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = context._trace_start
+        tracer.add_span("db.query", start, time.time() - start, statement=statement[:200])
@@ -0,0 +1,144 @@
+"""
+Sampled capture of LLM traffic for offline replay (see app/replay.py)
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+
+One compact JSON line per captured LLM call:
+    {"ts":1717000000.5,"source":"summary","mode":"summary","model":"llama3",
+     "system_hash":"3f2a9c1e","messages":[...],"overrides":{...},"stream":false,
+     "prompt_tokens":812,"completion_tokens":240,"ttft":1.9,"total":7.4,"done_reason":"stop"}
+
+Messages are anonymized before writing: e-mails, phone numbers, long digit
+runs (INN, OGRN, accounts, cards, passports), personal names ("Иванов И.И.", "Иван
+Иванович"), company names after ООО/АО/ИП and address parts (city, street,
+building, flat, postcode) are masked with placeholders of about the same
+length ("Хххххх Х.Х.", zeros for digits), so token counts stay comparable.
+Markers such as "ООО", "ИП" and "ул." are kept, so the text stays readable.
+Other free text is kept as is.
+
+"ttft" is model load + prompt evaluation as reported by Ollama, for streaming
+and non-streaming calls alike; app/replay.py measures replays the same way.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+from typing import Dict, List, Optional
+from app.config import settings
+from app.usage import current_source
+
+logger = logging.getLogger(__name__)
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PHONE = re.compile(r"(?<!\d)(?:\+7|8)[\s(-]*\d{3}[\s)-]*\d{3}[\s-]*\d{2}[\s-]*\d{2}(?!\d)")
+_CARD = re.compile(r"(?<!\d)\d{4}(?:[ -]\d{4}){3}(?!\d)")
+_LONG_NUMBER = re.compile(r"(?<!\d)\d{10,}(?!\d)")
+_PASSPORT = re.compile(r"(?<!\d)\d{2}\s?\d{2}\s\d{6}(?!\d)")
+
+_WORD = r"[А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?"
+_PATRONYMIC = r"[А-ЯЁ][а-яё]+(?:ович|евич|ьич|овна|евна|ична|инична)\b"
+_INITIALS = r"[А-ЯЁ]\.\s?[А-ЯЁ]\."
+# Order matters: company and sole-trader names before bare personal names
+_ORGANIZATION = re.compile(r"\b(?:ООО|ОАО|ЗАО|ПАО|НАО|АО|НКО|ТОО)\s*[«\"„](?P<value>[^»\"“]{1,80})[»\"“]")
+_SOLE_TRADER = re.compile(rf"\bИП\s+(?P<value>{_WORD}(?:\s+{_INITIALS}|(?:\s+{_WORD}){{0,2}}))")
+_PERSON = re.compile(
+    rf"\b(?P<value>{_INITIALS}\s?{_WORD}|{_WORD}\s+{_INITIALS}(?!\s?[А-ЯЁ][а-яё])"
+    rf"|{_WORD}\s+{_WORD}\s+{_PATRONYMIC}|{_WORD}\s+{_PATRONYMIC}(?:\s+{_WORD})?)"
+)
+_PLACE = re.compile(
+    r"(?<![\w.])(?:г\.|город|ул\.|улица|пр-т|проспект|пер\.|переулок|наб\.|набережная|ш\.|шоссе|б-р|бульвар|пл\.)"
+    rf"\s*(?P<value>{_WORD}(?:\s+{_WORD})*)"
+)
+_BUILDING = re.compile(r"(?<![\w.])(?:д\.|дом|корп\.|стр\.|кв\.|оф\.|офис)\s*(?P<value>\d+[а-яА-Я]?(?:/\d+)?)")
+_POSTCODE = re.compile(r"(?<!\d)\d{6}(?=,?\s*(?:г\.|город))")
+
+
+def _zero_digits(match: re.Match) -> str:
+    return re.sub(r"\d", "0", match.group(0))
+
+
+def _mask_value(match: re.Match) -> str:
+    """Replace letters and digits of the `value` group, keeping case, length and the marker before it"""
+    value = re.sub(r"[А-ЯЁA-Z]", "Х", match.group("value"))
+    value = re.sub(r"[а-яёa-z]", "х", value)
+    value = re.sub(r"\d", "0", value)
+    start, end = match.span("value")
+    offset = match.start()
+    text = match.group(0)
+    return text[:start - offset] + value + text[end - offset:]
+
+
+def anonymize(text: str) -> str:
+    """Mask personal data, keeping the text length about the same"""
+    text = _EMAIL.sub("user@example.com", text)
+    text = _PHONE.sub(_zero_digits, text)
+    text = _CARD.sub(_zero_digits, text)
+    text = _LONG_NUMBER.sub(_zero_digits, text)
+    text = _PASSPORT.sub(_zero_digits, text)
+    text = _POSTCODE.sub(_zero_digits, text)
+    for pattern in (_ORGANIZATION, _SOLE_TRADER, _PERSON, _PLACE, _BUILDING):
+        text = pattern.sub(_mask_value, text)
+    return text
+
+
+def system_hash(system_prompt: str) -> str:
+    """Short fingerprint telling replays whether the system prompt changed since capture"""
+    return hashlib.sha1((system_prompt or "").encode("utf-8")).hexdigest()[:8]
+
+
+class TrafficCapture:
+    """Appends a sample of LLM calls to CAPTURE_PATH; disabled when the path is not set"""
+    
+    def __init__(self, path: Optional[str], sample_rate: float):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.captured = 0
+        self._lock = threading.Lock()
+    
+    def sampled(self) -> bool:
+        """Decide up front whether to capture a call (so nothing is built for the rest)"""
+        return bool(self.path) and random.random() < self.sample_rate
+    
+    def record(
+        self,
+        mode: str,
+        model: str,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        overrides: Optional[dict],
+        result: dict,
+        stream: bool,
+        started_at: float,
+        context_reuse: bool = False
+    ):
+        """Write one finished call, stamped with when it arrived (before queueing); never raises"""
+        load = (result.get("load_duration") or 0) / 1e9
+        prompt_eval = (result.get("prompt_eval_duration") or 0) / 1e9
+        record = {
+            "ts": round(started_at, 3),
+            "source": current_source(),
+            "mode": mode,
+            "model": result.get("model") or model,
+            "system_hash": system_hash(system_prompt),
+            "messages": [{"role": m["role"], "content": anonymize(m["content"])} for m in messages],
+            "overrides": overrides or {},
+            "stream": stream,
+            "context_reuse": context_reuse,
+            "prompt_tokens": result.get("prompt_eval_count"),
+            "completion_tokens": result.get("eval_count"),
+            "ttft": round(load + prompt_eval, 3),
+            "total": round((result.get("total_duration") or 0) / 1e9, 3),
+            "done_reason": result.get("done_reason"),
+        }
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.captured += 1
+        except OSError as e:
+            logger.error(f"Traffic capture failed: {e}")
+
+
+traffic_capture = TrafficCapture(settings.CAPTURE_PATH, settings.CAPTURE_SAMPLE_RATE)
@@ -0,0 +1,304 @@
+"""
+Streaming NDJSON export and import of conversations and messages
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+
+Format: one JSON object per line, all conversations first, then all messages:
+    {"type": "conversation", "id": 1, "user_id": "default_user", "created_at": "..."}
+    {"type": "message", "id": 1, "conversation_id": 1, "role": "user", ...}
+
+CLI:
+    python -m app.transfer export <file.ndjson[.gz]>
+    python -m app.transfer import <file.ndjson[.gz]>
+"""
+import json
+import logging
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+from sqlalchemy import DateTime, func, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+from app.db import engine, init_db
+from app.models import Conversation, Message
+from app.search import is_supported, pause_index, resume_index
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+COMMIT_EVERY = 50000
+GZIP_MAGIC = b"\x1f\x8b"
+DECOMPRESS_STEP = 1 << 20
+
+TABLES = {
+    "conversation": Conversation.__table__,
+    "message": Message.__table__,
+}
+
+
+def _encode(kind: str, row: dict) -> bytes:
+    """Serialize a row, leaving out NULL columns to keep lines short"""
+    record = {"type": kind}
+    for key, value in row.items():
+        if value is not None:
+            record[key] = value.isoformat() if isinstance(value, datetime) else value
+    return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def iter_export(compress: bool = False) -> Iterator[bytes]:
+    """Yield NDJSON chunks using a server-side cursor; memory stays flat"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31: gzip container
+    with engine.connect() as conn:
+        for kind, table in TABLES.items():
+            result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(
+                select(table).order_by(table.c.id)
+            )
+            for partition in result.mappings().partitions():
+                chunk = b"".join(_encode(kind, row) for row in partition)
+                yield compressor.compress(chunk) if compressor else chunk
+    if compressor:
+        yield compressor.flush()
+
+
+class ImportFailed(Exception):
+    """Bad or conflicting import data; rows committed before it stay in the database"""
+
+    def __init__(self, line: int, reason: str, committed: Optional[Dict[str, int]] = None):
+        super().__init__(f"line {line}: {reason}")
+        self.line = line
+        self.reason = reason
+        self.committed = committed or {kind: 0 for kind in TABLES}
+
+
+def _build_row(kind: str, record: dict) -> dict:
+    """Every column bound (NULL when omitted), so a batch is a single executemany"""
+    row = {}
+    for column in TABLES[kind].columns:
+        value = record.get(column.name)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        row[column.name] = value
+    if row["id"] is not None and not isinstance(row["id"], int):
+        raise ValueError(f"id must be an integer, got {row['id']!r}")
+    if kind == "message" and not isinstance(row["conversation_id"], int):
+        raise ValueError("message needs an integer conversation_id")
+    return row
+
+
+class NDJSONReader:
+    """Splits raw (optionally gzip-compressed) byte chunks into JSON records"""
+
+    def __init__(self):
+        self.line_number = 0
+        self._decompressor = None
+        self._started = False
+        self._pending = b""
+
+    def feed(self, chunk: bytes):
+        if not self._started:
+            self._started = True
+            if chunk.startswith(GZIP_MAGIC):
+                self._decompressor = zlib.decompressobj(wbits=31)
+        if not self._decompressor:
+            self._add_text(chunk)
+            return
+        # Bounded output per step: highly compressible input must not inflate in one go
+        while chunk:
+            try:
+                data = self._decompressor.decompress(chunk, DECOMPRESS_STEP)
+            except zlib.error as e:
+                raise ImportFailed(self.line_number + 1, f"Invalid gzip data: {e}")
+            self._add_text(data)
+            chunk = self._decompressor.unconsumed_tail
+
+    def _add_text(self, data: bytes):
+        *lines, self._pending = (self._pending + data).split(b"\n")
+        for line in lines:
+            self._add_line(line)
+
+    def _read_tail(self):
+        if self._decompressor:
+            try:
+                self._pending += self._decompressor.flush()
+            except zlib.error as e:
+                raise ImportFailed(self.line_number + 1, f"Invalid gzip data: {e}")
+        for line in self._pending.split(b"\n"):
+            self._add_line(line)
+        self._pending = b""
+
+    def _add_line(self, line: bytes):
+        self.line_number += 1
+        line = line.strip()
+        if not line:
+            return
+        try:
+            record = json.loads(line)
+            kind = record.pop("type", None)
+            if kind not in TABLES:
+                raise ValueError(f"Unknown record type: {kind}")
+            self._add_record(kind, record)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ImportFailed(self.line_number, str(e) or type(e).__name__)
+
+    def _add_record(self, kind: str, record: dict):
+        raise NotImplementedError
+
+
+class IdScanner(NDJSONReader):
+    """Validates every record and finds the largest id per type, without touching the database"""
+
+    def __init__(self):
+        super().__init__()
+        self.max_ids = {kind: 0 for kind in TABLES}
+
+    def close(self) -> Dict[str, int]:
+        self._read_tail()
+        return self.max_ids
+
+    def _add_record(self, kind: str, record: dict):
+        row = _build_row(kind, record)
+        if row["id"] is not None:
+            self.max_ids[kind] = max(self.max_ids[kind], row["id"])
+
+
+class NDJSONImporter(NDJSONReader):
+    """Incremental importer fed with raw (optionally gzip-compressed) byte chunks
+
+    Rows are inserted in batches of BATCH_SIZE and committed every
+    COMMIT_EVERY rows. Ids are shifted past the current maximum of each
+    table (or by the given offsets, e.g. a range reserved from the
+    conversation cache), so an empty database keeps the original ids and a
+    non-empty one gets the import appended without conflicts. The full-text
+    index is updated once at the end instead of by a trigger per row.
+    """
+
+    def __init__(self, conn: Connection, offsets: Optional[Dict[str, int]] = None):
+        super().__init__()
+        self.conn = conn
+        self._transaction = conn.begin()
+        self.offsets = {
+            kind: conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+            for kind, table in TABLES.items()
+        }
+        self.offsets.update(offsets or {})
+        self._search = is_supported(conn.engine)
+        if self._search:
+            pause_index(conn)
+        self.counts = {kind: 0 for kind in TABLES}
+        self.committed = dict(self.counts)
+        self._batches: Dict[str, List[dict]] = {kind: [] for kind in TABLES}
+        self._uncommitted = 0
+
+    def close(self) -> Dict[str, int]:
+        """Import the trailing line, flush batches and commit; returns row counts"""
+        self._read_tail()
+        for kind in TABLES:
+            self._flush(kind)
+        self._finish()
+        return self.counts
+
+    def abort(self):
+        """Roll back the open batch; batches committed earlier stay and get indexed"""
+        self._transaction.rollback()
+        self._transaction = self.conn.begin()
+        self._finish()
+
+    def _finish(self):
+        if self._search:
+            resume_index(self.conn, self.offsets["message"])
+        self._transaction.commit()
+
+    def _add_record(self, kind: str, record: dict):
+        row = _build_row(kind, record)
+        if row["id"] is not None:
+            row["id"] += self.offsets[kind]
+        if kind == "message":
+            row["conversation_id"] += self.offsets["conversation"]
+            # Conversations precede messages in the stream; write them before the first message
+            self._flush("conversation")
+        batch = self._batches[kind]
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            self._flush(kind)
+
+    def _flush(self, kind: str):
+        batch = self._batches[kind]
+        if not batch:
+            return
+        self.conn.execute(insert(TABLES[kind]), batch)
+        self.counts[kind] += len(batch)
+        self._uncommitted += len(batch)
+        self._batches[kind] = []
+        if self._uncommitted >= COMMIT_EVERY:
+            self._transaction.commit()
+            self._transaction = self.conn.begin()
+            self._uncommitted = 0
+            self.committed = dict(self.counts)
+
+
+def scan_ids(chunks: Iterable[bytes]) -> Dict[str, int]:
+    """Largest id per record type in an export; raises ImportFailed on the first bad line"""
+    scanner = IdScanner()
+    for chunk in chunks:
+        scanner.feed(chunk)
+    return scanner.close()
+
+
+def import_chunks(chunks: Iterable[bytes], offsets: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """Import an iterable of NDJSON byte chunks in one pass
+    
+    On failure the open batch is rolled back; ImportFailed carries the line
+    reached and the row counts committed before it.
+    """
+    with engine.connect() as conn:
+        importer = NDJSONImporter(conn, offsets)
+        try:
+            for chunk in chunks:
+                importer.feed(chunk)
+            return importer.close()
+        except ImportFailed as e:
+            importer.abort()
+            e.committed = importer.committed
+            raise
+        except IntegrityError as e:
+            importer.abort()
+            raise ImportFailed(
+                importer.line_number, f"Conflicts with existing data: {e.orig}", importer.committed
+            ) from e
+        except Exception:
+            importer.abort()
+            raise
+
+
+def read_chunks(f: BinaryIO) -> Iterator[bytes]:
+    """Read an open binary file from the start in 1 MB chunks"""
+    f.seek(0)
+    while True:
+        chunk = f.read(1 << 20)
+        if not chunk:
+            return
+        yield chunk
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        print("Usage: python -m app.transfer export|import <file.ndjson[.gz]>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    command, path = sys.argv[1], sys.argv[2]
+    started = time.monotonic()
+    if command == "export":
+        with open(path, "wb") as out:
+            for chunk in iter_export(compress=path.endswith(".gz")):
+                out.write(chunk)
+        print(f"Exported to {path} in {time.monotonic() - started:.1f}s")
+    else:
+        with open(path, "rb") as f:
+            counts = import_chunks(read_chunks(f))
+        print(
+            f"Imported {counts['conversation']} conversations and {counts['message']} messages "
+            f"in {time.monotonic() - started:.1f}s"
+        )
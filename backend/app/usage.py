@@ -0,0 +1,153 @@
+"""
+Per-call LLM generation statistics and hourly usage rollups
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Iterator, List, NamedTuple, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from app.db import SessionLocal, engine
+from app.models import UseCaseCall, UsageHourly
+
+logger = logging.getLogger(__name__)
+
+STAT_FIELDS = (
+    "prompt_tokens",
+    "completion_tokens",
+    "load_seconds",
+    "prompt_eval_seconds",
+    "eval_seconds",
+    "total_seconds",
+)
+
+_insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+
+
+class GenerationStats(NamedTuple):
+    """Token counts and durations of one LLM call"""
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    load_seconds: float
+    prompt_eval_seconds: float
+    eval_seconds: float
+    total_seconds: float
+
+    @classmethod
+    def from_ollama(cls, result: dict, model: str, elapsed: float) -> "GenerationStats":
+        """Build stats from the final Ollama response (durations are in nanoseconds)"""
+        return cls(
+            model=result.get("model") or model,
+            prompt_tokens=result.get("prompt_eval_count") or 0,
+            completion_tokens=result.get("eval_count") or 0,
+            load_seconds=(result.get("load_duration") or 0) / 1e9,
+            prompt_eval_seconds=(result.get("prompt_eval_duration") or 0) / 1e9,
+            eval_seconds=(result.get("eval_duration") or 0) / 1e9,
+            total_seconds=(result.get("total_duration") or 0) / 1e9 or elapsed,
+        )
+
+
+_source: ContextVar[str] = ContextVar("usage_source", default="api")
+_collector: ContextVar[Optional[List[GenerationStats]]] = ContextVar("usage_collector", default=None)
+
+
+def current_source() -> str:
+    """Use case (or "chat") the current request's LLM calls are attributed to"""
+    return _source.get()
+
+
+class UsageRecorder:
+    """Persists every LLM call and keeps hourly aggregates up to date"""
+
+    def set_source(self, source: str):
+        """Attribute LLM calls of the current request to a use case or to chat"""
+        _source.set(source)
+
+    @contextmanager
+    def collect(self) -> Iterator[List[GenerationStats]]:
+        """Hand calls made inside the block to the caller instead of storing them as use case calls
+
+        Chat uses this to keep stats on the assistant Message row.
+        """
+        calls: List[GenerationStats] = []
+        token = _collector.set(calls)
+        try:
+            yield calls
+        finally:
+            _collector.reset(token)
+
+    async def record(self, stats: GenerationStats, mode: Optional[str]):
+        """Store a finished LLM call off the event loop; never raises"""
+        calls = _collector.get()
+        if calls is not None:
+            calls.append(stats)
+        await run_in_threadpool(self._store, stats, _source.get(), mode or "general", calls is None)
+
+    def _store(self, stats: GenerationStats, source: str, mode: str, as_use_case_call: bool):
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            if as_use_case_call:
+                db.add(UseCaseCall(source=source, mode=mode, created_at=now, **stats._asdict()))
+            self._rollup(db, now, source, mode, stats)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to record LLM usage: {e}")
+        finally:
+            db.close()
+
+    def _rollup(self, db, now: datetime, source: str, mode: str, stats: GenerationStats):
+        """Upsert the call into its hourly bucket"""
+        values = {field: getattr(stats, field) for field in STAT_FIELDS}
+        statement = _insert(UsageHourly).values(
+            hour=now.replace(minute=0, second=0, microsecond=0),
+            source=source,
+            mode=mode,
+            model=stats.model,
+            calls=1,
+            escalations=0,
+            **values
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["hour", "source", "mode", "model"],
+            set_={
+                "calls": UsageHourly.calls + 1,
+                **{field: getattr(UsageHourly, field) + value for field, value in values.items()}
+            }
+        )
+        db.execute(statement)
+
+    async def record_escalation(self, model: str, mode: Optional[str]):
+        """Count a cascade escalation against the small model's hourly bucket; never raises"""
+        await run_in_threadpool(self._store_escalation, model, _source.get(), mode or "general")
+
+    def _store_escalation(self, model: str, source: str, mode: str):
+        db = SessionLocal()
+        try:
+            statement = _insert(UsageHourly).values(
+                hour=datetime.utcnow().replace(minute=0, second=0, microsecond=0),
+                source=source,
+                mode=mode,
+                model=model,
+                calls=0,
+                escalations=1
+            ).on_conflict_do_update(
+                index_elements=["hour", "source", "mode", "model"],
+                set_={"escalations": func.coalesce(UsageHourly.escalations, 0) + 1}
+            )
+            db.execute(statement)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to record escalation: {e}")
+        finally:
+            db.close()
+
+
+usage_recorder = UsageRecorder()
@@ -0,0 +1,53 @@
+"""
+Tests for chat turns that continue Ollama's context
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import asyncio
+import json
+import httpx
+from app.llm_client import LLMClient
+
+SYSTEM_PROMPT = "Ты — помощник для малого бизнеса. " * 50
+
+
+def fake_generate(payloads, prompt_eval_counts):
+    """/api/generate stand-in: evaluates system + prompt (a token per word) on top of the given context"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        payloads.append(body)
+        evaluated = len(body.get("system", "").split()) + len(body["prompt"].split())
+        prompt_eval_counts.append(evaluated)
+        answer = "Короткий ответ"
+        context = (body.get("context") or []) + [0] * (evaluated + len(answer.split()))
+        return httpx.Response(200, json={
+            "model": body["model"],
+            "response": answer,
+            "done": True,
+            "context": context,
+            "prompt_eval_count": evaluated,
+            "eval_count": len(answer.split()),
+        })
+    return handler
+
+
+async def run_turns(client: LLMClient, turns: int):
+    messages, state = [], None
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Вопрос номер {i} про налоги"})
+        answer, state = await client.continue_conversation(SYSTEM_PROMPT, messages, state, mode="general")
+        messages.append({"role": "assistant", "content": answer})
+
+
+def test_reused_turns_evaluate_only_the_new_message():
+    payloads, prompt_eval_counts = [], []
+    client = LLMClient()
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(fake_generate(payloads, prompt_eval_counts)))
+    asyncio.run(run_turns(client, 6))
+    
+    assert "system" in payloads[0] and "context" not in payloads[0]
+    reused = payloads[1:]
+    assert all("context" in p and "system" not in p for p in reused)
+    reused_counts = prompt_eval_counts[1:]
+    assert max(reused_counts) - min(reused_counts) <= 1
+    assert max(reused_counts) < len(SYSTEM_PROMPT.split())
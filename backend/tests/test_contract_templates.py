@@ -0,0 +1,32 @@
+"""
+Tests for contract template matching and clause cleanup
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+from app.contract_templates import _clean_clause, find_template, split_parties
+
+
+def test_find_template_matches_whole_words_only():
+    assert find_template("Договор аренды нежилого помещения") == "rental"
+    assert find_template("lease agreement") == "rental"
+    assert find_template("current account agreement") is None
+    assert find_template("release of claims") is None
+
+
+def test_split_parties_ignores_separators_inside_quotes():
+    assert split_parties("ООО «Иван и партнеры», ИП Петров") == ("ООО «Иван и партнеры»", "ИП Петров")
+    assert split_parties("ООО «Ромашка» и ИП Иванов И.И.") == ("ООО «Ромашка»", "ИП Иванов И.И.")
+
+
+def test_clean_clause_drops_echoed_section_title():
+    text = "1. ПРЕДМЕТ ДОГОВОРА\n1.1. Арендодатель передаёт помещение.\n2) Арендатор принимает помещение."
+    assert _clean_clause(text, 1, "ПРЕДМЕТ ДОГОВОРА") == (
+        "1.1. Арендодатель передаёт помещение.\n1.2. Арендатор принимает помещение."
+    )
+
+
+def test_clean_clause_keeps_uppercase_clause_text():
+    text = "**Предмет договора:**\n1. Ошибка в расчётах исправляется актом.\nНДС НЕ ОБЛАГАЕТСЯ"
+    assert _clean_clause(text, 1, "ПРЕДМЕТ ДОГОВОРА") == (
+        "1.1. Ошибка в расчётах исправляется актом.\n1.2. НДС НЕ ОБЛАГАЕТСЯ"
+    )
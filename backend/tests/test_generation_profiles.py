@@ -0,0 +1,32 @@
+"""
+Tests for fitting prompts into the context window
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+from app.generation_profiles import add_report, current_report, fit_messages, resolve_profile, start_report
+
+
+def test_trimmed_prompt_is_reported():
+    profile = resolve_profile("general", 0, {"num_predict": 200})
+    messages = [
+        {"role": "user", "content": "а" * 20000},
+        {"role": "assistant", "content": "б" * 5000},
+        {"role": "user", "content": "в" * 20000},
+    ]
+    kept, profile = fit_messages("system", messages, profile)
+    assert kept == [messages[-1]]
+    assert profile.trimmed_chars == 25000
+    
+    start_report()
+    add_report(profile, "model", {"eval_count": 10, "done_reason": "stop"})
+    report = current_report()[0]
+    assert report["input_truncated"] is True
+    assert report["input_trimmed_chars"] == 25000
+
+
+def test_prompt_that_fits_is_untouched():
+    profile = resolve_profile("general", 0)
+    messages = [{"role": "user", "content": "Привет"}]
+    kept, fitted = fit_messages("system", messages, profile)
+    assert kept == messages
+    assert fitted.trimmed_chars == 0
@@ -0,0 +1,50 @@
+"""
+Tests for the cascade quality check on realistic model answers
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+from app.model_router import check_quality
+from app.routers.usecases import COMPANY_SECTIONS, FINANCE_SECTIONS, SUMMARY_SECTIONS
+
+FINANCE_ANSWER = """1. Краткий анализ
+Выручка выросла на 12%, расходы на аренду — самая крупная статья.
+
+2. Список рекомендаций по улучшению финансового состояния
+- Пересмотреть договор аренды или найти помещение дешевле
+- Ввести предоплату для новых клиентов
+
+3. Возможные риски
+- Кассовый разрыв в марте из-за сезонного спада
+- Зависимость от одного крупного клиента"""
+
+SUMMARY_ANSWER = """1. Краткое резюме основных моментов
+Обсудили запуск акции и бюджет на рекламу.
+
+2. Список задач
+- Подготовить макеты баннеров (Анна)
+- Согласовать бюджет с бухгалтерией
+
+3. Следующие шаги
+- Запустить рекламу 1 марта
+- Подвести итоги через две недели"""
+
+COMPANY_ANSWER = """1. Основная информация
+ООО «Ромашка», ИНН 7707083893.
+
+5. Рекомендации по работе с компанией
+- Запросить выписку из ЕГРЮЛ перед подписанием договора
+- Работать по предоплате на первых поставках
+
+6. Потенциальные риски
+- Недавняя смена директора"""
+
+
+def test_numbered_answers_pass_without_escalation():
+    assert check_quality(FINANCE_ANSWER, FINANCE_SECTIONS) is None
+    assert check_quality(SUMMARY_ANSWER, SUMMARY_SECTIONS) is None
+    assert check_quality(COMPANY_ANSWER, COMPANY_SECTIONS) is None
+
+
+def test_answer_without_required_section_escalates():
+    answer = FINANCE_ANSWER.split("3. Возможные риски")[0].strip()
+    assert check_quality(answer, FINANCE_SECTIONS) == "missing sections: warnings"
@@ -0,0 +1,71 @@
+"""
+Tests for the incremental section extractor
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+import re
+from app.section_extractor import SectionExtractor, extract
+
+SECTIONS = [
+    ("recommendations", re.compile(r"рекомендац|совет", re.IGNORECASE)),
+    ("warnings", re.compile(r"риск|предупрежден|важно", re.IGNORECASE)),
+]
+
+
+def test_keyword_inside_bullet_stays_an_item():
+    text = "Рекомендации:\n- Снизить расходы\n- Пересмотреть рекомендации поставщиков\n- Увеличить цены"
+    assert extract(text, SECTIONS).items["recommendations"] == [
+        "Снизить расходы",
+        "Пересмотреть рекомендации поставщиков",
+        "Увеличить цены",
+    ]
+
+
+def test_bold_or_colon_bullet_still_opens_section():
+    text = "Рекомендации:\n- Снизить расходы\n- **Риски**\n- Кассовый разрыв\n- Важно:\n- Налоги"
+    items = extract(text, SECTIONS).items
+    assert items["recommendations"] == ["Снизить расходы"]
+    assert items["warnings"] == ["Кассовый разрыв", "Налоги"]
+
+
+def test_streamed_chunks_match_full_text():
+    text = "### Рекомендации\n1. Первое\n2. Второе с советом\n\nРиски:\n- Один"
+    extractor = SectionExtractor(SECTIONS)
+    for i in range(0, len(text), 3):
+        extractor.feed(text[i:i + 3])
+    extractor.close()
+    assert extractor.items == extract(text, SECTIONS).items
+    assert extractor.items["recommendations"] == ["Первое", "Второе с советом"]
+
+
+def test_numbered_headings_open_sections():
+    text = "1. Рекомендации\n- Снизить расходы\n- Увеличить цены\n2. Риски\n- Кассовый разрыв"
+    items = extract(text, SECTIONS).items
+    assert items["recommendations"] == ["Снизить расходы", "Увеличить цены"]
+    assert items["warnings"] == ["Кассовый разрыв"]
+
+
+def test_long_numbered_keyword_heading():
+    text = (
+        "1. Краткий анализ\nВыручка растёт, расходы стабильны.\n"
+        "2. Список рекомендаций по улучшению финансового состояния\n"
+        "- Снизить расходы на аренду\n- Пересмотреть рекомендации поставщиков\n"
+        "3. Укажи на возможные риски\n- Кассовый разрыв в марте"
+    )
+    items = extract(text, SECTIONS).items
+    assert items["recommendations"] == ["Снизить расходы на аренду", "Пересмотреть рекомендации поставщиков"]
+    assert items["warnings"] == ["Кассовый разрыв в марте"]
+
+
+def test_next_numbered_heading_closes_section():
+    text = "5. Рекомендации по работе с компанией\n- Запросить выписку\n6. Потенциальные угрозы\n- Долги"
+    assert extract(text, SECTIONS).items["recommendations"] == ["Запросить выписку"]
+
+
+def test_numbered_points_inside_section_stay_items():
+    text = "Рекомендации:\n1. Снизить расходы\n2. Пересмотреть рекомендации поставщиков\n3. Увеличить цены"
+    assert extract(text, SECTIONS).items["recommendations"] == [
+        "Снизить расходы",
+        "Пересмотреть рекомендации поставщиков",
+        "Увеличить цены",
+    ]
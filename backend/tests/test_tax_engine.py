@@ -0,0 +1,20 @@
+"""
+Tests for free-text parsing in the tax engine
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+from app.tax_engine import calculate, extract_revenue, extract_year
+
+
+def test_extract_year_from_question():
+    assert extract_year("Сколько налога на УСН 6% при выручке 3 млн за 2024 год?") == 2024
+    assert extract_year("Рассчитай налог в 2025 г. при доходе 2 млн") == 2025
+    assert extract_year("Рассчитай налог за 2025") == 2025
+    assert extract_year("Сколько налога при выручке 2024 тыс. руб.?") is None
+    assert extract_year("Рассчитай налог при выручке 3 млн") is None
+
+
+def test_question_year_selects_rate_table():
+    question = "Сколько налога на УСН 6% при выручке 3 млн за 2024 год?"
+    calculations = calculate([extract_revenue(question)], year=extract_year(question))
+    assert calculations["rates_version"] == 2024
@@ -0,0 +1,25 @@
+"""
+Tests for anonymization of captured LLM traffic
+Author: Погосян Артем Артурович (Pogosian Artem)
+VK: https://vk.com/iamartempn
+"""
+from app.traffic_capture import anonymize
+
+
+def test_names_parties_and_addresses_are_masked():
+    text = (
+        "Договор между ИП Иванов И.И. и ООО «Ромашка». Исполнитель: Петров Пётр Петрович, "
+        "паспорт 4510 123456, адрес: 123456, г. Москва, ул. Малая Бронная, д. 15, кв. 7. "
+        "Директор И.И. Сидорова."
+    )
+    masked = anonymize(text)
+    for secret in ("Иванов", "Ромашка", "Петров", "Пётр", "4510", "123456", "Москва", "Бронная", "15", "Сидорова"):
+        assert secret not in masked
+    assert "ИП Хххххх Х.Х." in masked
+    assert "ООО «Ххххххх»" in masked
+    assert len(masked) == len(text)
+
+
+def test_business_text_is_kept():
+    text = "Рассчитай налог в 2025 г. при доходе 2 млн, НДС НЕ ОБЛАГАЕТСЯ, аренда офиса 50 м² в Москве и т.д."
+    assert anonymize(text) == text
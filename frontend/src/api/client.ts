@@ -44,6 +44,19 @@ export interface MarketingPostRequest {
   platform: string
   target_audience?: string
   tone?: string
+  platforms?: string[]
+  parallel?: boolean
+  variants?: number
+}
+
+export interface MarketingVariant {
+  platform: string
+  index: number
+  angle: string
+  tone: string | null
+  temperature: number
+  text?: string | null
+  error?: string | null
 }
 
 export interface FinanceReportRequest {
@@ -70,9 +83,94 @@ export interface TaxConsultationRequest {
   business_type?: string
   tax_regime?: string
   revenue?: number
+  expenses?: number
+  has_employees?: boolean
+  patent_potential_income?: number
+  revenue_scenarios?: number[]
+  year?: number
   additional_context?: string
 }
 
+export interface ChatSocketDone {
+  conversation_id: number
+  answer: string
+}
+
+// Thrown when /ws/chat cannot be reached; nothing was sent, so the caller may fall back to POST
+export class ChatSocketUnavailable extends Error {}
+
+interface PendingTurn {
+  answer: string
+  onToken?: (delta: string) => void
+  resolve: (result: ChatSocketDone) => void
+  reject: (error: Error) => void
+}
+
+// One long-lived /ws/chat connection shared by all conversations; turns are matched by id
+export class ChatSocket {
+  private socket: WebSocket | null = null
+  private opening: Promise<WebSocket> | null = null
+  private turns = new Map<string, PendingTurn>()
+  private nextId = 0
+
+  private connect(): Promise<WebSocket> {
+    if (this.socket?.readyState === WebSocket.OPEN) return Promise.resolve(this.socket)
+    if (this.opening) return this.opening
+    this.opening = new Promise((resolve, reject) => {
+      const socket = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/ws/chat`)
+      socket.onopen = () => {
+        this.socket = socket
+        this.opening = null
+        resolve(socket)
+      }
+      socket.onerror = () => {
+        this.opening = null
+        reject(new ChatSocketUnavailable('Chat socket connection failed'))
+      }
+      socket.onclose = () => {
+        this.socket = null
+        this.turns.forEach((turn) => turn.reject(new Error('Chat socket closed')))
+        this.turns.clear()
+      }
+      socket.onmessage = (event) => this.handle(socket, JSON.parse(event.data))
+    })
+    return this.opening
+  }
+
+  private handle(socket: WebSocket, frame: any) {
+    if (frame.type === 'ping') {
+      socket.send('{"type":"pong"}')
+      return
+    }
+    const turn = this.turns.get(frame.id)
+    if (!turn) return
+    if (frame.type === 'token') {
+      turn.answer += frame.delta
+      turn.onToken?.(frame.delta)
+    } else if (frame.type === 'done') {
+      this.turns.delete(frame.id)
+      turn.resolve({ conversation_id: frame.conversation_id, answer: frame.message?.content ?? turn.answer })
+    } else if (frame.type === 'error') {
+      this.turns.delete(frame.id)
+      turn.reject(new Error(frame.detail))
+    }
+  }
+
+  async send(
+    request: ChatRequest,
+    onToken?: (delta: string) => void,
+  ): Promise<ChatSocketDone> {
+    const socket = await this.connect()
+    const id = String(++this.nextId)
+    return new Promise((resolve, reject) => {
+      this.turns.set(id, { answer: '', onToken, resolve, reject })
+      socket.send(JSON.stringify({ type: 'message', id, ...request }))
+    })
+  }
+}
+
+export const chatSocket = new ChatSocket()
+
 export const api = {
   chat: async (request: ChatRequest): Promise<ChatResponse> => {
     const response = await apiClient.post<ChatResponse>('/api/chat', request)
@@ -89,6 +187,35 @@ export const api = {
     return response.data
   },
   
+  marketingPostStream: async (
+    request: MarketingPostRequest,
+    onVariant: (variant: MarketingVariant) => void,
+  ) => {
+    const response = await fetch(`${API_URL}/api/usecases/marketing-post/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(request),
+    })
+    if (!response.ok || !response.body) {
+      throw new Error(`Marketing stream failed: ${response.status}`)
+    }
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop() || ''
+      for (const line of lines) {
+        if (!line.trim()) continue
+        const event = JSON.parse(line)
+        if (event.type === 'variant') onVariant(event)
+      }
+    }
+  },
+  
   financeReport: async (request: FinanceReportRequest) => {
     const response = await apiClient.post('/api/usecases/finance-report', request)
     return response.data
@@ -2,7 +2,7 @@
 // VK: https://vk.com/iamartempn
 
 import { useState, useRef, useEffect } from 'react'
-import { api, ChatRequest } from '../api/client'
+import { api, chatSocket, ChatRequest, ChatSocketUnavailable } from '../api/client'
 import './Chat.css'
 
 interface ChatProps {
@@ -53,7 +53,26 @@ const Chat = ({ mode, conversationId, onConversationChange }: ChatProps) => {
         conversation_id: conversationId,
       }
 
-      const response = await api.chat(request)
+      let streamed = false
+      const onToken = (delta: string) => {
+        if (!streamed) {
+          streamed = true
+          setMessages((prev) => [...prev, { role: 'assistant', content: '', timestamp: new Date() }])
+        }
+        setMessages((prev) => {
+          const last = prev[prev.length - 1]
+          return [...prev.slice(0, -1), { ...last, content: last.content + delta }]
+        })
+      }
+
+      // Persistent socket first; plain POST if it cannot be opened
+      let response: { conversation_id: number; answer: string }
+      try {
+        response = await chatSocket.send(request, onToken)
+      } catch (socketError) {
+        if (!(socketError instanceof ChatSocketUnavailable)) throw socketError
+        response = await api.chat(request)
+      }
       
       if (response.conversation_id && !conversationId) {
         onConversationChange(response.conversation_id)
@@ -65,9 +84,9 @@ const Chat = ({ mode, conversationId, onConversationChange }: ChatProps) => {
         timestamp: new Date(),
       }
 
-      setMessages((prev) => [...prev, assistantMessage])
+      setMessages((prev) => (streamed ? [...prev.slice(0, -1), assistantMessage] : [...prev, assistantMessage]))
     } catch (err: any) {
-      setError(err.response?.data?.detail || 'Ошибка при отправке сообщения')
+      setError(err.response?.data?.detail || err.message || 'Ошибка при отправке сообщения')
       console.error('Chat error:', err)
     } finally {
       setLoading(false)